@@ -0,0 +1,112 @@
+# Author: Rasmus Ohert
+
+# Runs on a computer (CPython), not on the Pico.
+# Converts binary sensor logs written by `Wokwi/binary_log_editor.py` to the same
+# `sep=;` CSV format that `Wokwi/csv_file_editor.py` writes.
+#
+# Usage:
+#   python bin_to_csv.py sensor_data_0001.bin [-o sensor_data_0001.csv] [--timer-decimals 0]
+
+import argparse
+import struct
+
+
+MAGIC = b'ITLG'
+SUPPORTED_VERSIONS = (1,)
+FLAG_TIMER = 0x01
+
+HEADER_FMT = '<4sBBBH'
+
+
+def read_header(f) -> dict:
+    """Reads file header.
+
+    Parameters:
+    - `f`: Binary file object, positioned at the start of the file
+
+    Returns:
+    - `dict`: `version`, `has_timer`, `channels` (list of `(name, type)`), `record_fmt` and `record_size`"""
+    magic, version, flags, ch_count, record_size = struct.unpack(HEADER_FMT, f.read(struct.calcsize(HEADER_FMT)))
+
+    if magic != MAGIC:
+        raise ValueError(f'Not a sensor log file (magic: {magic!r})')
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f'Unsupported file version: {version}')
+
+    channels = []
+    for _ in range(ch_count):
+        ch_type, name_len = struct.unpack('<cB', f.read(2))
+        name = f.read(name_len).decode('utf-8')
+        channels.append((name, ch_type.decode('ascii')))
+
+    record_fmt = '<' + ''.join(ch_type for _, ch_type in channels)
+    if struct.calcsize(record_fmt) != record_size:
+        raise ValueError(f'Record size mismatch: {struct.calcsize(record_fmt)} != {record_size}')
+
+    return {
+        'version': version,
+        'has_timer': bool(flags & FLAG_TIMER),
+        'channels': channels,
+        'record_fmt': record_fmt,
+        'record_size': record_size,
+    }
+
+
+def iter_records(f, header:dict):
+    """Yields records as tuples. Incomplete record at the end of the file is skipped.
+
+    Parameters:
+    - `f`: Binary file object, positioned after the header
+    - `header` (dict): Header returned by `read_header`"""
+    record = struct.Struct(header['record_fmt'])
+    chunk_records = 4096
+
+    while True:
+        chunk = f.read(record.size * chunk_records)
+        usable = len(chunk) - len(chunk) % record.size
+        yield from record.iter_unpack(chunk[:usable])
+
+        if len(chunk) < record.size * chunk_records:
+            return
+
+
+def convert(in_path:str, out_path:str, timer_decimals:int=0, separator:str=';') -> int:
+    """Converts binary log to CSV.
+
+    Parameters:
+    - `in_path` (str): Binary log file
+    - `out_path` (str): CSV file to write
+    - `timer_decimals` (int): Number of decimals in timer. Default: `0`
+    - `separator` (str): Separator between values. Default: `';'`
+
+    Returns:
+    - `int`: Number of converted records"""
+    rows = 0
+    with open(in_path, 'rb') as f_in, open(out_path, 'w', encoding='utf-8') as f_out:
+        header = read_header(f_in)
+        f_out.write(f'sep={separator}\n{separator.join(name for name, _ in header["channels"])}')
+
+        for record in iter_records(f_in, header):
+            values = [str(val) for val in record]
+            if header['has_timer']:
+                values[0] = f'{record[0] / 1000:.{timer_decimals}f}'
+            f_out.write(f'\n{separator.join(values)}')
+            rows += 1
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert binary sensor log to CSV')
+    parser.add_argument('in_path', help='Binary log file (e.g. sensor_data_0001.bin)')
+    parser.add_argument('-o', '--out', help='CSV file to write. Default: same name with .csv')
+    parser.add_argument('--timer-decimals', type=int, default=0, help='Number of decimals in timer. Default: 0')
+    args = parser.parse_args()
+
+    out_path = args.out or args.in_path.rsplit('.', 1)[0] + '.csv'
+    rows = convert(args.in_path, out_path, args.timer_decimals)
+    print(f'{rows} rows written to {out_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Author: Rasmus Ohert
+
+# Runs on a computer (CPython), not on the Pico.
+# Reads a time range from CSV logs using the sparse `.idx` time index written by
+# `Wokwi/csv_file_editor.py` (`index_every_n_rows`). Only the requested rows are read.
+# Time restarts from zero on every boot, so a folder is read from one run (`--run`, default: the last run).
+#
+# Usage:
+#   python log_index.py path/to/sd --from 120 --to 180 [--columns Time Vaaka] [--run 3]
+#   python log_index.py path/to/sd/sensor_data_0003.csv --from 120 --to 180
+
+import argparse
+import os
+import struct
+import sys
+
+from segment_summary    import select_segments, list_runs
+
+
+INDEX_ENTRY = struct.Struct('<II') # Time (`ticks_ms`), byte offset of the row
+TIME_ROUND_MS = 500 # Max difference of the rounded Time column from the index time (Time with 0 decimals)
+
+
+def index_path(csv_path:str) -> str:
+    """Returns path of the index file of a CSV file"""
+    return os.path.splitext(csv_path)[0] + '.idx'
+
+
+def find_offset(idx_path:str, t_ms:int) -> int:
+    """Binary searches the index file for the last entry with time < `t_ms`, so all rows
+    from `t_ms` on come after it (also when several rows have the same time).
+
+    Returns:
+    - `int`: Byte offset of the row in the CSV file; `0` if there is no index or suitable entry"""
+    if not os.path.exists(idx_path):
+        return 0
+
+    offset = 0
+    with open(idx_path, 'rb') as f:
+        lo = 0
+        hi = os.path.getsize(idx_path) // INDEX_ENTRY.size - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * INDEX_ENTRY.size)
+            entry_t, entry_offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+            if entry_t < t_ms:
+                offset = entry_offset
+                lo = mid + 1
+            else:
+                hi = mid - 1
+
+    return offset
+
+
+def read_headers(csv_path:str, separator:str=';') -> list:
+    """Reads header line of a CSV file (line after `sep=`)"""
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        line = f.readline().strip()
+        if line.startswith('sep='):
+            line = f.readline().strip()
+    return line.split(separator)
+
+
+def read_range(csv_path:str, t_start:float, t_end:float, columns:list|None=None, separator:str=';'):
+    """Yields rows with `t_start` <= Time <= `t_end`.
+
+    Parameters:
+    - `csv_path` (str): CSV file
+    - `t_start` (float): Start time (in seconds)
+    - `t_end` (float): End time (in seconds)
+    - `columns` (list[str] | None): Names of columns to return; `None` for all. Default: `None`
+    - `separator` (str): Separator between values. Default: `';'`
+
+    Yields:
+    - `list[str]`: Values of the requested columns"""
+    headers = read_headers(csv_path, separator)
+    col_idxs = [headers.index(col) for col in columns] if columns else list(range(len(headers)))
+
+    with open(csv_path, 'rb') as f:
+        f.seek(find_offset(index_path(csv_path), int(t_start * 1000) - TIME_ROUND_MS)) # Rows rounded up to `t_start` are included
+        for line in f:
+            line = line.decode('utf-8').strip()
+            if not line or line.startswith('#'):
+                continue
+
+            values = line.split(separator)
+            try:
+                t = float(values[0])
+            except ValueError: # Header lines, when there is no index
+                continue
+
+            if t < t_start:
+                continue
+            if t > t_end:
+                return
+            yield [values[i] if i < len(values) else '' for i in col_idxs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read a time range from sensor logs using the time index')
+    parser.add_argument('path', help='CSV file or folder with segments')
+    parser.add_argument('--from', dest='t_from', type=float, required=True, help='Start time (s)')
+    parser.add_argument('--to', dest='t_to', type=float, required=True, help='End time (s)')
+    parser.add_argument('--columns', nargs='+', help='Columns to print. Default: all')
+    parser.add_argument('--run', type=int, help='Run to read from a folder. Default: the last run')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        runs = list_runs(args.path)
+        run = args.run if args.run is not None else (runs[-1] if runs else None)
+        paths = [path for path, _ in select_segments(args.path, args.t_from, args.t_to, run)]
+    else:
+        paths = [args.path]
+
+    if not paths:
+        return
+
+    print(';'.join(args.columns or read_headers(paths[0])))
+    for path in paths:
+        for row in read_range(path, args.t_from, args.t_to, args.columns):
+            sys.stdout.write(';'.join(row) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Author: Rasmus Ohert
+
+# Runs on a computer (CPython), not on the Pico.
+# Lists CSV log segments written by `Wokwi/rotating_csv_file_editor.py` using only their
+# summary footers, so rows of the segments are not read.
+#
+# Time restarts from zero on every boot of the Pico, so time ranges only apply within one run
+# (`#run` line of the segments).
+#
+# Usage:
+#   python segment_summary.py path/to/sd [--from 120] [--to 3600] [--run 3]
+
+import argparse
+import os
+import re
+
+
+SEGMENT_RE = re.compile(r'^(?P<name>.+)_(?P<num>\d{4,})\.csv$')
+TAIL_SIZE = 4096 # Footer is always in the last few lines of a segment
+
+
+def read_footer(path:str, separator:str=';') -> dict | None:
+    """Reads summary footer of a segment.
+
+    Parameters:
+    - `path` (str): Segment file
+    - `separator` (str): Separator between values. Default: `';'`
+
+    Returns:
+    - `dict` with `run`, `rows`, `first`, `last`, `min` and `max`; `None` if the segment has no footer (e.g. power was lost)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - TAIL_SIZE, 0))
+        tail = f.read().decode('utf-8', errors='replace')
+
+    footer = {}
+    for line in tail.splitlines():
+        if not line.startswith('#'):
+            continue
+        key, _, values = line[1:].partition(separator)
+        footer[key] = values.split(separator)
+
+    if 'rows' not in footer:
+        return None
+
+    to_num = lambda val: float(val) if val else None
+    return {
+        'run': int(footer['run'][0]) if 'run' in footer else None,
+        'rows': int(footer['rows'][0]),
+        'first': to_num(footer['first'][0]),
+        'last': to_num(footer['last'][0]),
+        'min': [to_num(val) for val in footer.get('min', [])],
+        'max': [to_num(val) for val in footer.get('max', [])],
+    }
+
+
+def read_headers(path:str, separator:str=';') -> list:
+    """Reads header line of a segment (line after `sep=`)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        line = f.readline().strip()
+        if line.startswith('sep='):
+            line = f.readline().strip()
+    return line.split(separator)
+
+
+def read_run(path:str, separator:str=';') -> int | None:
+    """Reads run id of a segment (`#run` line after the headers); `None` for segments written before run ids"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for _ in range(3):
+            line = f.readline()
+            if line.startswith('#run' + separator):
+                return int(line.strip().split(separator)[1])
+    return None
+
+
+def list_runs(folder:str) -> list:
+    """Returns run ids of the segments in the folder, sorted"""
+    return sorted({run for run in (read_run(path) for path in list_segments(folder)) if run is not None})
+
+
+def list_segments(folder:str) -> list:
+    """Returns paths of all segments in the folder, sorted by segment number"""
+    segments = []
+    for name in os.listdir(folder):
+        match = SEGMENT_RE.match(name)
+        if match:
+            segments.append((match['name'], int(match['num']), os.path.join(folder, name)))
+    return [path for _, _, path in sorted(segments)]
+
+
+def select_segments(folder:str, t_from:float|None=None, t_to:float|None=None, run:int|None=None) -> list:
+    """Returns `(path, footer)` pairs of segments that overlap the given time range.
+    Segments without footer are always included, as their time range is unknown.
+
+    Parameters:
+    - `folder` (str): Folder with segments
+    - `t_from` (float | None): Start of the time range (in seconds). Default: `None`
+    - `t_to` (float | None): End of the time range (in seconds). Default: `None`
+    - `run` (int | None): Only segments of this run; `None` for all runs. Times of different runs are not comparable. Default: `None`"""
+    selected = []
+    for path in list_segments(folder):
+        if run is not None and read_run(path) != run:
+            continue
+        footer = read_footer(path)
+        if footer is not None and footer['first'] is not None:
+            if t_from is not None and footer['last'] < t_from:
+                continue
+            if t_to is not None and footer['first'] > t_to:
+                continue
+        selected.append((path, footer))
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List sensor log segments using their summary footers')
+    parser.add_argument('folder', help='Folder with segments (e.g. copy of the SD card)')
+    parser.add_argument('--from', dest='t_from', type=float, help='Only segments that end after this time (s)')
+    parser.add_argument('--to', dest='t_to', type=float, help='Only segments that start before this time (s)')
+    parser.add_argument('--run', type=int, help='Only segments of this run. Default: all runs')
+    args = parser.parse_args()
+
+    for path, footer in select_segments(args.folder, args.t_from, args.t_to, args.run):
+        run = read_run(path)
+        if footer is None:
+            print(f'{path}: run {run}, no summary (segment was not closed)')
+            continue
+
+        print(f'{path}: run {run}, {footer["rows"]} rows, {footer["first"]} s - {footer["last"]} s')
+        for header, _min, _max in zip(read_headers(path), footer['min'], footer['max']):
+            if _min is not None:
+                print(f'    {header}: {_min} - {_max}')
+
+
+if __name__ == '__main__':
+    main()
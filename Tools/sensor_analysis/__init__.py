@@ -0,0 +1,16 @@
+# Author: Rasmus Ohert
+
+"""Host-side (CPython + NumPy) analysis of sensor logs copied from the SD card.
+
+Example:
+
+    from sensor_analysis import load_log, load_events, cycle_metrics
+
+    log = load_log('path/to/sd')
+    metrics = cycle_metrics(log, load_events('path/to/sd'))
+    print(metrics['cycle_time'].mean())
+
+Command line: `python -m sensor_analysis path/to/sd -o cycles.csv`"""
+
+from .loader    import load_log, load_events, find_logs, select_run, select_run_events
+from .metrics   import cycle_metrics, find_cycles, travel_times, weighings, vibration_rms, ir_edges
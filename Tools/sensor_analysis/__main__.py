@@ -0,0 +1,46 @@
+# Author: Rasmus Ohert
+
+# Usage (in the Tools folder):
+#   python -m sensor_analysis path/to/sd [-o cycles.csv] [--no-events]
+
+import argparse
+import time
+
+import numpy as np
+
+from .loader    import load_log, load_events, find_logs
+from .metrics   import cycle_metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-cycle metrics of sensor logs')
+    parser.add_argument('paths', nargs='+', help='Folder with sensor_data*.csv files, or CSV files')
+    parser.add_argument('-o', '--out', help='Write per-cycle metrics to this CSV file')
+    parser.add_argument('--no-events', action='store_true', help='Do not use event logs for IR edges')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = args.paths[0] if len(args.paths) == 1 else args.paths
+    log = load_log(paths)
+
+    events = None
+    if not args.no_events and isinstance(paths, str) and find_logs(paths, 'events'):
+        events = load_events(paths)
+
+    metrics = cycle_metrics(log, events)
+    took = time.perf_counter() - start
+
+    print(f'{len(log.get("Time", []))} rows, {len(metrics["cycle_start"])} cycles in {len(np.unique(metrics["run"]))} runs ({took:.2f} s)')
+    for name, values in metrics.items():
+        if name in ('run', 'cycle_start') or not len(values):
+            continue
+        print(f'{name:>15}: mean {np.nanmean(values):10.3f}   min {np.nanmin(values):10.3f}   max {np.nanmax(values):10.3f}')
+
+    if args.out:
+        names = list(metrics)
+        np.savetxt(args.out, np.column_stack([metrics[name] for name in names]), delimiter=';', header=';'.join(names), comments='', fmt='%.6g')
+        print(f'Written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+# Author: Rasmus Ohert
+
+"""Loads sensor logs written by `Wokwi/csv_file_editor.py` into NumPy arrays.
+
+Time is `ticks_ms` since boot, so it restarts from zero on every boot of the Pico. Every row gets
+the run id of its segment (`#run` line, see `Wokwi/rotating_csv_file_editor.py`); use `select_run`
+before searching by time."""
+
+import glob
+import itertools
+import os
+
+import numpy as np
+
+
+# Raw accelerometer values are written as `[x, y, z]`; these are turned into separate columns
+_CLEAN_LIST = str.maketrans({'[': None, ']': None, ' ': None, ',': ';'})
+
+
+def _read_header(f, separator:str) -> list:
+    """Reads `sep=` and header lines; returns header names"""
+    line = f.readline().strip()
+    if line.startswith('sep='):
+        line = f.readline().strip()
+    return line.split(separator)
+
+
+def _expand_headers(headers:list, first_row:str, separator:str) -> tuple[list, bool]:
+    """Expands headers of list columns (`[x, y, z]`) to one column per value.
+
+    Returns:
+    - `tuple[list, bool]`: New headers and whether rows need cleaning"""
+    if '[' not in first_row:
+        return headers, False
+
+    expanded = []
+    for header, value in zip(headers, first_row.strip().split(separator)):
+        if value.startswith('['):
+            count = value.count(',') + 1
+            expanded += [f'{header} {axis}' for axis in 'xyz'[:count]] if count <= 3 else [f'{header} {i}' for i in range(count)]
+        else:
+            expanded.append(header)
+    return expanded, True
+
+
+def _load_one(path:str, chunk_rows:int, separator:str) -> tuple[list, np.ndarray, int | None]:
+    """Loads one CSV file in chunks of `chunk_rows` lines; returns headers, data and run id (`None` if the file has none)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        headers = _read_header(f, separator)
+
+        # Run id line and first data row; first data row tells if list columns need expanding
+        run = None
+        first = []
+        for line in f:
+            if line.startswith('#run' + separator):
+                run = int(line.strip().split(separator)[1])
+            elif line.strip() and not line.startswith('#'):
+                first = [line]
+                break
+        if not first:
+            return headers, np.empty((0, len(headers))), run
+        headers, clean = _expand_headers(headers, first[0], separator)
+
+        chunks = []
+        lines = first + list(itertools.islice(f, chunk_rows - 1))
+        while lines:
+            lines = [line for line in lines if line.strip() and not line.startswith('#')] # Segment footers
+            if clean:
+                lines = [line.translate(_CLEAN_LIST) for line in lines]
+            if lines:
+                chunks.append(np.loadtxt(lines, delimiter=separator, ndmin=2, dtype=np.float64))
+            lines = list(itertools.islice(f, chunk_rows))
+
+    if not chunks:
+        return headers, np.empty((0, len(headers))), run
+    return headers, np.concatenate(chunks), run
+
+
+def _segment_runs(runs:list, times:list) -> list:
+    """Returns run id of every segment. Segments written before run ids get the run of the previous
+    segment, or the next run if their time goes back (the Pico was rebooted).
+
+    Parameters:
+    - `runs` (list[int | None]): Run ids read from the segments
+    - `times` (list[np.ndarray]): Times of the segments, in segment order"""
+    out = []
+    prev_t = None
+    for run, t in zip(runs, times):
+        if run is None:
+            rebooted = prev_t is not None and len(t) and t[0] < prev_t
+            run = 1 if not out else out[-1] + (1 if rebooted else 0)
+        out.append(run)
+        if len(t):
+            prev_t = t[-1]
+    return out
+
+
+def select_run(log:dict, run) -> dict:
+    """Returns rows of one run, sorted by time
+
+    Parameters:
+    - `log` (dict): Log returned by `load_log`
+    - `run` (int): Run id (see the `Run` column)"""
+    rows = np.flatnonzero(log['Run'] == run)
+    if 'Time' in log:
+        rows = rows[np.argsort(log['Time'][rows], kind='stable')]
+    return {name: values[rows] for name, values in log.items()}
+
+
+def select_run_events(events:dict | None, run) -> dict | None:
+    """Returns events of one run as channel -> (times, values), sorted by time. Channels without events in the run are left out.
+
+    Parameters:
+    - `events` (dict | None): Events returned by `load_events`
+    - `run` (int): Run id"""
+    if events is None:
+        return None
+    out = {}
+    for name, (times, values, runs) in events.items():
+        rows = np.flatnonzero(runs == run)
+        if not len(rows):
+            continue
+        rows = rows[np.argsort(times[rows], kind='stable')]
+        out[name] = (times[rows], values[rows])
+    return out
+
+
+def find_logs(folder:str, prefix:str='sensor_data') -> list:
+    """Returns log files (segments) in the folder, sorted by name
+
+    Parameters:
+    - `folder` (str): Folder, e.g. a copy of the SD card
+    - `prefix` (str): Start of the file names. Default: `'sensor_data'`"""
+    return sorted(glob.glob(os.path.join(folder, f'{prefix}*.csv')))
+
+
+def load_log(paths, chunk_rows:int=100000, separator:str=';') -> dict:
+    """Loads one or more CSV logs (e.g. all segments of a run) into arrays.
+
+    Parameters:
+    - `paths` (str | list[str]): CSV file, list of files, or a folder with `sensor_data*.csv` files
+    - `chunk_rows` (int): Number of lines parsed at a time. Default: `100000`
+    - `separator` (str): Separator between values. Default: `';'`
+
+    Returns:
+    - `dict[str, np.ndarray]`: Column name -> values (`float64`), and `Run` (run id of every row). Segments are joined in the given order;
+      time is only increasing within one run (see `select_run`)"""
+    if isinstance(paths, str):
+        paths = find_logs(paths) if os.path.isdir(paths) else [paths]
+
+    headers = None
+    parts = []
+    runs = []
+    for path in paths:
+        _headers, data, run = _load_one(path, chunk_rows, separator)
+        if headers is None:
+            headers = _headers
+        elif _headers != headers:
+            raise ValueError(f'Headers of {path} do not match the first file')
+        parts.append(data)
+        runs.append(run)
+
+    if headers is None:
+        return {}
+
+    t_col = headers.index('Time') if 'Time' in headers else None
+    runs = _segment_runs(runs, [data[:, t_col] if t_col is not None else np.empty(0) for data in parts])
+
+    data = np.concatenate(parts) if parts else np.empty((0, len(headers)))
+    log = {header: data[:, i] for i, header in enumerate(headers)}
+    log['Run'] = np.repeat(np.asarray(runs, dtype=np.int64), [len(part) for part in parts])
+    return log
+
+
+def load_events(paths, separator:str=';') -> dict:
+    """Loads event logs written by `Wokwi/event_logger.py`.
+
+    Parameters:
+    - `paths` (str | list[str]): CSV file, list of files, or a folder with `events*.csv` files
+    - `separator` (str): Separator between values. Default: `';'`
+
+    Returns:
+    - `dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]`: Channel name -> (times, values, run ids); see `select_run_events`"""
+    if isinstance(paths, str):
+        paths = find_logs(paths, 'events') if os.path.isdir(paths) else [paths]
+
+    times, channels, values = [], [], []
+    seg_runs, seg_times = [], []
+    for path in paths:
+        run = None
+        start = len(times)
+        with open(path, 'r', encoding='utf-8') as f:
+            _read_header(f, separator)
+            for line in f:
+                if line.startswith('#run' + separator):
+                    run = int(line.strip().split(separator)[1])
+                if not line.strip() or line.startswith('#'):
+                    continue
+                t, channel, value = line.rstrip('\n').split(separator)
+                times.append(t)
+                channels.append(channel)
+                values.append(value)
+        seg_runs.append(run)
+        seg_times.append(np.asarray(times[start:], dtype=np.float64))
+
+    seg_runs = _segment_runs(seg_runs, seg_times)
+    runs = np.repeat(np.asarray(seg_runs, dtype=np.int64), [len(t) for t in seg_times])
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.int64)
+    channels = np.asarray(channels)
+    return {name: (times[channels == name], values[channels == name], runs[channels == name]) for name in np.unique(channels)}
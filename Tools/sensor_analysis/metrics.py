@@ -0,0 +1,201 @@
+# Author: Rasmus Ohert
+
+"""Per-cycle metrics of the test sequence. All calculations are vectorised; there are no loops over rows.
+
+The sequence starts at A1, weighs in the middle (A2 and B2 blocked), moves to B1, weighs in the
+middle again and returns to A1. A cycle is the time between two arrivals at A1.
+IR sensors read `0` when blocked (see `Wokwi/ir_sensor.py`).
+
+Time restarts from zero on every boot, so `cycle_metrics` handles every run separately; the other
+functions expect the rows of one run (see `select_run`)."""
+
+import numpy as np
+
+from .loader    import select_run, select_run_events
+
+
+IR_A1 = 'Anturi a1'
+IR_A2 = 'Anturi a2'
+IR_B1 = 'Anturi b1'
+IR_B2 = 'Anturi b2'
+FORCE = 'Vaaka'
+VIBRATION = 'Värinä anturi'
+
+
+def column(log:dict, name:str, suffixes:tuple=('', ' mean')) -> np.ndarray:
+    """Returns column of a raw or aggregated log (e.g. `'Vaaka'` or `'Vaaka mean'`)
+
+    Parameters:
+    - `log` (dict): Log returned by `load_log`
+    - `name` (str): Channel name
+    - `suffixes` (tuple[str]): Column name suffixes to try, in order. Default: `('', ' mean')`"""
+    for suffix in suffixes:
+        if name + suffix in log:
+            return log[name + suffix]
+    raise KeyError(f'Column not found: {name}')
+
+
+def ir_edges(t:np.ndarray, values:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns times when an IR sensor becomes blocked (arrivals) and unblocked (departures)
+
+    Parameters:
+    - `t` (np.ndarray): Times
+    - `values` (np.ndarray): Raw IR values (`0` = blocked)"""
+    d = np.diff((values == 0).astype(np.int8))
+    return t[np.flatnonzero(d == 1) + 1], t[np.flatnonzero(d == -1) + 1]
+
+
+def _edges(log:dict, events:dict|None, name:str) -> tuple[np.ndarray, np.ndarray]:
+    """IR edges from the event log if available (exact times), else from the sensor log"""
+    if events and name in events:
+        return ir_edges(events[name][0], events[name][1])
+    return ir_edges(log['Time'], column(log, name, ('',)))
+
+
+def _next_after(times:np.ndarray, after:np.ndarray) -> np.ndarray:
+    """Returns the first of sorted `times` after each value of `after`; `NaN` if there is none"""
+    idx = np.searchsorted(times, after, side='right')
+    out = np.full(len(after), np.nan)
+    ok = (idx < len(times)) & ~np.isnan(after)
+    out[ok] = times[idx[ok]]
+    return out
+
+
+def _range_sums(values:np.ndarray, starts:np.ndarray, ends:np.ndarray) -> np.ndarray:
+    """Sums of `values[start:end]` for every range (ranges must not be empty)"""
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    return csum[ends] - csum[starts]
+
+
+def find_cycles(log:dict, events:dict|None=None) -> tuple[np.ndarray, np.ndarray]:
+    """Returns start and end times of full cycles (A1 arrival to next A1 arrival)"""
+    a1_arrive, _ = _edges(log, events, IR_A1)
+    return a1_arrive[:-1], a1_arrive[1:]
+
+
+def travel_times(log:dict, cycle_start:np.ndarray, cycle_end:np.ndarray, events:dict|None=None) -> tuple[np.ndarray, np.ndarray]:
+    """Returns travel times A1 -> B1 and B1 -> A1 of each cycle; `NaN` if not found in the cycle"""
+    _, a1_depart = _edges(log, events, IR_A1)
+    b1_arrive, b1_depart = _edges(log, events, IR_B1)
+
+    depart_a = _next_after(a1_depart, cycle_start)
+    arrive_b = _next_after(b1_arrive, depart_a)
+    depart_b = _next_after(b1_depart, arrive_b)
+
+    a_to_b = arrive_b - depart_a
+    b_to_a = cycle_end - depart_b
+    a_to_b[~(arrive_b < cycle_end)] = np.nan
+    b_to_a[~(depart_b < cycle_end)] = np.nan
+    return a_to_b, b_to_a
+
+
+def weighings(log:dict) -> dict:
+    """Finds weighing states (product in the middle: A2 and B2 blocked)
+
+    Returns:
+    - `dict[str, np.ndarray]`: `start`, `end` (times), `weight_max` and `weight_mean` of each weighing"""
+    t = log['Time']
+    middle = (column(log, IR_A2, ('',)) == 0) & (column(log, IR_B2, ('',)) == 0)
+    d = np.diff(np.concatenate(([0], middle.astype(np.int8), [0])))
+    starts = np.flatnonzero(d == 1)
+    ends = np.flatnonzero(d == -1) # Exclusive
+
+    force_max = column(log, FORCE, ('', ' max'))
+    force_mean = column(log, FORCE, ('', ' mean'))
+
+    # `reduceat` over interleaved (start, end) indices; every other result is a weighing
+    if len(starts):
+        padded = np.append(force_max, -np.inf)
+        weight_max = np.maximum.reduceat(padded, np.column_stack((starts, ends)).ravel())[::2]
+    else:
+        weight_max = np.empty(0)
+
+    return {
+        'start': t[starts],
+        'end': t[ends - 1],
+        'weight_max': weight_max,
+        'weight_mean': _range_sums(force_mean, starts, ends) / (ends - starts),
+    }
+
+
+def vibration_rms(log:dict, starts:np.ndarray, ends:np.ndarray) -> np.ndarray:
+    """Returns vibration RMS (all axes, mean removed) for each row range `[start, end)`"""
+    n = np.maximum(ends - starts, 1)
+
+    # Aggregated logs have RMS of every window; combine as root of mean square
+    rms_axes = [name for name in log if name.startswith(VIBRATION) and name.endswith(' rms')]
+    if rms_axes:
+        mean_sq = np.zeros(len(starts))
+        for name in rms_axes:
+            mean_sq += _range_sums(log[name] * log[name], starts, ends) / n
+        return np.sqrt(mean_sq)
+
+    axes = [name for name in log if name.startswith(VIBRATION) and not name.endswith((' min', ' max'))]
+    var = np.zeros(len(starts))
+    for name in axes:
+        values = log[name]
+        mean = _range_sums(values, starts, ends) / n
+        var += np.maximum(_range_sums(values * values, starts, ends) / n - mean * mean, 0)
+    return np.sqrt(var)
+
+
+def cycle_metrics(log:dict, events:dict|None=None) -> dict:
+    """Calculates metrics for every full cycle. Every run (boot) is calculated separately, as time restarts from zero on every boot.
+
+    Parameters:
+    - `log` (dict): Log returned by `load_log`
+    - `events` (dict | None): Events returned by `load_events`; gives exact IR edge times. Default: `None`
+
+    Returns:
+    - `dict[str, np.ndarray]`: `run`, `cycle_start`, `cycle_time`, `travel_a_to_b`, `travel_b_to_a`, `weight_1`, `weight_2` and `vibration_rms`"""
+    if 'Run' not in log: # One run
+        log = dict(log, Run=np.zeros(len(log['Time']), dtype=np.int64))
+        if events:
+            events = {name: (ch[0], ch[1], np.zeros(len(ch[0]), dtype=np.int64)) for name, ch in events.items()}
+
+    runs = np.unique(log['Run'])
+    parts = []
+    for run in runs:
+        part = _run_cycle_metrics(select_run(log, run), select_run_events(events, run))
+        parts.append({'run': np.full(len(part['cycle_start']), run), **part})
+
+    if not parts:
+        return {'run': np.empty(0, dtype=np.int64), **_run_cycle_metrics(log, None)}
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def _run_cycle_metrics(log:dict, events:dict|None) -> dict:
+    """Calculates metrics for every full cycle of one run (see `cycle_metrics`)"""
+    t = log['Time']
+    cycle_start, cycle_end = find_cycles(log, events)
+    a_to_b, b_to_a = travel_times(log, cycle_start, cycle_end, events)
+
+    # Assign weighings to cycles; first and second weighing of each cycle
+    w = weighings(log)
+    cycle_idx = np.searchsorted(cycle_start, w['start'], side='right') - 1
+    valid = cycle_idx >= 0
+    valid[valid] = w['start'][valid] < cycle_end[cycle_idx[valid]]
+    cycle_idx = cycle_idx[valid]
+    weight = w['weight_max'][valid]
+
+    _, first, inverse = np.unique(cycle_idx, return_index=True, return_inverse=True)
+    rank = np.arange(len(cycle_idx)) - first[inverse]
+
+    weight_1 = np.full(len(cycle_start), np.nan)
+    weight_2 = np.full(len(cycle_start), np.nan)
+    weight_1[cycle_idx[rank == 0]] = weight[rank == 0]
+    weight_2[cycle_idx[rank == 1]] = weight[rank == 1]
+
+    # Row ranges of cycles for vibration
+    start_rows = np.searchsorted(t, cycle_start)
+    end_rows = np.searchsorted(t, cycle_end)
+
+    return {
+        'cycle_start': cycle_start,
+        'cycle_time': cycle_end - cycle_start,
+        'travel_a_to_b': a_to_b,
+        'travel_b_to_a': b_to_a,
+        'weight_1': weight_1,
+        'weight_2': weight_2,
+        'vibration_rms': vibration_rms(log, start_rows, end_rows),
+    }
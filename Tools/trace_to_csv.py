@@ -0,0 +1,72 @@
+# Author: Rasmus Ohert
+
+# Runs on a computer (CPython), not on the Pico.
+# Converts binary traces written by `TraceSink.dump` (`Wokwi/logger.py`) to CSV.
+# Time is in microseconds from the first record; `ticks_us` wraparound (2^30) is handled.
+#
+# Usage:
+#   python trace_to_csv.py trace.bin [-o trace.csv]
+
+import argparse
+import struct
+
+
+MAGIC = b'ITTR'
+SUPPORTED_VERSIONS = (1,)
+TICKS_PERIOD = 1 << 30 # MicroPython `ticks_us` wraps around at this value
+
+RECORD = struct.Struct('<IHi')
+
+
+def read_trace(path:str) -> tuple[list, list]:
+    """Reads a trace file
+
+    Parameters:
+    - `path` (str): Trace file
+
+    Returns:
+    - `tuple[list, list]`: Event names, and records as `(time_us, event_id, value)`; time from the first record"""
+    with open(path, 'rb') as f:
+        magic, version, name_count = struct.unpack('<4sBH', f.read(7))
+        if magic != MAGIC:
+            raise ValueError(f'Not a trace file (magic: {magic!r})')
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f'Unsupported file version: {version}')
+
+        names = []
+        for _ in range(name_count):
+            name_len = f.read(1)[0]
+            names.append(f.read(name_len).decode('utf-8'))
+
+        count = struct.unpack('<I', f.read(4))[0]
+        data = f.read(count * RECORD.size)
+
+    records = []
+    elapsed = 0
+    last = None
+    for ticks, event_id, value in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+        if last is not None:
+            elapsed += (ticks - last) % TICKS_PERIOD
+        last = ticks
+        records.append((elapsed, event_id, value))
+    return names, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert binary trace to CSV')
+    parser.add_argument('in_path', help='Trace file (e.g. trace.bin)')
+    parser.add_argument('-o', '--out', help='CSV file to write. Default: same name with .csv')
+    args = parser.parse_args()
+
+    names, records = read_trace(args.in_path)
+    out_path = args.out or args.in_path.rsplit('.', 1)[0] + '.csv'
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('sep=;\nTime us;Event;Value')
+        for time_us, event_id, value in records:
+            name = names[event_id] if event_id < len(names) else str(event_id)
+            f.write(f'\n{time_us};{name};{value}')
+    print(f'{len(records)} records written to {out_path}')
+
+
+if __name__ == '__main__':
+    main()
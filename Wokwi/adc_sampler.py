@@ -0,0 +1,112 @@
+# Author: Rasmus Ohert
+
+from array  import array
+from base import Base
+from machine    import Timer # type:ignore
+
+
+class ADCSampler(Base):
+    """Reads ADC pins at a fixed rate with `machine.Timer` into preallocated ring buffers.
+
+    Sampling does not depend on the main loop, so it keeps going while the machine
+    is moving or weighing. The main loop empties the buffers with `drain`.
+    The timer callback does not allocate memory.
+
+    The timer callback is a soft callback that can run between any two bytecodes of `drain`, so
+    the sides do not share a counter: only the callback writes `_head` and only `drain` writes
+    `_tail`. No interrupts are disabled. One slot is kept free to tell a full buffer from an empty one."""
+    def __init__(self, adcs:list, rate_hz:int=100, capacity:int=1024, name:str='ADC sampler', debug_print:bool=False):
+        """Initializes ADCSampler. Call `start()` to start sampling.
+
+        Parameters:
+        - `adcs` (list[ADC | None]): ADC objects to read; `None` reads as `0`
+        - `rate_hz` (int): Samples per second. Default: `100`
+        - `capacity` (int): Buffer slots per channel (`capacity - 1` samples can wait); new samples are dropped and counted in `overflows` if `drain` is not called in time. Default: `1024`
+        - `name` (str): Name of class instance. Default: 'ADC sampler'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        self._adcs = list(adcs)
+        self._n = len(self._adcs)
+        self._rate_hz = rate_hz
+        self._capacity = capacity
+        self._bufs = [array('H', bytes(2 * capacity)) for _ in range(self._n)]
+        self._row = [0] * self._n # Reused by `drain`
+
+        self._head = 0 # Next write position; written only by `_sample`
+        self._tail = 0 # Next read position; written only by `drain`
+        self.overflows = 0 # Samples lost because the buffer was full
+
+        self._timer = Timer(-1)
+        self._sample_cb = self._sample # Bound once; creating it in the callback would allocate
+
+
+    def start(self):
+        """Starts sampling"""
+        self._timer.init(freq=self._rate_hz, mode=Timer.PERIODIC, callback=self._sample_cb)
+        self.log.debug('Sampling {} channels at {} Hz', self._n, self._rate_hz)
+
+
+    def stop(self):
+        """Stops sampling"""
+        self._timer.deinit()
+        self.log.debug('Stopped')
+
+
+    def _sample(self, timer):
+        """Timer callback; reads all channels to the ring buffers. Drops the sample if the buffers are full."""
+        head = self._head
+        next_head = head + 1
+        if next_head == self._capacity:
+            next_head = 0
+        if next_head == self._tail: # Full; the slot at `head` may not be drained yet
+            self.overflows += 1
+            return
+
+        for i in range(self._n):
+            adc = self._adcs[i]
+            self._bufs[i][head] = adc.read_u16() if adc is not None else 0
+        self._head = next_head # Published after the slot is written
+
+
+    def pending(self) -> int:
+        """Returns number of samples waiting in the buffers"""
+        count = self._head - self._tail
+        if count < 0:
+            count += self._capacity
+        return count
+
+
+    def latest(self, channel:int) -> int:
+        """Returns the newest sample of a channel
+
+        Parameters:
+        - `channel` (int): Index of the channel (order of `adcs`)"""
+        return self._bufs[channel][self._head - 1] # Index -1 is the last item when head is 0
+
+
+    def drain(self, func) -> int:
+        """Calls `func(row)` for every waiting sample, oldest first.
+        `row` is the same list on every call; copy it if it needs to be kept.
+
+        Parameters:
+        - `func` (callable): Function that takes a list with one value per channel
+
+        Returns:
+        - `int`: Number of drained samples"""
+        head = self._head # Samples taken after this are drained on the next call
+        i = self._tail
+        row = self._row
+        bufs = self._bufs
+        count = 0
+        while i != head:
+            for ch in range(self._n):
+                row[ch] = bufs[ch][i]
+            i += 1
+            if i == self._capacity:
+                i = 0
+            self._tail = i # Slot is free for `_sample`
+            func(row)
+            count += 1
+
+        return count
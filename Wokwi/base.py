@@ -1,5 +1,8 @@
 # Author: Rasmus Ohert
 
+from logger import Logger, DEBUG, WARNING
+
+
 class Base:
     """Base class for other classes. Contains basic functions and variables."""
     def __init__(self, name:str, debug_print:bool=False, decimal_len:int=2, simple_read:bool=False, simple_max_val:int=100, analog_pin_max_val:int=65535) -> None:
@@ -7,12 +10,13 @@ class Base:
         
         Parameters:
         - `name` (str): Name of class
-        - `debug_print` (bool): If `True`, print debug info; if `False`, do not print. Default: `False`
-        - `simple_max_val` (int): Max value for simple_read. Default: `100`
+        - `debug_print` (bool): If `True`, print debug info (`self.log` level `DEBUG`); if `False`, only warnings and errors. Default: `False`
+        - `simple_max_val` (int): Max value for simple_read; simple values are integers. Default: `100`
         - `analog_pin_max_val` (int): Max value for analog pin read. Default: `65535`"""
 
         # Setup class variables
         self.name = name
+        self.log = Logger(name)
         self.debug_print = debug_print
 
         # Setup for analog pins
@@ -20,11 +24,25 @@ class Base:
         self.simple_read = simple_read
         self.simple_max_val = simple_max_val
         self.analog_pin_max_val = analog_pin_max_val
+        self._update_simple_scale()
+        self.calibration = None # Calibration table (see `set_calibration`)
+
+
+    @property
+    def debug_print(self) -> bool:
+        """`True` if debug messages are printed"""
+        return self.log.level <= DEBUG
+
+
+    @debug_print.setter
+    def debug_print(self, value:bool):
+        self.log.set_level(DEBUG if value else WARNING)
 
 
     def pprint(self, *texts, do_print:bool=True) -> None:
         """Print info.
-        Mainly used for debugging.
+        Mainly used for debugging. Texts are built before the call even if they are not printed;
+        use `self.log.debug` (lazy formatting) in new code.
         
         Parameters:
         - `texts`: Texts to print; can be multiple
@@ -52,7 +70,7 @@ class Base:
         
         Parameters:
         - `raise_as`: Error to raise"""
-        self.pprint(text)
+        self.log.error('{}', text)
         raise raise_as(text)
 
 
@@ -64,17 +82,33 @@ class Base:
         return self.name
 
 
+    def set_calibration(self, calibration):
+        """Sets calibration of analog values. Calibrated values are integers (e.g. grams).
+        
+        Parameters:
+        - `calibration` (Calibration | None): Calibration table; `None` returns raw values again"""
+        self.calibration = calibration
+
+
+    def _update_simple_scale(self):
+        """Precomputes scale of `simple_read` as a Q16 integer, so reads need no division or floats"""
+        self._simple_scale = (self.simple_max_val << 16) // self.analog_pin_max_val
+
+
     def _format_analog_value(self, val):
-        """Formats analog value to simplified value if `simple_read` is `True`.
-        Else returns `val` unchanged.
+        """Converts analog value with the calibration table if it is set (see `set_calibration`).
+        Else scales it to an integer between `0` and `simple_max_val` if `simple_read` is `True`,
+        or returns `val` unchanged.
         
         Parameters:
         - `val`: Value to format
         
         Returns:
         - `val` (int/float): Formatted value"""
+        if self.calibration is not None:
+            return self.calibration.convert(val)
         if self.simple_read:
-            return round(val / self.analog_pin_max_val * self.simple_max_val, self.decimal_len)
+            return (val * self._simple_scale + 0x8000) >> 16 # Rounded to nearest
         return val
 
 
@@ -82,5 +116,7 @@ class Base:
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+                if key in ('simple_max_val', 'analog_pin_max_val'):
+                    self._update_simple_scale()
             else:
-                self.pprint(f'Cannot set attribute: {key} - Attribute does not exist')
\ No newline at end of file
+                self.log.warning('Cannot set attribute: {} - Attribute does not exist', key)
\ No newline at end of file
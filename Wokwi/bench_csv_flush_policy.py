@@ -0,0 +1,52 @@
+# Author: Rasmus Ohert
+
+# THIS IS ONLY A TEST/BENCHMARK FILE
+# DO NOT USE THIS FILE IN FINAL PRODUCT
+
+# Measures the cost of one `CSVFileEditor.append_data` call with different flush policies.
+# Run on the Pico with the SD card connected; results are printed in microseconds per row.
+
+from utime  import ticks_us, ticks_diff # type:ignore
+
+from csv_file_editor    import CSVFileEditor
+from sdcard     import SDCardSetup
+
+
+ROWS = 200
+HEADERS = ['Anturi a1', 'Anturi a2', 'Anturi b1', 'Anturi b2', 'Vaaka', 'Värinä anturi']
+ROW = [1, 0, 1, 0, 31245, [30211, 29876, 0]]
+
+# (name, CSVFileEditor kwargs)
+CASES = [
+    ('rows=1',          {'flush_policy': 'rows', 'flush_rows': 1}),
+    ('rows=10',         {'flush_policy': 'rows', 'flush_rows': 10}),
+    ('rows=10 fsync',   {'flush_policy': 'rows', 'flush_rows': 10, 'fsync': True}),
+    ('time=1000ms',     {'flush_policy': 'time', 'flush_interval_ms': 1000}),
+    ('manual',          {'flush_policy': 'manual'}),
+    ('manual buf=2048', {'flush_policy': 'manual', 'buffer_size': 2048}),
+]
+
+
+def bench(name:str, kwargs:dict):
+    """Appends `ROWS` rows and prints mean and max time per row"""
+    editor = CSVFileEditor('sd/bench.csv', list(HEADERS), write_wait_time_s=0, **kwargs)
+
+    total_us = 0
+    max_us = 0
+    for _ in range(ROWS):
+        start = ticks_us()
+        editor.append_data(list(ROW))
+        took = ticks_diff(ticks_us(), start)
+        total_us += took
+        max_us = max(max_us, took)
+
+    start = ticks_us()
+    editor.close()
+    close_us = ticks_diff(ticks_us(), start)
+
+    print(f'{name:<16} mean: {total_us // ROWS:>6} us/row   max: {max_us:>6} us   close: {close_us:>6} us')
+
+
+SDCardSetup(5, 2, 3, 4)
+for name, kwargs in CASES:
+    bench(name, kwargs)
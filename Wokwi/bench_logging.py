@@ -0,0 +1,58 @@
+# Author: Rasmus Ohert
+
+# THIS IS ONLY A TEST/BENCHMARK FILE
+# DO NOT USE THIS FILE IN FINAL PRODUCT
+
+# Measures hot loop overhead of logging calls when debug printing is disabled.
+# Run on the Pico; prints time and allocated bytes per call.
+
+import gc
+from utime  import ticks_us, ticks_diff # type:ignore
+
+from base   import Base
+from logger import TraceSink, set_trace_sink
+
+
+CALLS = 2000
+
+obj = Base('Bench', debug_print=False)
+set_trace_sink(TraceSink(256))
+trace_id = obj.log.trace_id('bench')
+value = 31245
+
+
+def loop_empty():
+    for _ in range(CALLS):
+        pass
+
+def loop_pprint():
+    for _ in range(CALLS):
+        obj.pprint(f'Raw value: {value}') # Old way; f-string is built even if not printed
+
+def loop_log_debug():
+    for _ in range(CALLS):
+        obj.log.debug('Raw value: {}', value)
+
+def loop_trace():
+    for _ in range(CALLS):
+        obj.log.trace(trace_id, value)
+
+
+def bench(name:str, func, base_us:int=0) -> int:
+    """Runs `func` and prints time and allocated memory per call (loop overhead removed)"""
+    gc.collect()
+    gc.disable()
+    alloc_before = gc.mem_alloc()
+    start = ticks_us()
+    func()
+    took = ticks_diff(ticks_us(), start)
+    allocated = gc.mem_alloc() - alloc_before
+    gc.enable()
+    print(f'{name:<26} {(took - base_us) * 1000 // CALLS:>6} ns/call   {allocated // CALLS:>4} bytes/call')
+    return took
+
+
+base_us = bench('empty loop', loop_empty)
+bench('pprint(f-string), off', loop_pprint, base_us)
+bench('log.debug(fmt, value), off', loop_log_debug, base_us)
+bench('log.trace(id, value)', loop_trace, base_us)
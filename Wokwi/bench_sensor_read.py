@@ -0,0 +1,49 @@
+# Author: Rasmus Ohert
+
+# THIS IS ONLY A TEST/BENCHMARK FILE
+# DO NOT USE THIS FILE IN FINAL PRODUCT
+
+# Compares reading all sensors with `update` (new lists every read) and with `SensorGroup.read`.
+# Run on the Pico; prints time and allocated bytes per read.
+
+import gc
+from utime  import ticks_us, ticks_diff # type:ignore
+
+from three_axis_accelerometer   import Accelerometer
+from force_sensor   import ForceSensor
+from ir_sensor  import IRSensor
+from sensor_group   import SensorGroup
+
+
+READS = 1000
+
+ir_lst = [IRSensor(pin) for pin in (6, 7, 8, 9)]
+vaaka = ForceSensor(28)
+accelerometer = Accelerometer(x_pin=26, y_pin=27)
+group = SensorGroup(ir_lst + [vaaka, accelerometer])
+
+
+def read_update():
+    """Old way; builds new lists"""
+    data = [ir.update() for ir in ir_lst]
+    data.append(vaaka.update())
+    data += accelerometer.update(ret_type=int)
+    return data
+
+
+def bench(name:str, func):
+    """Calls `func` `READS` times and prints time and allocated memory per call"""
+    gc.collect()
+    gc.disable()
+    alloc_before = gc.mem_alloc()
+    start = ticks_us()
+    for _ in range(READS):
+        func()
+    took = ticks_diff(ticks_us(), start)
+    allocated = gc.mem_alloc() - alloc_before
+    gc.enable()
+    print(f'{name:<18} {took // READS:>5} us/read   {allocated // READS:>5} bytes/read')
+
+
+bench('update()', read_update)
+bench('SensorGroup.read()', group.read)
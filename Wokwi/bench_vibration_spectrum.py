@@ -0,0 +1,51 @@
+# Author: Rasmus Ohert
+
+# THIS IS ONLY A TEST/BENCHMARK FILE
+# DO NOT USE THIS FILE IN FINAL PRODUCT
+
+# Measures how long `VibrationSpectrum` takes to process one window, the longest single step, and how much RAM it uses.
+# Run on the Pico; one window must be processed well within the time it takes to sample it,
+# and one step must fit in the loop time left for it (`Itsetuhokone._step_spectrum`).
+
+import gc
+from math   import sin, pi
+from utime  import ticks_us, ticks_diff # type:ignore
+
+from vibration_spectrum import VibrationSpectrum
+
+
+RATE_HZ = 100
+AXES = [('x', 0), ('y', 1)]
+BUDGET_US = 2500 # A quarter of a 10 ms loop
+
+
+def bench(size:int):
+    """Fills one window with two sine waves and prints processing time, longest step, memory use and band values"""
+    gc.collect()
+    free_before = gc.mem_free()
+    spectrum = VibrationSpectrum(AXES, size=size, rate_hz=RATE_HZ)
+    gc.collect()
+    used = free_before - gc.mem_free()
+
+    row = [0, 0]
+    for i in range(size):
+        row[0] = 32768 + int(8000 * sin(2 * pi * 7 * i / RATE_HZ)) # 7 Hz -> 5-10 Hz band
+        row[1] = 32768 + int(2000 * sin(2 * pi * 27 * i / RATE_HZ)) # 27 Hz -> 20-35 Hz band
+        spectrum.add(row)
+
+    steps = 0
+    max_step_us = 0
+    done = False
+    while not done:
+        start = ticks_us()
+        done = spectrum.step(BUDGET_US)
+        max_step_us = max(max_step_us, ticks_diff(ticks_us(), start))
+        steps += 1
+
+    window_ms = size * 1000 // RATE_HZ
+    print(f'size {size:>4}: {spectrum.compute_ms:>4} ms for {len(AXES)} axes (window {window_ms} ms), {steps} steps, max step {max_step_us} us   RAM: {used} bytes')
+    print(f'           {list(zip([name for name, _ in spectrum.get_channels()], spectrum.latest()))}')
+
+
+for size in (256, 512):
+    bench(size)
@@ -0,0 +1,207 @@
+# Author: Rasmus Ohert
+
+from base import Base
+from rotating_csv_file_editor   import split_segment_path, find_last_segment_num
+from utime  import ticks_ms, ticks_diff # type:ignore
+
+
+MAGIC = b'ITLG' # File identifier
+VERSION = 1 # Version of the file format
+
+FLAG_TIMER = 0x01 # First channel is the timer (`'Time'`, milliseconds)
+
+# Supported channel types and their sizes (in bytes); same letters as in `struct`
+CHANNEL_SIZES = {
+    'B': 1, # Unsigned 8 bit (IR sensors, buttons)
+    'H': 2, # Unsigned 16 bit (ADC readings)
+    'h': 2, # Signed 16 bit (ADC differences)
+    'I': 4, # Unsigned 32 bit (time)
+}
+
+# Value ranges of the channel types; values outside are clamped
+CHANNEL_LIMITS = {
+    'B': (0, 0xff),
+    'H': (0, 0xffff),
+    'h': (-0x8000, 0x7fff),
+    'I': (0, 0xffffffff),
+}
+
+
+class BinaryLogEditor(Base):
+    """Writes sensor data as fixed size binary records.
+
+    File layout (all values little-endian):
+    - Header: `MAGIC` (4 bytes), version (u8), flags (u8), channel count (u8), record size (u16)
+    - For every channel: type (1 byte), name length (u8), name (utf-8)
+    - Records: values of all channels packed one after another
+
+    Every boot writes a new numbered file (`sensor_data_0001.bin`, `sensor_data_0002.bin`, ...), so
+    the previous run is not overwritten. Values outside the range of their channel type are clamped
+    and counted in `overflows`.
+
+    Use `Tools/bin_to_csv.py` to convert the file back to CSV."""
+    def __init__(self, file_path:str, channels:list, write_wait_time_s:int=1, add_timer:bool=True, buffer_size:int=512, max_age_ms:int=10000, debug_print:bool=False):
+        """Initializes BinaryLogEditor
+
+        Parameters:
+        - `file_path` (str): Base name of the file. File number is added before the extension (e.g. `'sd/sensor_data.bin'` -> `'sd/sensor_data_0001.bin'`)
+        - `channels` (list[tuple[str, str]]): List of `(name, type)` tuples. Type is one of `CHANNEL_SIZES` keys
+        - `write_wait_time_s` (int): Time between writing data to file (in seconds). Default: `1`
+        - `add_timer` (bool): Add timer (milliseconds) to data. Default: `True`
+        - `buffer_size` (int): Size of RAM buffer (in bytes); at least one record. Default: `512`
+        - `max_age_ms` (int): Max time records may wait in the RAM buffer (in milliseconds); checked in `append_data` and `service()`. `0` disables. Default: `10000`
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(file_path, debug_print=debug_print)
+
+        _prefix, _ext = split_segment_path(file_path)
+        self._file_path = f'{_prefix}{find_last_segment_num(_prefix, _ext) + 1:04d}{_ext}'
+        self._write_wait_time_s = write_wait_time_s
+        self._add_timer = add_timer
+
+        self._channels = list(channels)
+        if add_timer:
+            self._channels.insert(0, ('Time', 'I'))
+
+        for name, ch_type in self._channels:
+            if ch_type not in CHANNEL_SIZES:
+                self.praise(ValueError, f'Invalid channel type for {name}: {ch_type}')
+
+        self._sizes = bytes([CHANNEL_SIZES[ch_type] for _, ch_type in self._channels])
+        self._mins = tuple([CHANNEL_LIMITS[ch_type][0] for _, ch_type in self._channels])
+        self._maxs = tuple([CHANNEL_LIMITS[ch_type][1] for _, ch_type in self._channels])
+        self.overflows = 0 # Values clamped to the range of their channel type
+        self._record_size = sum(self._sizes)
+
+        # Preallocated buffer for whole records
+        self._buffer = bytearray(max(buffer_size // self._record_size, 1) * self._record_size)
+        self._buffer_mv = memoryview(self._buffer)
+        self._buffer_len = 0
+        self._max_age_ms = max_age_ms
+        self._buffer_since = 0 # Time of the oldest buffered record
+
+        self._last_write_time = ticks_ms()
+
+        self._setup_file()
+
+
+    def _setup_file(self) -> None:
+        """Writes header to file"""
+        self.log.debug('Setting up file')
+
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        header.append(FLAG_TIMER if self._add_timer else 0)
+        header.append(len(self._channels))
+        header.append(self._record_size & 0xff)
+        header.append(self._record_size >> 8)
+
+        for name, ch_type in self._channels:
+            _name = name.encode('utf-8')
+            header.append(ord(ch_type))
+            header.append(len(_name))
+            header.extend(_name)
+
+        with open(self._file_path, 'wb') as f:
+            f.write(header)
+
+        self.log.debug('File setup done')
+
+
+    def get_record_size(self) -> int:
+        """Returns size of one record (in bytes)"""
+        return self._record_size
+
+
+    def get_path(self) -> str:
+        """Returns path of the file written by this boot"""
+        return self._file_path
+
+
+    def append_data(self, data:list):
+        """Appends data to the buffer if given time has passed. Does not allocate memory.
+
+        Parameters:
+        - `data` (list[int]): Integer values for all channels (without time)"""
+        self.service()
+
+        if ticks_diff(ticks_ms(), self._last_write_time) < self._write_wait_time_s * 1000: # If time hasn't passed
+            return
+
+        if self._buffer_len + self._record_size > len(self._buffer):
+            self.flush()
+
+        now = ticks_ms()
+        if not self._buffer_len:
+            self._buffer_since = now
+        buf = self._buffer
+        sizes = self._sizes
+        mins = self._mins
+        maxs = self._maxs
+        o = self._buffer_len
+        i = 0
+
+        if self._add_timer:
+            o = self._pack(buf, o, now, 4)
+            i = 1
+
+        for val in data:
+            if val < mins[i] or val > maxs[i]:
+                val = self._clamp(i, val)
+            o = self._pack(buf, o, val, sizes[i])
+            i += 1
+
+        self._buffer_len = o
+        self._last_write_time = now
+
+
+    def _clamp(self, i:int, val:int) -> int:
+        """Clamps an out of range value of channel `i` and counts it; the first overflow is logged"""
+        self.overflows += 1
+        if self.overflows == 1:
+            self.log.warning('{} out of range for {}; clamped (further overflows only counted)', val, self._channels[i][0])
+        return self._mins[i] if val < self._mins[i] else self._maxs[i]
+
+
+    @staticmethod
+    def _pack(buf, offset:int, val:int, size:int) -> int:
+        """Packs integer to buffer (little-endian)
+
+        Parameters:
+        - `buf` (bytearray): Buffer to pack to
+        - `offset` (int): Offset in buffer
+        - `val` (int): Value to pack
+        - `size` (int): Size of value (in bytes)
+
+        Returns:
+        - `int`: Offset after the packed value"""
+        for _ in range(size):
+            buf[offset] = val & 0xff
+            val >>= 8
+            offset += 1
+        return offset
+
+
+    def service(self):
+        """Flushes the buffer if its oldest record is older than `max_age_ms`. Call periodically
+        (e.g. on every main loop), so that records do not stay in RAM when no new ones are appended."""
+        if self._buffer_len and self._max_age_ms and ticks_diff(ticks_ms(), self._buffer_since) >= self._max_age_ms:
+            self.flush()
+
+
+    def flush(self):
+        """Writes all buffered records to file"""
+        if not self._buffer_len:
+            return
+
+        with open(self._file_path, 'ab') as f:
+            f.write(self._buffer_mv[0:self._buffer_len])
+
+        self.log.debug('{} bytes written to file', self._buffer_len)
+        self._buffer_len = 0
+
+
+    def close(self):
+        """Writes all buffered records to file. File is not kept open, so there is nothing else to close."""
+        self.flush()
+        if self.overflows:
+            self.log.warning('{} values clamped', self.overflows)
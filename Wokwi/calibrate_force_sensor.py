@@ -0,0 +1,30 @@
+# Author: Rasmus Ohert
+
+# Calibrates the scale (force sensor) with reference weights. Run on the Pico from the REPL.
+# Calibration is saved to the Pico flash (`vaaka_kalibrointi.json`) and loaded by `main.py` on boot.
+
+from force_sensor   import ForceSensor
+
+
+CALIBRATION_FILE = 'vaaka_kalibrointi.json'
+
+vaaka = ForceSensor(28, 'Vaaka', calibration_file=CALIBRATION_FILE)
+
+input('Empty the scale and press Enter')
+points = [(vaaka.read_average(64), 0)]
+print(f'Empty: {points[0][0]}')
+
+while True:
+    grams = input('Put a reference weight on the scale and enter its weight in grams (empty to finish): ').strip()
+    if not grams:
+        break
+    raw = vaaka.read_average(64)
+    points.append((raw, int(grams)))
+    print(f'{grams} g: {raw}')
+
+if len(points) < 2:
+    print('At least one reference weight is needed; calibration not changed')
+else:
+    vaaka.set_calibration(None) # Old tare is not kept; empty scale is the zero point
+    vaaka.calibrate(points)
+    print(f'Saved to {CALIBRATION_FILE}: {vaaka.calibration.to_dict()}')
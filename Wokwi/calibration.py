@@ -0,0 +1,104 @@
+# Author: Rasmus Ohert
+
+import json
+from array  import array
+
+
+class Calibration:
+    """Piecewise-linear conversion from raw `read_u16` values to calibrated integers (e.g. grams).
+
+    The calibration is given as reference points `(raw, value)`. When created, the curve is
+    evaluated once into an integer table with an entry every `2^(16 - table_bits)` raw counts.
+    Converting a reading is a table lookup and an integer interpolation between two entries;
+    no floats are used and no memory is allocated. Outside the reference points the first and
+    last segments are extended.
+
+    Tare (zero offset) is subtracted from every converted value. Calibration and tare can be
+    saved to a JSON file, so they do not need to be measured again after boot."""
+    def __init__(self, points:list, tare:int=0, table_bits:int=8):
+        """Initializes Calibration
+
+        Parameters:
+        - `points` (list[tuple[int, int]]): At least two reference points `(raw, value)`, e.g. `[(1200, 0), (24000, 500), (47000, 1000)]`
+        - `tare` (int): Value subtracted from every converted value. Default: `0`
+        - `table_bits` (int): Table has `2^table_bits + 1` entries; more bits follow the reference points more closely near the breakpoints. Default: `8`"""
+        points = sorted((int(raw), int(value)) for raw, value in points)
+        if len(points) < 2 or points[0][0] == points[-1][0]:
+            raise ValueError('Calibration needs at least two points with different raw values')
+        for i in range(1, len(points)):
+            if points[i][0] == points[i - 1][0]:
+                raise ValueError(f'Two calibration points with the same raw value: {points[i][0]}')
+
+        self.points = points
+        self.tare_value = tare
+        self.table_bits = table_bits
+
+        self._shift = 16 - table_bits
+        self._mask = (1 << self._shift) - 1
+        self._table = array('i', [self._interpolate(i << self._shift) for i in range((1 << table_bits) + 1)])
+
+
+    def _interpolate(self, raw:int) -> int:
+        """Evaluates the calibration curve; only used when building the table"""
+        points = self.points
+        # Segment that contains `raw`; first and last segments are extended
+        i = 1
+        while i < len(points) - 1 and raw > points[i][0]:
+            i += 1
+        (x0, y0), (x1, y1) = points[i - 1], points[i]
+        return round(y0 + (raw - x0) * (y1 - y0) / (x1 - x0))
+
+
+    def convert(self, raw:int) -> int:
+        """Converts a raw value. Does not allocate memory.
+
+        Parameters:
+        - `raw` (int): Raw `read_u16` value (`0`-`65535`)
+
+        Returns:
+        - `int`: Calibrated value with tare subtracted"""
+        i = raw >> self._shift
+        v0 = self._table[i]
+        return v0 + (((self._table[i + 1] - v0) * (raw & self._mask)) >> self._shift) - self.tare_value
+
+
+    def tare(self, raw:int):
+        """Sets the tare so that `raw` converts to zero
+
+        Parameters:
+        - `raw` (int): Raw value with nothing on the sensor"""
+        self.tare_value = 0
+        self.tare_value = self.convert(raw)
+
+
+    def to_dict(self) -> dict:
+        """Returns calibration as a dictionary (for `save`)"""
+        return {'points': [list(point) for point in self.points], 'tare': self.tare_value, 'table_bits': self.table_bits}
+
+
+    @classmethod
+    def from_dict(cls, data:dict):
+        """Creates calibration from a dictionary made by `to_dict`"""
+        return cls(data['points'], data.get('tare', 0), data.get('table_bits', 8))
+
+
+    def save(self, file_path:str):
+        """Saves calibration to a JSON file
+
+        Parameters:
+        - `file_path` (str): Path of the file, e.g. `'vaaka_kalibrointi.json'` (Pico flash)"""
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+
+    @classmethod
+    def load(cls, file_path:str):
+        """Loads calibration saved with `save`
+
+        Parameters:
+        - `file_path` (str): Path of the file
+
+        Returns:
+        - `Calibration`: Loaded calibration. Raises `OSError` if the file does not exist"""
+        with open(file_path, 'r') as f:
+            return cls.from_dict(json.load(f))
@@ -2,11 +2,17 @@
 
 from base import Base
 from utime  import ticks_ms, ticks_diff # type:ignore
+from uos    import sync # type:ignore
+
+
+_BLOCK_SIZE = 512 # SD card sector size (in bytes)
+_INDEX_ENTRY_SIZE = 8 # Time (`ticks_ms`, u32) and byte offset (u32) of a row; little-endian
+_INDEX_BUFFER_ENTRIES = 32 # Index entries kept in RAM before writing to file
 
 
 class CSVFileEditor(Base):
     """Edits text files"""
-    def __init__(self, file_path:str, headers:list, write_wait_time_s:int=1, add_timer:bool=True, timer_decimals:int=0, separator:str=';', encoding:str='utf-8', debug_print:bool=False):
+    def __init__(self, file_path:str, headers:list, write_wait_time_s:int=1, add_timer:bool=True, timer_decimals:int=0, separator:str=';', encoding:str='utf-8', flush_policy:str='time', flush_rows:int=10, flush_interval_ms:int=5000, max_age_ms:int=10000, fsync:bool=False, buffer_size:int=0, index_every_n_rows:int=0, debug_print:bool=False):
         """Initializes CSVFileEditor
         
         Parameters:
@@ -17,6 +23,18 @@ class CSVFileEditor(Base):
         - `timer_decimals` (int): Number of decimals in timer. Default: `0`
         - `separator` (str): Separator between values in file. Default: `';'`
         - `encoding` (str): Encoding of file. Default: `'utf-8'`
+        - `flush_policy` (str): When written data is flushed to the SD card. With buffering, only whole blocks are written by the policy;
+          the unfinished block stays in RAM until it fills up, `max_age_ms` passes or `flush()`/`close()` is called. Default: `'time'`
+            - `'rows'`: Every `flush_rows` rows
+            - `'time'`: Every `flush_interval_ms` milliseconds
+            - `'manual'`: Only when `flush()` or `close()` is called (and by `max_age_ms`)
+        - `flush_rows` (int): Rows between flushes with `'rows'` policy. Default: `10`
+        - `flush_interval_ms` (int): Time between flushes with `'time'` policy (in milliseconds). Default: `5000`
+        - `max_age_ms` (int): Max time written data may wait unflushed, with every policy (in milliseconds); then all data is flushed.
+          Checked in `append_data` and `service()`. `0` disables. Default: `10000`
+        - `fsync` (bool): If `True`, also syncs the filesystem on every flush. Default: `False`
+        - `buffer_size` (int): Size of RAM buffer for rows (in bytes); rounded up to a multiple of `512`. `0` writes every row straight to file. Default: `0`
+        - `index_every_n_rows` (int): Add `(time, byte offset)` of every Nth row to a sidecar index file (`.idx`), used by `read_range`. Needs `add_timer`. `0` disables the index. Default: `0`
         - `debug_print` (bool): Print debug info. Default: `False`"""
         
         super().__init__(file_path, debug_print=debug_print)
@@ -31,52 +49,224 @@ class CSVFileEditor(Base):
 
         self._last_write_time = ticks_ms()
 
+        # File is kept open for the whole session
+        if flush_policy not in ('rows', 'time', 'manual'):
+            self.praise(ValueError, f'Invalid flush policy: {flush_policy}')
+        self._file = None
+        self._flush_policy = flush_policy
+        self._flush_rows = flush_rows
+        self._flush_interval_ms = flush_interval_ms
+        self._max_age_ms = max_age_ms
+        self._fsync = fsync
+        self._rows_since_flush = 0
+        self._last_flush_time = ticks_ms()
+        self._dirty = False # Data written since the last flush
+        self._dirty_since = 0 # Time of the oldest unflushed data
+
+        # RAM buffer for rows; flushed to file in whole blocks
+        self._buffer_size = -(-buffer_size // _BLOCK_SIZE) * _BLOCK_SIZE if buffer_size > 0 else 0
+        self._buffer = bytearray(self._buffer_size)
+        self._buffer_mv = memoryview(self._buffer)
+        self._buffer_len = 0
+        self._file_pos = 0 # Bytes in file; used to align writes to blocks
+
+        # Sparse time index
+        if index_every_n_rows and not add_timer:
+            self.praise(ValueError, 'Time index needs the Time column (add_timer=True)')
+        self._index_every_n_rows = index_every_n_rows
+        self._index_buffer = bytearray(_INDEX_BUFFER_ENTRIES * _INDEX_ENTRY_SIZE if index_every_n_rows else 0)
+        self._index_len = 0
+        self._index_row_count = 0
+        self._time_round_ms = 1000 // (2 * 10 ** timer_decimals) # Max difference of the Time column from `ticks_ms`
+
+        if self._add_timer:
+            self._headers.insert(0, 'Time')
+
         self._setup_file()
 
     
     def _setup_file(self) -> None:
         """Sets up file if it doesn't exist, is empty or has wrong headers"""
-        self.pprint('Setting up file')
-
-        if self._add_timer:
-            self._headers.insert(0, 'Time')
+        self.log.debug('Setting up file')
 
         _headers = self._separator.join([str(header) for header in self._headers])
         self.write(f'sep={self._separator}\n{_headers}') # Write headers to file; and set separator (meant for excel)
 
-        self.pprint('File setup done')
+        self.log.debug('File setup done')
+        
+
+    def get_headers(self) -> list:
+        """Returns list of headers (including `'Time'` if timer is added)"""
+        return self._headers
+
+
+    def read_rows(self, columns:list|None=None, chunk_size:int=256):
+        """Reads file row by row. File is read in fixed size chunks, so memory use does not grow with the file size.
+        `sep=` and header lines are skipped.
         
+        Parameters:
+        - `columns` (list[str|int] | None): Names or indexes of columns to return. `None` returns all columns. Default: `None`
+        - `chunk_size` (int): Size of read chunks (in bytes). Default: `256`
+            
+        Yields:
+        - `list[str]`: Values of the requested columns"""
+        self.flush() # Make sure all written data is in the file
+
+        try:
+            f = open(self._file_path, 'rb')
+        except OSError:
+            self.log.debug('File not found')
+            return
+
+        col_idxs = None # Set when the header line is read
 
-    def _read_as(self, ret_as:str='r') -> list | None:
-        """Reads file, and returns it as a list of rows or as collumns
+        with f:
+            for line in self._iter_lines(f, chunk_size):
+                if col_idxs is None:
+                    line = line.decode(self.encoding).strip()
+                    if not line.startswith('sep='):
+                        col_idxs = self._column_indexes(line.split(self._separator), columns)
+                    continue
+
+                values = self._split_line(line)
+                if values is not None:
+                    yield [values[i] if i < len(values) else '' for i in col_idxs]
+
+
+    def read_range(self, t_start:float, t_end:float, columns:list|None=None, chunk_size:int=256):
+        """Reads rows with `t_start` <= Time <= `t_end`. Uses the time index to seek near `t_start`,
+        so only the requested part of the file is read. Without an index the file is read from the start.
         
         Parameters:
-        - `ret_as` (str): Return as
-            - `'r'`: rows
-            - `'c'`: collumns
+        - `t_start` (float): Start time (in seconds, same as the `Time` column)
+        - `t_end` (float): End time (in seconds)
+        - `columns` (list[str|int] | None): Names or indexes of columns to return. `None` returns all columns. Default: `None`
+        - `chunk_size` (int): Size of read chunks (in bytes). Default: `256`
             
+        Yields:
+        - `list[str]`: Values of the requested columns"""
+        if not self._add_timer:
+            self.praise(ValueError, 'read_range needs the Time column (add_timer=True)')
+
+        self.flush() # Make sure all written data (and index) is in the files
+
+        col_idxs = self._column_indexes(self._headers, columns)
+        offset = self._find_index_offset(int(t_start * 1000) - self._time_round_ms) # Rows rounded up to `t_start` are included
+
+        try:
+            f = open(self._file_path, 'rb')
+        except OSError:
+            self.log.debug('File not found')
+            return
+
+        with f:
+            f.seek(offset)
+            for line in self._iter_lines(f, chunk_size):
+                values = self._split_line(line)
+                if values is None:
+                    continue
+
+                try:
+                    t = float(values[0])
+                except ValueError: # Header lines, when there is no index
+                    continue
+
+                if t < t_start:
+                    continue
+                if t > t_end:
+                    return
+                yield [values[i] if i < len(values) else '' for i in col_idxs]
+
+
+    def _find_index_offset(self, t_ms:int) -> int:
+        """Binary searches the index file for the last entry with time < `t_ms`, so all rows
+        from `t_ms` on come after it (also when several rows have the same time).
+        Only one entry is read at a time.
+        
+        Parameters:
+        - `t_ms` (int): Time (in milliseconds)
+        
         Returns:
-        - `list` or `None`"""
+        - `int`: Byte offset of the row in file; `0` if there is no suitable entry"""
+        try:
+            f = open(self._index_path, 'rb')
+        except OSError:
+            return 0
+
+        entry = bytearray(_INDEX_ENTRY_SIZE)
+        offset = 0
+        with f:
+            f.seek(0, 2)
+            lo = 0
+            hi = f.tell() // _INDEX_ENTRY_SIZE - 1
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                f.seek(mid * _INDEX_ENTRY_SIZE)
+                f.readinto(entry)
+                if self._unpack_u32(entry, 0) < t_ms:
+                    offset = self._unpack_u32(entry, 4)
+                    lo = mid + 1
+                else:
+                    hi = mid - 1
+
+        return offset
+
+
+    def _iter_lines(self, f, chunk_size:int):
+        """Reads open file in fixed size chunks and yields it line by line
+        
+        Parameters:
+        - `f`: File opened in binary mode
+        - `chunk_size` (int): Size of read chunks (in bytes)
         
-        def read_file():
-            """Reads file; returns None if file doesn't exist"""
-            try:
-                with open(self._file_path, 'r', encoding=self.encoding) as f:
-                    return f.read()
-            except FileNotFoundError:
-                self.pprint('File not found')
-                return None      
+        Yields:
+        - `bytes`: Line without the newline"""
+        buf = bytearray(chunk_size)
+        rest = b'' # Unfinished line from previous chunk
+
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+
+            lines = (rest + buf[0:n]).split(b'\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line
+
+        if rest:
+            yield rest
 
-        _read = read_file()
+
+    def _column_indexes(self, headers:list, columns:list|None) -> list:
+        """Returns indexes of requested columns
         
-        if not _read or ret_as not in ['r', 'c']:
-            return
+        Parameters:
+        - `headers` (list[str]): Headers of the file
+        - `columns` (list[str|int] | None): Requested columns; `None` for all"""
+        if columns is None:
+            return list(range(len(headers)))
+
+        col_idxs = []
+        for col in columns:
+            if isinstance(col, int):
+                col_idxs.append(col)
+            elif col in headers:
+                col_idxs.append(headers.index(col))
+            else:
+                self.praise(ValueError, f'Column not found: {col}')
+        return col_idxs
 
-        _lines = _read.splitlines()
-        if ret_as == 'r':
-            return _lines
-        elif ret_as == 'c':
-            return list(zip(*_lines))[::-1]
+
+    def _split_line(self, line:bytes) -> list|None:
+        """Splits line to values. Returns `None` for empty and comment (`#`) lines.
+        
+        Parameters:
+        - `line` (bytes): Line from file"""
+        line = line.decode(self.encoding).strip()
+        if not line or line.startswith('#'):
+            return None
+        return line.split(self._separator)
         
     
     def write(self, text:str):
@@ -84,29 +274,264 @@ class CSVFileEditor(Base):
         
         Parameters:
         - `text` (str): Text to write"""
-        with open(self._file_path, 'w', encoding=self.encoding) as f:
-            f.write(text)
+        self._buffer_len = 0 # Drop buffered rows; file is overwritten
+        self._close_file()
+
+        self._file = open(self._file_path, 'wb')
+        self._file_pos = self._file.write(text.encode(self.encoding))
+        self._sync()
+
+        # Start a new index for the file
+        self._index_len = 0
+        self._index_row_count = 0
+        if self._index_every_n_rows:
+            with open(self._index_path, 'wb'):
+                pass
         
-        self.pprint('text written to file')
+        self.log.debug('text written to file')
 
 
-    def append_data(self, data:list):
-        """Appends data to file if given time has passed
+    def append_data(self, data:list, time_ms:int=None):
+        """Appends data to file if given time has passed.
+        If buffering is enabled, data is appended to the RAM buffer instead.
         
         Parameters:
-        - `data` (list): Data to append to file"""
+        - `data` (list): Data to append to file
+        - `time_ms` (int | None): Time of the row (`ticks_ms`), e.g. of an earlier interrupt; `None` is now. Default: `None`"""
+
+        self.service()
 
         if ticks_diff(ticks_ms(), self._last_write_time) < self._write_wait_time_s * 1000: # If time hasn't passed
             return
         
+        now = ticks_ms() if time_ms is None else time_ms
         if self._add_timer:
-            time = f'{ticks_ms()/1000:.{self._timer_decimals}f}' # Format time to 1 decimal
+            time = f'{now/1000:.{self._timer_decimals}f}' # Format time to `timer_decimals` decimals
             data.insert(0, time) # Insert time at start of data
 
-        with open(self._file_path, 'a', encoding=self.encoding) as f:
-            data = [str(d) for d in data] # Convert all data to strings
-            f.write(f'\n{self._separator.join(data)}')
+        if self._index_every_n_rows:
+            self._add_index_entry(now)
+
+        self._append_text(f'\n{self._separator.join([str(d) for d in data])}')
+        self._on_row_written(data)
 
         self._last_write_time = ticks_ms()
+
+        self._rows_since_flush += 1
+        if self._flush_policy == 'rows' and self._rows_since_flush >= self._flush_rows:
+            self._flush_blocks()
+        
+        self.log.debug('Data appended to file -> {}', data)
+
+
+    def _append_text(self, text:str):
+        """Appends text to file (or to the RAM buffer if buffering is enabled)
+        
+        Parameters:
+        - `text` (str): Text to append"""
+        if not self._dirty:
+            self._dirty = True
+            self._dirty_since = ticks_ms()
+
+        if self._buffer_size:
+            self._buffer_row(text.encode(self.encoding))
+        else:
+            self._file_pos += self._get_file().write(text.encode(self.encoding))
+
+
+    def _add_index_entry(self, t_ms:int):
+        """Adds next row to the index if it is the Nth row
+        
+        Parameters:
+        - `t_ms` (int): Time of the row (`ticks_ms`, not rounded like the Time column)"""
+        row_num = self._index_row_count
+        self._index_row_count += 1
+        if row_num % self._index_every_n_rows:
+            return
+
+        if self._index_len == len(self._index_buffer):
+            self._write_index()
+
+        offset = self._file_pos + self._buffer_len + 1 # Row starts after the newline
+        self._pack_u32(self._index_buffer, self._index_len, t_ms)
+        self._pack_u32(self._index_buffer, self._index_len + 4, offset)
+        self._index_len += _INDEX_ENTRY_SIZE
+
+
+    def _write_index(self):
+        """Writes buffered index entries to the index file"""
+        if not self._index_len:
+            return
+
+        with open(self._index_path, 'ab') as f:
+            f.write(memoryview(self._index_buffer)[0:self._index_len])
+        self._index_len = 0
+
+
+    @property
+    def _index_path(self) -> str:
+        """Path of the index file (file path with `.idx` extension)"""
+        _dot = self._file_path.rfind('.')
+        if _dot <= self._file_path.rfind('/'):
+            _dot = len(self._file_path)
+        return self._file_path[:_dot] + '.idx'
+
+
+    @staticmethod
+    def _pack_u32(buf, offset:int, val:int):
+        """Packs unsigned 32 bit integer to buffer (little-endian)"""
+        for i in range(4):
+            buf[offset + i] = (val >> (8 * i)) & 0xff
+
+
+    @staticmethod
+    def _unpack_u32(buf, offset:int) -> int:
+        """Unpacks unsigned 32 bit integer from buffer (little-endian)"""
+        return buf[offset] | (buf[offset + 1] << 8) | (buf[offset + 2] << 16) | (buf[offset + 3] << 24)
+
+
+    def _on_row_written(self, data:list):
+        """Called after a row is appended. Does nothing; subclasses can use it to track written data.
+        
+        Parameters:
+        - `data` (list): Values of the row (time included if `add_timer` is `True`)"""
+        pass
+
+
+    def _buffer_row(self, row:bytes):
+        """Copies row to the RAM buffer. Writes whole blocks to file when the buffer fills up.
+        A row larger than the buffer is not copied through it: the buffer is filled up to the next
+        block boundary and written, then whole blocks are written straight from the row.
         
-        self.pprint(f'Data appended to file -> {data}')
\ No newline at end of file
+        Parameters:
+        - `row` (bytes): Encoded row"""
+        row_mv = memoryview(row)
+        row_len = len(row)
+        i = 0
+        if row_len > self._buffer_size:
+            i = -(self._file_pos + self._buffer_len) % _BLOCK_SIZE # Bytes to the next block boundary
+            self._copy_to_buffer(row_mv, 0, i)
+            self._write_blocks() # Buffer ends at the boundary; all of it is written
+
+            n = (row_len - i) // _BLOCK_SIZE * _BLOCK_SIZE
+            self._get_file().write(row_mv[i:i + n])
+            self._file_pos += n
+            self.log.debug('{} bytes written to file', n)
+            i += n
+
+        self._copy_to_buffer(row_mv, i, row_len)
+
+
+    def _copy_to_buffer(self, row_mv, i:int, end:int):
+        """Copies `row_mv[i:end]` to the RAM buffer; writes whole blocks to file when the buffer fills up"""
+        while i < end:
+            n = min(self._buffer_size - self._buffer_len, end - i)
+            self._buffer_mv[self._buffer_len:self._buffer_len + n] = row_mv[i:i + n]
+            self._buffer_len += n
+            i += n
+
+            if self._buffer_len == self._buffer_size:
+                self._write_blocks()
+
+
+    def _write_blocks(self):
+        """Writes buffered data up to the last whole block boundary of the file.
+        Rest of the data is moved to the start of the buffer."""
+        n = ((self._file_pos + self._buffer_len) // _BLOCK_SIZE) * _BLOCK_SIZE - self._file_pos
+        if n <= 0:
+            return
+
+        self._write_buffer(n)
+
+        # Move leftover bytes to start of buffer
+        rest = self._buffer_len - n
+        self._buffer_mv[0:rest] = self._buffer_mv[n:n + rest]
+        self._buffer_len = rest
+
+
+    def _write_buffer(self, n:int):
+        """Writes `n` first bytes of the buffer to file
+        
+        Parameters:
+        - `n` (int): Number of bytes to write"""
+        self._get_file().write(self._buffer_mv[0:n])
+
+        self._file_pos += n
+        self.log.debug('{} bytes written to file', n)
+
+
+    def _get_file(self):
+        """Returns the open file. Reopens it in append mode if it was closed."""
+        if self._file is None:
+            self._file = open(self._file_path, 'ab')
+        return self._file
+
+
+    def _sync(self):
+        """Flushes the open file (and syncs the filesystem if `fsync` is set)"""
+        self._file.flush()
+        if self._fsync:
+            sync()
+
+        self._rows_since_flush = 0
+        self._last_flush_time = ticks_ms()
+        if not self._buffer_len:
+            self._dirty = False
+
+
+    def service(self):
+        """Flushes data that is due by the flush policy or by `max_age_ms`. Call periodically (e.g. on every
+        main loop), so that data does not stay in RAM when no rows are appended."""
+        if not self._dirty:
+            return
+
+        now = ticks_ms()
+        if self._max_age_ms and ticks_diff(now, self._dirty_since) >= self._max_age_ms:
+            self.flush()
+        elif self._flush_policy == 'time' and ticks_diff(now, self._last_flush_time) >= self._flush_interval_ms:
+            self._flush_blocks()
+
+
+    def _flush_blocks(self):
+        """Policy flush: writes the whole blocks of the RAM buffer and flushes the file.
+        The unfinished block stays in RAM, so writes stay aligned to SD card blocks."""
+        if self._buffer_size:
+            self._write_blocks()
+        if self._file is not None:
+            self._sync()
+
+
+    def flush(self):
+        """Writes all buffered data to file and flushes the file"""
+        if self._buffer_len:
+            self._write_buffer(self._buffer_len)
+            self._buffer_len = 0
+
+        if self._file is not None:
+            self._sync()
+
+        self._write_index() # Index is written after the rows it points to
+
+
+    def close(self):
+        """Flushes and closes the file. Next write reopens it."""
+        self._close_file()
+
+
+    def _close_file(self):
+        """Flushes and closes the file (reopened first if rows were buffered after it was closed)"""
+        if self._file is None and not self._buffer_len:
+            return
+
+        self.flush()
+        self._file.close()
+        self._file = None
+        self.log.debug('File closed')
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,162 @@
+# Author: Rasmus Ohert
+
+import _thread
+from base import Base
+from utime  import sleep_ms, sleep_us, ticks_us, ticks_add, ticks_diff # type:ignore
+
+
+class CoreQueue:
+    """Fixed size lock-protected ring buffer for passing items between cores.
+
+    `put` never blocks for long: if the queue is full, the item is dropped and counted in `dropped`."""
+    def __init__(self, capacity:int=32):
+        """Initializes CoreQueue
+
+        Parameters:
+        - `capacity` (int): Max number of items waiting. Default: `32`"""
+        self._items = [None] * capacity
+        self._capacity = capacity
+        self._head = 0 # Next write position
+        self._count = 0
+        self._lock = _thread.allocate_lock()
+        self.dropped = 0 # Items lost because the queue was full
+
+
+    def put(self, item) -> bool:
+        """Adds an item; returns `False` if the queue is full"""
+        with self._lock:
+            if self._count == self._capacity:
+                self.dropped += 1
+                return False
+            self._items[self._head] = item
+            self._head = (self._head + 1) % self._capacity
+            self._count += 1
+        return True
+
+
+    def get(self):
+        """Removes and returns the oldest item; `None` if the queue is empty"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            i = (self._head - self._count) % self._capacity
+            item = self._items[i]
+            self._items[i] = None
+            self._count -= 1
+        return item
+
+
+    def __len__(self) -> int:
+        """Returns number of items waiting"""
+        return self._count
+
+
+class CoreWorker(Base):
+    """Runs a function periodically on the second core of the RP2040 (with `_thread`).
+
+    `step` is called every `period_us`; items put to `queue` by the first core are passed to
+    `handle` on the second core before every step. An exception in the worker stops it and is
+    raised on the first core by `check`. On a PC (CPython) the worker runs as a normal thread, if a
+    `utime` stand-in is installed (see `tests/conftest.py`)."""
+    def __init__(self, step, period_us:int, handle=None, queue_size:int=32, name:str='Core worker', debug_print:bool=False):
+        """Initializes CoreWorker. Call `start()` to start it.
+
+        Parameters:
+        - `step` (callable): Called without arguments every `period_us`
+        - `period_us` (int): Period of `step` (in microseconds)
+        - `handle` (callable | None): Called with every item taken from `queue`. Default: `None`
+        - `queue_size` (int): Capacity of `queue`. Default: `32`
+        - `name` (str): Name of class instance. Default: 'Core worker'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        self._step = step
+        self._handle = handle
+        self.period_us = period_us
+        self.queue = CoreQueue(queue_size)
+
+        self._running = False
+        self._done = True
+        self.error = None # Exception raised in the worker
+        self.steps = 0
+        self.late_steps = 0 # Steps started more than one period late
+
+
+    def start(self):
+        """Starts the worker on the second core"""
+        if not self._done:
+            self.praise(RuntimeError, 'Worker is already running')
+        self.error = None
+        self._running = True
+        self._done = False
+        _thread.start_new_thread(self._run, ())
+        self.log.debug('Started, period {} us', self.period_us)
+
+
+    def stop(self, timeout_ms:int=1000) -> bool:
+        """Stops the worker and waits until it has finished; remaining queue items are handled first
+
+        Parameters:
+        - `timeout_ms` (int): Max time to wait (in milliseconds). Default: `1000`
+
+        Returns:
+        - `bool`: `True` if the worker stopped in time"""
+        self._running = False
+        for _ in range(timeout_ms):
+            if self._done:
+                self.log.debug('Stopped after {} steps ({} late)', self.steps, self.late_steps)
+                return True
+            sleep_ms(1)
+        self.log.warning('Worker did not stop in {} ms', timeout_ms)
+        return False
+
+
+    def is_running(self) -> bool:
+        """Returns `True` if the worker is running"""
+        return not self._done
+
+
+    def post(self, item) -> bool:
+        """Puts an item to the queue for `handle`; returns `False` if the queue is full"""
+        return self.queue.put(item)
+
+
+    def check(self):
+        """Raises the exception of the worker on the calling (first) core, if it has failed"""
+        if self.error is not None:
+            err = self.error
+            self.error = None
+            raise err
+
+
+    def _run(self):
+        """Worker loop (second core)"""
+        try:
+            deadline = ticks_us()
+            while self._running:
+                self._handle_queue()
+                self._step()
+                self.steps += 1
+
+                deadline = ticks_add(deadline, self.period_us)
+                wait = ticks_diff(deadline, ticks_us())
+                if wait > 0:
+                    sleep_us(wait)
+                elif wait < -self.period_us: # Too late; do not try to catch up
+                    self.late_steps += 1
+                    deadline = ticks_us()
+            self._handle_queue()
+        except Exception as err:
+            self.error = err
+        finally:
+            self._running = False
+            self._done = True
+
+
+    def _handle_queue(self):
+        """Passes waiting queue items to `handle`"""
+        item = self.queue.get()
+        while item is not None:
+            if self._handle is not None:
+                self._handle(item)
+            item = self.queue.get()
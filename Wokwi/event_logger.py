@@ -0,0 +1,102 @@
+# Author: Rasmus Ohert
+
+from base import Base
+from rotating_csv_file_editor   import RotatingCSVFileEditor
+from utime  import ticks_ms, ticks_us, ticks_add, ticks_diff # type:ignore
+
+
+class EventLogger(Base):
+    """Logs digital channels (IR sensors, start/stop latch) only when their value changes.
+
+    Every change is written as one `Time;Channel;Value` row, so the log has the exact transition
+    history without writing unchanged values on every loop. Values of all channels are written
+    on the first check, so the log starts from a known state.
+
+    A channel with an edge source (e.g. `IRSensor` with `enable_irq`) is logged from the edges recorded
+    by its interrupt, with the time of each edge, so changes shorter than the check interval are
+    not lost. Its value is still read on every check, in case edges were lost."""
+    def __init__(self, file_path:str, channels:list, name:str='Event logger', debug_print:bool=False, **kwargs):
+        """Initializes EventLogger
+
+        Parameters:
+        - `file_path` (str): Base name of the event log (segments are numbered, see `RotatingCSVFileEditor`)
+        - `channels` (list[tuple]): List of `(name, read_func)` or `(name, read_func, edges)` tuples. `read_func` returns the current value (`int` or `bool`);
+            `edges` has `pop_edge()` that returns `(ticks_us, value)` of the oldest recorded change or `None` (see `IRSensor.pop_edge`)
+        - `name` (str): Name of class instance. Default: 'Event logger'
+        - `debug_print` (bool): Print debug info. Default: `False`
+        - `kwargs`: Other arguments for `RotatingCSVFileEditor`"""
+        super().__init__(name, debug_print)
+
+        self._names = [ch[0] for ch in channels]
+        self._read_funcs = [ch[1] for ch in channels]
+        self._edge_sources = [ch[2] if len(ch) > 2 else None for ch in channels]
+        self._last_values = [None] * len(channels)
+        self._last_ms = ticks_ms() # Time of the last logged row; rows are kept in time order
+
+        kwargs.setdefault('timer_decimals', 3)
+        self.csv = RotatingCSVFileEditor(file_path, ['Channel', 'Value'], write_wait_time_s=0, debug_print=debug_print, **kwargs)
+
+
+    def check(self) -> bool:
+        """Reads all channels and logs the changed ones
+
+        Returns:
+        - `bool`: `True` if any channel changed, else `False`"""
+        changed = False
+        for i in range(len(self._read_funcs)):
+            edges = self._edge_sources[i]
+            if edges is not None:
+                edge = edges.pop_edge()
+                while edge is not None:
+                    if self._last_values[i] is not None: # Edges before the first check are already in the first value
+                        changed |= self._log_change(i, edge[1], self._edge_ms(edge[0]))
+                    edge = edges.pop_edge()
+
+            changed |= self._log_change(i, int(self._read_funcs[i]()), ticks_ms())
+
+        return changed
+
+
+    def _log_change(self, i:int, val:int, time_ms:int) -> bool:
+        """Logs the value of channel `i` if it has changed; returns `True` if it was logged"""
+        if val == self._last_values[i]:
+            return False
+
+        if ticks_diff(time_ms, self._last_ms) < 0: # Older than the last row (e.g. a `log_event` row)
+            time_ms = self._last_ms
+        self._last_ms = time_ms
+        self._last_values[i] = val
+        self.csv.append_data([self._names[i], val], time_ms)
+        self.log.debug('{} -> {}', self._names[i], val)
+        return True
+
+
+    def _edge_ms(self, edge_us:int) -> int:
+        """Converts the `ticks_us` time of an edge to `ticks_ms`"""
+        return ticks_add(ticks_ms(), -(ticks_diff(ticks_us(), edge_us) // 1000))
+
+
+    def log_event(self, channel:str, value:int):
+        """Logs a single event that is not read by `check`, e.g. a weighing result
+
+        Parameters:
+        - `channel` (str): Name of the channel
+        - `value` (int): Value of the event"""
+        self._last_ms = ticks_ms()
+        self.csv.append_data([channel, int(value)])
+        self.log.debug('{}: {}', channel, value)
+
+
+    def service(self):
+        """Flushes buffered events that are due (see `CSVFileEditor.service`)"""
+        self.csv.service()
+
+
+    def flush(self):
+        """Writes buffered events to file"""
+        self.csv.flush()
+
+
+    def close(self):
+        """Closes the event log"""
+        self.csv.close()
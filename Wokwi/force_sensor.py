@@ -1,16 +1,20 @@
 # Author: Rasmus Ohert
 
+from array  import array
 from base import Base
+from calibration    import Calibration
 from machine    import ADC # type:ignore
+from utime  import sleep_ms, ticks_ms, ticks_add, ticks_diff # type:ignore
 
 
 class ForceSensor(Base):
-    def __init__(self, pin_num:int, name:str='Force sensor', decimal_len:int=2, simple_read:bool=False, simple_max_val:int=100, analog_pin_max_val:int=65535, debug_print:bool=False) -> None:
+    def __init__(self, pin_num:int, name:str='Force sensor', decimal_len:int=2, simple_read:bool=False, simple_max_val:int=100, analog_pin_max_val:int=65535, calibration_file:str=None, debug_print:bool=False) -> None:
         """Force sensor class
 
         Parameters:
         - `pin_num` (int): Pin number to use.
         - `name` (str): Name of class instance. Default: 'Force sensor'
+        - `calibration_file` (str): Calibration is loaded from and saved to this file (see `calibrate` and `tare`). With a calibration, values are in grams. Default: `None`
         - `debug_print` (bool): If `True`, prints debug messages. Default: `False`"""
         super().__init__(name, debug_print, decimal_len, simple_read, simple_max_val, analog_pin_max_val)
 
@@ -19,6 +23,17 @@ class ForceSensor(Base):
 
         # Setup pin
         self.pin = ADC(pin_num)
+        self.adc_lock = None # Lock held while reading, if the ADC is also read by the other core (see `dual_core.py`)
+        self._weighing = None # State of non-blocking weighing (see `start_weigh`)
+
+        # Load saved calibration
+        self.calibration_file = calibration_file
+        if calibration_file is not None:
+            try:
+                self.set_calibration(Calibration.load(calibration_file))
+                self.log.info('Calibration loaded from {}', calibration_file)
+            except (OSError, ValueError, KeyError) as err:
+                self.log.warning('No calibration ({}): {}', calibration_file, err)
 
         # Read initial value
         self.update()
@@ -28,7 +43,7 @@ class ForceSensor(Base):
         """Update class variables
         
         Returns:
-        - `float`: Raw value of pin"""
+        - `float`: Raw value of pin; grams (`int`) if calibrated"""
         self._last_state = self._read_raw()
 
         # Return value
@@ -37,6 +52,180 @@ class ForceSensor(Base):
     
     def _read_raw(self):
         """Read raw value from sensor and round it to `decimal_len` decimal places"""
-        raw_val = round(self.pin.read_u16(), self.decimal_len)
-        self.pprint(f'Raw value: {raw_val}')
-        return raw_val
\ No newline at end of file
+        raw_val = round(self._read_u16(), self.decimal_len)
+        self.log.debug('Raw value: {}', raw_val)
+        return raw_val
+
+
+    def read_into(self, buf, offset:int=0) -> int:
+        """Writes raw `read_u16` value to `buf[offset]`. Does not allocate memory.
+
+        Parameters:
+        - `buf` (array | list): Buffer owned by the caller
+        - `offset` (int): Index to write to. Default: `0`
+
+        Returns:
+        - `int`: Number of values written (`1`)"""
+        buf[offset] = self._read_u16()
+        return 1
+
+
+    def _read_u16(self) -> int:
+        """Reads the ADC (with `adc_lock`, if set)"""
+        lock = self.adc_lock
+        if lock is None:
+            return self.pin.read_u16()
+        with lock:
+            return self.pin.read_u16()
+
+
+    def channel_count(self) -> int:
+        """Returns number of values written by `read_into`"""
+        return 1
+
+
+    def weigh(self, window:int=9, trim:int=2, tolerance:int=300, interval_ms:int=20, start_delay_ms:int=300, timeout_ms:int=3000) -> tuple:
+        """Blocking version of `start_weigh`/`weigh_step`: sleeps until the result is ready. Arguments are the same as in `start_weigh`.
+
+        Returns:
+        - `tuple[float, bool]`: Weight (formatted like `update`) and `True` if the reading was stable"""
+        self.start_weigh(window, trim, tolerance, interval_ms, start_delay_ms, timeout_ms)
+        while True:
+            result = self.weigh_step()
+            if result is not None:
+                return result
+            sleep_ms(max(0, ticks_diff(self._weighing[4], ticks_ms()))) # Until the next sample
+
+
+    def start_weigh(self, window:int=9, trim:int=2, tolerance:int=300, interval_ms:int=20, start_delay_ms:int=300, timeout_ms:int=3000):
+        """Starts non-blocking weighing; call `weigh_step()` until it returns the result.
+
+        Samples the sensor until the reading is stable, or until timeout.
+        The last `window` samples are sorted; the reading is stable when the samples
+        (without `trim` highest and lowest) are within `tolerance` of each other.
+        The weight is the median of the window.
+
+        Parameters:
+        - `window` (int): Number of samples compared. Default: `9`
+        - `trim` (int): Highest and lowest samples left out of the stability check. Default: `2`
+        - `tolerance` (int): Max difference of the trimmed samples (raw `read_u16` units). Default: `300`
+        - `interval_ms` (int): Time between samples (in milliseconds). Default: `20`
+        - `start_delay_ms` (int): Wait before the first sample, e.g. for the servo to stop (in milliseconds). Default: `300`
+        - `timeout_ms` (int): Max time to wait for a stable reading, including `start_delay_ms` (in milliseconds). Default: `3000`"""
+        samples, ordered = self._weigh_buffers(window, trim)
+        now = ticks_ms()
+        self._weighing = [samples, ordered, 0, now, ticks_add(now, start_delay_ms), trim, tolerance, interval_ms, timeout_ms] # Count, start, next sample
+
+
+    def weigh_step(self):
+        """Takes a sample if it is time for the next one (see `start_weigh`). Does not block.
+
+        Returns:
+        - `tuple[float, bool] | None`: Weight and `True` if stable (like `weigh`) when done, else `None`"""
+        samples, ordered, count, start, next_ms, trim, tolerance, interval_ms, timeout_ms = self._weighing
+        now = ticks_ms()
+        if ticks_diff(now, next_ms) < 0:
+            return None
+
+        samples[count % len(samples)] = self._read_u16()
+        count += 1
+        stable = self._is_stable(samples, ordered, count, trim, tolerance)
+        if stable or ticks_diff(now, start) >= timeout_ms:
+            return self._weigh_result(samples, ordered, count, stable, start)
+
+        self._weighing[2] = count
+        self._weighing[4] = ticks_add(now, interval_ms)
+        return None
+
+
+    def _weigh_buffers(self, window:int, trim:int) -> tuple:
+        """Checks window and trim; returns ring buffer and sorted copy for weighing"""
+        if window < 1 or 2 * trim >= window:
+            self.praise(ValueError, f'Invalid window/trim: {window}/{trim}')
+        return array('H', bytes(2 * window)), array('H', bytes(2 * window))
+
+
+    def _is_stable(self, samples, ordered, count:int, trim:int, tolerance:int) -> bool:
+        """Returns `True` if the window is full and the trimmed samples are within `tolerance`"""
+        window = len(samples)
+        if count < window:
+            return False
+        self._sort_into(samples, ordered)
+        return ordered[window - 1 - trim] - ordered[trim] <= tolerance
+
+
+    def _weigh_result(self, samples, ordered, count:int, stable:bool, start:int) -> tuple:
+        """Returns median of the window (formatted) and `stable`"""
+        window = len(samples)
+        if count < window: # Timeout or abort before the window was full
+            ordered = sorted(samples[i] for i in range(count))
+            median = ordered[count // 2]
+        else:
+            self._sort_into(samples, ordered)
+            median = ordered[window // 2]
+
+        self._last_state = median
+        self.log.info('Weighed: {} ({}) in {} ms', median, 'stable' if stable else 'not stable', ticks_diff(ticks_ms(), start))
+        return self._format_analog_value(median), stable
+
+
+    def _sort_into(self, src, dst):
+        """Copies `src` to `dst` and sorts it (insertion sort; does not allocate)"""
+        for i in range(len(src)):
+            val = src[i]
+            j = i
+            while j > 0 and dst[j - 1] > val:
+                dst[j] = dst[j - 1]
+                j -= 1
+            dst[j] = val
+
+
+    def read_average(self, samples:int=32, interval_ms:int=5) -> int:
+        """Returns mean of raw values
+
+        Parameters:
+        - `samples` (int): Number of samples. Default: `32`
+        - `interval_ms` (int): Time between samples (in milliseconds). Default: `5`"""
+        total = 0
+        for _ in range(samples):
+            total += self._read_u16()
+            sleep_ms(interval_ms)
+        return total // samples
+
+
+    def calibrate(self, points:list, save:bool=True):
+        """Sets piecewise-linear calibration from reference weights
+
+        Parameters:
+        - `points` (list[tuple[int, int]]): `(raw, grams)` for every reference weight (at least two, e.g. empty scale and one weight)
+        - `save` (bool): If `True`, saves calibration to `calibration_file`. Default: `True`"""
+        tare = self.calibration.tare_value if self.calibration is not None else 0
+        self.set_calibration(Calibration(points, tare))
+        self.log.info('Calibrated with {} points', len(points))
+        if save:
+            self._save_calibration()
+
+
+    def tare(self, samples:int=32, save:bool=True) -> int:
+        """Sets the current reading as zero. Scale must be empty.
+
+        Parameters:
+        - `samples` (int): Number of samples averaged. Default: `32`
+        - `save` (bool): If `True`, saves calibration to `calibration_file`. Default: `True`
+
+        Returns:
+        - `int`: Tare value (in grams)"""
+        if self.calibration is None:
+            self.praise(ValueError, 'Tare needs a calibration (see `calibrate`)')
+        self.calibration.tare(self.read_average(samples))
+        self.log.info('Tare: {} g', self.calibration.tare_value)
+        if save:
+            self._save_calibration()
+        return self.calibration.tare_value
+
+
+    def _save_calibration(self):
+        """Saves calibration to `calibration_file` (if given)"""
+        if self.calibration_file is not None:
+            self.calibration.save(self.calibration_file)
+            self.log.info('Calibration saved to {}', self.calibration_file)
@@ -1,7 +1,12 @@
 # Author: Rasmus Ohert
 
+from array  import array
 from base import Base
 from machine    import Pin # type:ignore
+from utime  import ticks_us # type:ignore
+
+
+_EDGE_MASK = 0x3FFFFFFF # Edge counters wrap like ticks, so they stay small ints (no allocation in the interrupt)
 
 
 class IRSensor(Base):
@@ -19,6 +24,14 @@ class IRSensor(Base):
 
         self._last_state = self.read()
 
+        # Edge interrupts (see `enable_irq`)
+        self._on_arrive = None
+        self._edge_times = None
+        self._edge_values = None
+        self._edge_total = 0 # Edges recorded; written only by the interrupt
+        self._edge_read = 0 # Edges taken by `pop_edge`
+        self.lost_edges = 0 # Edges overwritten before `pop_edge` took them
+
     
     def update(self, get_val:str='raw') -> int|bool:
         """Updates sensor read value. 
@@ -33,7 +46,7 @@ class IRSensor(Base):
         # Check if value has changed since last udpate
         _changed = False
         if self._last_state != _current_state:
-            self.pprint(f'Changed value {self._last_state} -> {_current_state}')
+            self.log.debug('Changed value {} -> {}', self._last_state, _current_state)
             _changed = True
 
         # Update last state
@@ -54,4 +67,98 @@ class IRSensor(Base):
         Returns `True` if value is `0`, else `False`."""
         if self.pin.value() == 1:
             return False
-        return True
\ No newline at end of file
+        return True
+
+
+    def read_into(self, buf, offset:int=0) -> int:
+        """Writes raw pin value (`0` = detecting) to `buf[offset]`. Does not allocate memory.
+
+        Parameters:
+        - `buf` (array | list): Buffer owned by the caller
+        - `offset` (int): Index to write to. Default: `0`
+
+        Returns:
+        - `int`: Number of values written (`1`)"""
+        buf[offset] = self.pin.value()
+        return 1
+
+
+    def channel_count(self) -> int:
+        """Returns number of values written by `read_into`"""
+        return 1
+
+
+    def enable_irq(self, capacity:int=16):
+        """Starts recording pin edges with a (hard) pin interrupt.
+        Every edge is stored with its `ticks_us` timestamp to a ring buffer (see `pop_edge`).
+
+        Parameters:
+        - `capacity` (int): Number of edges kept. Default: `16`"""
+        self._edge_times = array('i', bytes(4 * capacity))
+        self._edge_values = array('B', bytes(capacity))
+        self._edge_total = 0
+        self._edge_read = 0
+        self._edge_cb = self._on_edge # Bound once; creating it in the interrupt would allocate
+        self.pin.irq(handler=self._edge_cb, trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, hard=True)
+        self.log.debug('Edge interrupt enabled')
+
+
+    def disable_irq(self):
+        """Stops recording pin edges"""
+        self.pin.irq(handler=None)
+        self._on_arrive = None
+
+
+    def arm(self, on_arrive=None):
+        """Sets the arrival callback.
+
+        Parameters:
+        - `on_arrive` (callable | None): Called in the interrupt as `on_arrive(edge_us)` when the sensor starts detecting.
+          Runs as a hard interrupt: must be short and must not allocate memory (e.g. `Motor.stop_fast`). Default: `None`"""
+        self._on_arrive = on_arrive
+
+
+    def disarm(self):
+        """Removes the arrival callback"""
+        self._on_arrive = None
+
+
+    def _on_edge(self, pin):
+        """Pin interrupt handler. Does not allocate memory."""
+        t = ticks_us()
+        val = pin.value()
+
+        i = self._edge_total % len(self._edge_times)
+        self._edge_times[i] = t
+        self._edge_values[i] = val
+        self._edge_total = (self._edge_total + 1) & _EDGE_MASK # Published after the slot is written (see `pop_edge`)
+
+        if val == 0 and self._on_arrive is not None: # Detecting (see `read`)
+            self._on_arrive(t)
+
+
+    def pop_edge(self):
+        """Removes and returns the oldest recorded edge. Safe against the interrupt, also from the other core:
+        only the interrupt writes `_edge_total` and only this writes `_edge_read`.
+        If `capacity` or more edges were waiting, the oldest ones are counted in `lost_edges`.
+
+        Returns:
+        - `tuple[int, int] | None`: `(ticks_us, pin value)` of the edge, or `None` if there are none"""
+        if self._edge_times is None:
+            return None
+
+        size = len(self._edge_times)
+        while True:
+            waiting = (self._edge_total - self._edge_read) & _EDGE_MASK
+            if waiting > size - 1: # The oldest slot may be being overwritten
+                self.lost_edges += waiting - (size - 1)
+                self._edge_read = (self._edge_read + waiting - (size - 1)) & _EDGE_MASK
+                continue
+            if waiting == 0:
+                return None
+
+            i = self._edge_read % size
+            edge = (self._edge_times[i], self._edge_values[i])
+            if (self._edge_total - self._edge_read) & _EDGE_MASK <= size - 1: # Not overwritten while read
+                self._edge_read = (self._edge_read + 1) & _EDGE_MASK
+                return edge
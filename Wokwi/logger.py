@@ -0,0 +1,206 @@
+# Author: Rasmus Ohert
+
+from array  import array
+from utime  import ticks_us # type:ignore
+
+
+# Levels
+DEBUG   = 10
+INFO    = 20
+WARNING = 30
+ERROR   = 40
+OFF     = 100
+
+_LEVEL_TAGS = {INFO: '', WARNING: '[WARNING] ', ERROR: '[!] Error [!]: '}
+
+_trace_sink = None # Shared binary trace sink (see `set_trace_sink`)
+
+
+def set_trace_sink(sink):
+    """Sets the binary trace sink used by `Logger.trace` of all loggers
+
+    Parameters:
+    - `sink` (TraceSink | None): Trace sink; `None` disables tracing"""
+    global _trace_sink
+    _trace_sink = sink
+
+
+def get_trace_sink():
+    """Returns the binary trace sink, or `None`"""
+    return _trace_sink
+
+
+class Logger:
+    """Leveled logger with lazy formatting.
+
+    Messages are `str.format` templates with up to three arguments, e.g. `log.debug('Raw value: {}', val)`.
+    The message is formatted only if its level is enabled. A disabled call returns after one comparison
+    and does not allocate memory (arguments are fixed, so no `*args` tuple is made).
+    For expensive arguments, check `enabled(level)` first."""
+    def __init__(self, name:str, level:int=WARNING):
+        """Initializes Logger
+
+        Parameters:
+        - `name` (str): Name printed before messages
+        - `level` (int): Lowest level printed (`DEBUG`, `INFO`, `WARNING`, `ERROR` or `OFF`). Default: `WARNING`"""
+        self.name = name
+        self.level = level
+
+
+    def set_level(self, level:int):
+        """Sets the lowest level printed
+
+        Parameters:
+        - `level` (int): `DEBUG`, `INFO`, `WARNING`, `ERROR` or `OFF`"""
+        self.level = level
+
+
+    def enabled(self, level:int) -> bool:
+        """Returns `True` if messages of the level are printed"""
+        return level >= self.level
+
+
+    def debug(self, msg:str, a=None, b=None, c=None):
+        """Prints a debug message (see class docstring for arguments)"""
+        if self.level > DEBUG:
+            return
+        self._emit(DEBUG, msg, a, b, c)
+
+
+    def info(self, msg:str, a=None, b=None, c=None):
+        """Prints an info message"""
+        if self.level > INFO:
+            return
+        self._emit(INFO, msg, a, b, c)
+
+
+    def warning(self, msg:str, a=None, b=None, c=None):
+        """Prints a warning message"""
+        if self.level > WARNING:
+            return
+        self._emit(WARNING, msg, a, b, c)
+
+
+    def error(self, msg:str, a=None, b=None, c=None):
+        """Prints an error message"""
+        if self.level > ERROR:
+            return
+        self._emit(ERROR, msg, a, b, c)
+
+
+    def _emit(self, level:int, msg:str, a, b, c):
+        """Formats and prints the message"""
+        print(f'{self.name}: {_LEVEL_TAGS.get(level, "")}{msg.format(a, b, c)}')
+
+
+    def trace_id(self, event:str) -> int:
+        """Registers a trace event in the trace sink (see `set_trace_sink`)
+
+        Parameters:
+        - `event` (str): Name of the event; the logger name is added in front
+
+        Returns:
+        - `int`: Event id for `trace`; `-1` if there is no trace sink"""
+        if _trace_sink is None:
+            return -1
+        return _trace_sink.register(f'{self.name}: {event}')
+
+
+    def trace(self, event_id:int, value:int=0):
+        """Records an event to the trace sink. Does not allocate memory; can be called from an interrupt.
+
+        Parameters:
+        - `event_id` (int): Id from `trace_id`; `-1` is ignored
+        - `value` (int): 32-bit value stored with the event. Default: `0`"""
+        sink = _trace_sink
+        if sink is None or event_id < 0:
+            return
+        sink.record(event_id, value)
+
+
+class TraceSink:
+    """Binary trace of timing-critical events in preallocated ring buffers.
+
+    Every record is `ticks_us`, event id and a 32-bit value; recording does not format text
+    or allocate memory. `dump` writes the records to a file for `Tools/trace_to_csv.py`.
+
+    File format (little-endian):
+    - `b'ITTR'`, version (`B`), number of event names (`H`)
+    - For every name: length (`B`) and UTF-8 bytes
+    - Number of records (`I`), then records: `ticks_us` (`I`), event id (`H`), value (`i`)"""
+    MAGIC = b'ITTR'
+    VERSION = 1
+
+    def __init__(self, capacity:int=512):
+        """Initializes TraceSink
+
+        Parameters:
+        - `capacity` (int): Number of records kept; older records are overwritten. Default: `512`"""
+        self._times = array('I', bytes(4 * capacity))
+        self._ids = array('H', bytes(2 * capacity))
+        self._values = array('i', bytes(4 * capacity))
+        self._capacity = capacity
+        self._names = []
+        self._head = 0
+        self._count = 0
+        self.overwritten = 0 # Records lost because the buffer was full
+
+
+    def register(self, name:str) -> int:
+        """Adds an event name; returns its id. The same name gets the same id."""
+        if name in self._names:
+            return self._names.index(name)
+        self._names.append(name)
+        return len(self._names) - 1
+
+
+    def record(self, event_id:int, value:int=0):
+        """Records an event. Does not allocate memory."""
+        i = self._head
+        self._times[i] = ticks_us()
+        self._ids[i] = event_id
+        self._values[i] = value
+        i += 1
+        if i == self._capacity:
+            i = 0
+        self._head = i
+        if self._count < self._capacity:
+            self._count += 1
+        else:
+            self.overwritten += 1
+
+
+    def clear(self):
+        """Removes all records"""
+        self._head = 0
+        self._count = 0
+        self.overwritten = 0
+
+
+    def dump(self, file_path:str) -> int:
+        """Writes event names and records (oldest first) to a file
+
+        Parameters:
+        - `file_path` (str): Path of the file
+
+        Returns:
+        - `int`: Number of records written"""
+        from struct import pack
+
+        count = self._count
+        with open(file_path, 'wb') as f:
+            f.write(self.MAGIC + pack('<BH', self.VERSION, len(self._names)))
+            for name in self._names:
+                name_bytes = name.encode('utf-8')[:255]
+                f.write(pack('<B', len(name_bytes)) + name_bytes)
+
+            f.write(pack('<I', count))
+            i = self._head - count
+            if i < 0:
+                i += self._capacity
+            for _ in range(count):
+                f.write(pack('<IHi', self._times[i], self._ids[i], self._values[i]))
+                i += 1
+                if i == self._capacity:
+                    i = 0
+        return count
@@ -0,0 +1,123 @@
+# Author: Rasmus Ohert
+
+from array  import array
+from base import Base
+from utime  import sleep_ms, sleep_us, ticks_us, ticks_add, ticks_diff # type:ignore
+
+
+class LoopTimer(Base):
+    """Runs a loop at a fixed period against absolute deadlines and measures its timing.
+
+    Call `begin()` at the start of every iteration and `wait()` at the end. `wait` sleeps until
+    the next deadline (previous deadline + period), so the period does not drift with the work
+    done in the loop. Wake-up jitter (time after the deadline) and work time are counted in
+    histograms; an iteration that ends after its deadline is an overrun. If the loop is more than
+    one period late, missed periods are skipped instead of run back to back.
+
+    Times are measured with `ticks_us`, so jitter below one millisecond is visible."""
+    def __init__(self, period_ms:int, bins_us:tuple=(100, 500, 1000, 2000, 5000, 10000, 50000), name:str='Loop timer', debug_print:bool=False):
+        """Initializes LoopTimer
+
+        Parameters:
+        - `period_ms` (int): Loop period (in milliseconds)
+        - `bins_us` (tuple[int]): Upper limits of the histogram bins (in microseconds); one more bin counts larger values. Default: `(100, 500, 1000, 2000, 5000, 10000, 50000)`
+        - `name` (str): Name of class instance. Default: 'Loop timer'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        self.period_ms = period_ms
+        self.bins_us = tuple(bins_us)
+        self.jitter_hist = array('I', bytes(4 * (len(self.bins_us) + 1)))
+        self.work_hist = array('I', bytes(4 * (len(self.bins_us) + 1)))
+
+        self._deadline = ticks_us()
+        self._begin_us = self._deadline
+        self.reset()
+
+
+    def reset(self):
+        """Clears the statistics and starts the schedule from now"""
+        for i in range(len(self.jitter_hist)):
+            self.jitter_hist[i] = 0
+            self.work_hist[i] = 0
+        self.iterations = 0
+        self.overruns = 0 # Iterations that ended after their deadline
+        self.skipped = 0 # Periods skipped because the loop was too late
+        self.max_jitter_us = 0
+        self.max_work_us = 0
+        self._deadline = ticks_us()
+
+
+    def set_period(self, period_ms:int):
+        """Changes the period; takes effect from the next deadline
+
+        Parameters:
+        - `period_ms` (int): Loop period (in milliseconds)"""
+        self.period_ms = period_ms
+
+
+    def begin(self):
+        """Marks the start of an iteration and records its wake-up jitter"""
+        now = ticks_us()
+        self._begin_us = now
+        jitter = ticks_diff(now, self._deadline)
+        if jitter < 0:
+            jitter = 0
+        self._count(self.jitter_hist, jitter)
+        if jitter > self.max_jitter_us:
+            self.max_jitter_us = jitter
+        self.iterations += 1
+
+
+    def wait(self):
+        """Records the work time of the iteration and sleeps until the next deadline"""
+        now = ticks_us()
+        work = ticks_diff(now, self._begin_us)
+        self._count(self.work_hist, work)
+        if work > self.max_work_us:
+            self.max_work_us = work
+
+        period_us = self.period_ms * 1000
+        self._deadline = ticks_add(self._deadline, period_us)
+        remaining = ticks_diff(self._deadline, now)
+        if remaining > 0:
+            if remaining >= 1000:
+                sleep_ms(remaining // 1000)
+            sleep_us(remaining % 1000)
+            return
+
+        self.overruns += 1
+        if remaining < -period_us: # Too late; skip the missed periods
+            self.skipped += -remaining // period_us
+            self._deadline = now
+
+
+    def _count(self, hist, value:int):
+        """Adds a value to a histogram"""
+        bins = self.bins_us
+        i = 0
+        while i < len(bins) and value > bins[i]:
+            i += 1
+        hist[i] += 1
+
+
+    def get_stats(self) -> dict:
+        """Returns the statistics since `reset`
+
+        Returns:
+        - `dict`: `iterations`, `overruns`, `skipped`, `max_jitter_us`, `max_work_us`, `bins_us`, `jitter_hist`, `work_hist` (lists)"""
+        return {
+            'iterations': self.iterations,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'max_jitter_us': self.max_jitter_us,
+            'max_work_us': self.max_work_us,
+            'bins_us': list(self.bins_us),
+            'jitter_hist': list(self.jitter_hist),
+            'work_hist': list(self.work_hist),
+        }
+
+
+    def get_bin_labels(self) -> list:
+        """Returns labels of the histogram bins, e.g. `'<=100 us'` and `'>50000 us'`"""
+        return [f'<={edge} us' for edge in self.bins_us] + [f'>{self.bins_us[-1]} us']
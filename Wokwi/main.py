@@ -1,20 +1,33 @@
 # Author: Rasmus Ohert
 
+import _thread
 import uasyncio as asyncio # type:ignore
 
-from machine import Pin, Timer # type:ignore
-from utime   import sleep # type:ignore
+from array   import array
+from machine import Pin, Timer, idle # type:ignore
+from utime   import ticks_ms, ticks_us, ticks_diff # type:ignore
 
 from three_axis_accelerometer   import Accelerometer
+from adc_sampler    import ADCSampler
+from dual_core  import CoreWorker
 from running_and_error_leds     import RunningAndErrorLEDs
 from start_stop_latch   import StartStopLatch
-from csv_file_editor    import CSVFileEditor
+from binary_log_editor  import BinaryLogEditor
+from rotating_csv_file_editor   import RotatingCSVFileEditor, split_segment_path, find_last_segment_num
+from event_logger   import EventLogger
 from force_sensor   import ForceSensor
 from ir_sensor  import IRSensor
 from sdcard     import SDCardSetup
 from motor  import Motor
+from sensor_group   import SensorGroup
 from servo  import Servo
+from state_machine  import StateMachine
+from state_profiler import StateProfiler
+from window_aggregator  import WindowAggregator
+from vibration_spectrum import VibrationSpectrum
 from base   import Base
+from logger import TraceSink, set_trace_sink, get_trace_sink
+from loop_timer import LoopTimer
 
 
 # Onboard LED; toggles every second
@@ -30,23 +43,58 @@ RUNNING_LED, ERROR_LED = RunErrLeds.get_leds()
 
 class Itsetuhokone(Base):
     """Main class for Itsetuhokone project."""
-    def __init__(self, sleep_time:float=0.3, csv_add_timer:bool=True, debug_print:bool=False):
+    def __init__(self, sleep_time:float=0.3, tick_ms:int=10, move_timeout_s:int=30, csv_add_timer:bool=True, csv_buffer_size:int=2048, csv_segment_size:int=1000000, csv_segment_time_s:int=3600, csv_index_every:int=20, log_window_ms:int=1000, sample_rate_hz:int=100, fft_size:int=256, fft_bands:list=((2, 5), (5, 10), (10, 20), (20, 35), (35, 50)), log_format:str='csv', event_log:bool=True, trace_capacity:int=0, dual_core:bool=False, cycle_stats:bool=True, debug_print:bool=False):
         """Initializes class.
 
         Parameters:
-        - `sleep_time` (float): Sleep time between loops. Default: `0.3`
+        - `sleep_time` (float): Loop period while idle and the servo is not moving (in seconds). Default: `0.3`
+        - `tick_ms` (int): Loop period while running; every loop runs one step of the sequence (in milliseconds). Loop timing is printed and logged when stopping (see `LoopTimer`). Default: `10`
+        - `move_timeout_s` (int): Max time for one conveyor move; if the product does not arrive, the conveyor is stopped and an error is raised (in seconds). Default: `30`
+        - `csv_add_timer` (bool): If `True`, adds time column to CSV file. Default: `True`
+        - `csv_buffer_size` (int): Size of CSV RAM buffer (in bytes). `0` disables buffering. Default: `2048`
+        - `csv_segment_size` (int): Max size of one CSV segment (in bytes). Default: `1000000`
+        - `csv_segment_time_s` (int): Max time one CSV segment is written to (in seconds). Default: `3600`
+        - `csv_index_every` (int): Rows between time index entries (see `CSVFileEditor.read_range`). `0` disables the index. Default: `20`
+        - `log_window_ms` (int): Sensors are read on every loop and summarized (min/max/mean, IR changes, vibration RMS/peak-to-peak/crest factor) into one log row per window (in milliseconds). `0` logs single raw reads once per second instead. Default: `1000`
+        - `sample_rate_hz` (int): Analog channels (force sensor, accelerometer) are sampled at this fixed rate with a timer and fed to the log window. `0` reads them once per loop. Needs `log_window_ms`. Default: `100`
+        - `fft_size` (int): Accelerometer samples per FFT window (power of two). Band RMS values of the latest window are added to every log row. `0` disables. Needs `sample_rate_hz`. Default: `256`
+        - `fft_bands` (list[tuple[float, float]]): Frequency bands of the FFT (in Hz). Default: `((2, 5), (5, 10), (10, 20), (20, 35), (35, 50))`
+        - `log_format` (str): Format of the sensor log. Default: `'csv'`
+            - `'csv'`: Text rows in `sd/sensor_data_NNNN.csv` segments
+            - `'bin'`: Binary records in `sd/sensor_data_NNNN.bin`, one file per boot (see `binary_log_editor.py`)
+        - `event_log` (bool): If `True`, IR sensor and start/stop changes are also logged as timestamped events to `sd/events_NNNN.csv`. Default: `True`
+        - `trace_capacity` (int): Number of timing events kept in the binary trace (moves, IR stops, stop presses, log rows); written to `sd/trace.bin` when stopping (see `Tools/trace_to_csv.py`). `0` disables. Default: `0`
+        - `dual_core` (bool): If `True`, the second core samples the analog channels and writes all logs to the SD card, so slow SD writes never delay the state machine or a stop. Needs `sample_rate_hz`. Default: `False`
+        - `cycle_stats` (bool): If `True`, time spent in every state of the sequence is measured; one row per sequence cycle is written to `sd/cycle_stats_NNNN.csv` and min/mean/max are printed when stopping (see `StateProfiler`). Default: `True`
         - `debug_print` (bool): If `True`, prints debug messages. Default: `False`"""
         super().__init__('Itsetuhokone', debug_print=debug_print)
 
-        self.pprint('Initializing')
-
-        self.sleep_time = sleep_time # Sleep time between loops
+        # Binary trace of timing-critical events
+        if trace_capacity:
+            set_trace_sink(TraceSink(trace_capacity))
+        self._tr_move = self.log.trace_id('move start')
+        self._tr_moved = self.log.trace_id('move done ms')
+        self._tr_ir_stop = self.log.trace_id('IR stop latency us')
+        self._tr_stop_press = self.log.trace_id('stop press')
+        self._tr_log_row = self.log.trace_id('log row')
+        self._tr_weigh = self.log.trace_id('weight')
+
+        self.log.debug('Initializing')
+
+        self.sleep_time = sleep_time # Loop period (idle)
+        self.tick_ms = tick_ms # Loop period (running)
+        self._led_ms = ticks_ms() # Last toggle of the running LED while idle
+        self.loop_timer = LoopTimer(int(sleep_time * 1000), name='Pääsilmukka', debug_print=self.debug_print) # Fixed period; measures jitter and overruns
+        self.move_timeout_ms = move_timeout_s * 1000
         
         self.state = 0 # Set starting state (0 = Idle)
 
+        self.last_weight = None # Result of the last weighing (see `_step_weigh`)
+        self.last_weight_stable = False
+
         # Moottorit
         self.kuljetin = Motor(0, 1, 'Kuljetin', debug_print=self.debug_print) # Kuljetin moottori
-        self.servo = Servo(22, name='Vaaka moottori', min_pos_val=4500, max_pos_val=7150, debug_print=self.debug_print) # Vaaka moottori
+        self.servo = Servo(22, name='Vaaka moottori', min_pos_val=4500, max_pos_val=7150, speed=5000, accel=25000, profile='s-curve', debug_print=self.debug_print) # Vaaka moottori; liikkeet päivitetään silmukassa (see `_run_loop`)
 
         # IR anturit
         self.ir_a1 = IRSensor(6, 'Anturi a1', debug_print=self.debug_print)
@@ -55,23 +103,125 @@ class Itsetuhokone(Base):
         self.ir_b2 = IRSensor(9, 'Anturi b2', debug_print=self.debug_print)
 
         # Vaaka anturi (voima-anturi)
-        self.vaaka = ForceSensor(28, 'Vaaka', debug_print=self.debug_print)
+        self.vaaka = ForceSensor(28, 'Vaaka', calibration_file='vaaka_kalibrointi.json', debug_print=self.debug_print) # Grammoina, jos kalibroitu (calibrate_force_sensor.py)
 
         # Värinä anturi
         self.accelerometer = Accelerometer(x_pin=26, y_pin=27, name='Värinä anturi', debug_print=self.debug_print)
 
         # Listaa kaikki anturit
-        self.sensor_lst = [self.ir_a1, self.ir_a2, self.ir_b1, self.ir_b2, self.vaaka, self.accelerometer]
-
-        # Start/Stop napit
+        self.ir_lst = [self.ir_a1, self.ir_a2, self.ir_b1, self.ir_b2]
+
+        # IR anturien keskeytykset; kuljetin pysäytetään jo keskeytyksessä (see `_stop_at_target`)
+        for ir in self.ir_lst:
+            ir.enable_irq()
+        self._target_irs = [] # IR sensors the current move waits for
+        self._stop_at_target_cb = self._stop_at_target # Bound once; used in the interrupt
+        self.stop_latency_us = 0 # Last time from IR edge to conveyor stop
+        self.stop_latency_max_us = 0
+        self._stopped_in_irq = False
+        self._stop_us = 0
+        self._stop_edge_us = 0
+        self.sensor_lst = self.ir_lst + [self.vaaka, self.accelerometer]
+
+        # Kaikkien anturien luku yhdellä kutsulla valmiiksi varattuun taulukkoon (see `_read_sensor_values`)
+        self.sensor_group = SensorGroup(self.sensor_lst, name='Anturit', debug_print=self.debug_print)
+        self.ir_group = SensorGroup(self.ir_lst, name='IR anturit', debug_print=self.debug_print)
+
+        # Start/Stop napit; stop pysäyttää kuljettimen jo keskeytyksessä
         self.start_stop = StartStopLatch(10, 11, name='Start/Stop napit', debug_print=self.debug_print)
+        self._on_stop_press_cb = self._on_stop_press # Bound once; used in the interrupt
+        self.start_stop.enable_irq(on_stop=self._on_stop_press_cb)
+        self._stop_pending = False # Stop pressed; latencies not reported yet
+        self._stop_press_us = 0
+        self._stop_motor_us = 0
+        self._abort_us = 0
+        self.press_stop_latency_max_us = 0 # Stop press -> conveyor stopped
+        self.abort_latency_max_us = 0 # Stop press -> running routine aborted
 
         # SD kortti ja CSV tiedosto
         SDCardSetup(5, 2, 3, 4)
-        _header_lst = [sensor.get_name() for sensor in self.sensor_lst]
-        self.data_history_csv = CSVFileEditor('sd/sensor_data.csv', _header_lst, add_timer=csv_add_timer, debug_print=self.debug_print)
-
-        self.pprint('Initialized')
+        self.log_format = log_format
+
+        # Sensor channels as flat integers (see `_read_sensor_values`)
+        _sensor_channels = [(ir.get_name(), 'digital') for ir in self.ir_lst]
+        _sensor_channels.append((self.vaaka.get_name(), 'analog'))
+        _sensor_channels += [(f'{self.accelerometer.get_name()} {axis}', 'vibration') for axis in 'xyz']
+
+        # Windowed aggregation; log is written once per window
+        self.aggregator = None
+        _write_wait_time_s = 1
+        if log_window_ms:
+            self.aggregator = WindowAggregator(_sensor_channels, window_ms=log_window_ms, debug_print=self.debug_print)
+            _channel_lst = self.aggregator.get_channels()
+            _write_wait_time_s = 0
+        else:
+            _channel_lst = [(name, 'B' if kind == 'digital' else 'H') for name, kind in _sensor_channels]
+
+        # Värinän taajuuskaistat (FFT); tarvitsee tasaisen näytteistyksen
+        self.spectrum = None
+        if sample_rate_hz and self.aggregator is not None and fft_size:
+            # Sampled rows are force sensor, x, y, z; only connected axes are used
+            _fft_axes = [(f'{self.accelerometer.get_name()} {axis}', 1 + i) for i, axis in enumerate('xyz') if self.accelerometer._xyz_pins[i] is not None]
+            self.spectrum = VibrationSpectrum(_fft_axes, size=fft_size, rate_hz=sample_rate_hz, bands=fft_bands, debug_print=self.debug_print)
+            _channel_lst += self.spectrum.get_channels()
+
+        # Ajon tunniste: aika (ticks_ms) alkaa nollasta joka käynnistyksessä, joten kaikkiin tämän käynnistyksen lokeihin
+        # kirjoitetaan sama tunniste (= sensoriloki tiedoston numero)
+        self.run_id = find_last_segment_num(*split_segment_path(f'sd/sensor_data.{log_format}')) + 1
+
+        if log_format == 'csv':
+            _header_lst = [name for name, _ in _channel_lst] if self.aggregator else [sensor.get_name() for sensor in self.sensor_lst]
+            self.data_history_csv = RotatingCSVFileEditor('sd/sensor_data.csv', _header_lst, max_segment_bytes=csv_segment_size, max_segment_time_s=csv_segment_time_s,
+                                                          write_wait_time_s=_write_wait_time_s, add_timer=csv_add_timer, buffer_size=csv_buffer_size,
+                                                          index_every_n_rows=csv_index_every if csv_add_timer else 0, run_id=self.run_id, debug_print=self.debug_print)
+        elif log_format == 'bin':
+            self.data_history_csv = BinaryLogEditor('sd/sensor_data.bin', _channel_lst, write_wait_time_s=_write_wait_time_s, add_timer=csv_add_timer,
+                                                    buffer_size=csv_buffer_size, debug_print=self.debug_print)
+        else:
+            self.straise(ValueError, f'Invalid log format: {log_format}')
+
+        # Analogisten anturien näytteistys ajastimella (voima-anturi, kiihtyvyysanturi x/y/z)
+        self.sampler = None
+        self.worker = None
+        if sample_rate_hz and self.aggregator is not None:
+            _adc_pins = [self.vaaka.pin] + self.accelerometer._xyz_pins
+            self._sample_row = array('H', bytes(2 * len(self.sensor_group))) # IR values + sampled analog values
+            self._add_sample_cb = self._add_sample # Bound once; used for every sample
+            if dual_core:
+                # Toinen ydin näytteistää ja kirjoittaa lokit SD kortille (see `_core1_step`)
+                self._adc_pins = _adc_pins
+                self._adc_row = [0] * len(_adc_pins)
+                self._adc_lock = _thread.allocate_lock() # ADC is also read by the first core when weighing
+                self.vaaka.adc_lock = self._adc_lock
+                self.worker = CoreWorker(self._core1_step, 1000000 // sample_rate_hz, handle=self._core1_handle, name='Ydin 1', debug_print=self.debug_print)
+            else:
+                self.sampler = ADCSampler(_adc_pins, rate_hz=sample_rate_hz, debug_print=self.debug_print)
+        elif dual_core:
+            self.straise(ValueError, 'Dual core mode needs log_window_ms and sample_rate_hz')
+
+        # Tapahtumaloki; IR anturien ja start/stop tilan muutokset
+        self.event_log = None
+        if event_log:
+            _event_channels = [(ir.get_name(), ir.pin.value, ir) for ir in self.ir_lst] # IR changes from the interrupt edges
+            _event_channels.append((self.start_stop.get_name(), lambda: self.start_stop.state))
+            self.event_log = EventLogger('sd/events.csv', _event_channels, buffer_size=csv_buffer_size, run_id=self.run_id, debug_print=self.debug_print)
+
+        # Tilojen kestot sykleittäin (23 -> 39 ensimmäisellä kierroksella, sitten 31 -> 39)
+        self.profiler = None
+        self.stats_csv = None
+        if cycle_stats:
+            self.profiler = StateProfiler([23, 31, 32, 34, 35, 36, 38, 39], cycle_end=39, on_cycle=self._on_cycle, name='Syklit', debug_print=self.debug_print)
+            self.stats_csv = RotatingCSVFileEditor('sd/cycle_stats.csv', self.profiler.get_headers(), write_wait_time_s=0, timer_decimals=3,
+                                                   buffer_size=csv_buffer_size, run_id=self.run_id, debug_print=self.debug_print)
+
+        # Sekvenssi tilakoneena (see `_build_sequence`)
+        self._move_start = None # Start time of the current move; `None` if not moving
+        self._run_func = None # Starts the conveyor of the current move; `None` once running (see `_run_conveyor`)
+        self._move_name = ''
+        self.sequence = StateMachine(0, name='Sekvenssi', on_change=self._on_state_change, debug_print=self.debug_print)
+        self._build_sequence(self.sequence)
+
+        self.log.debug('Initialized')
 
 
     def stprint(self, text):
@@ -88,145 +238,556 @@ class Itsetuhokone(Base):
         Parameters:
         - `raise_as` (Exception): Exception to raise
         - `text` (str): Error message to print"""
-        self.pprint(f'[!] Error [!]: {text}')
+        self.log.error('{}', text)
         raise raise_as(text)
 
     
+    def _read_sensor_values(self):
+        """Reads all sensors as raw integers: IR sensors, force sensor, accelerometer x, y and z.
+        Does not allocate memory; returns the same `array` on every call (see `SensorGroup.read`)."""
+        return self.sensor_group.read()
+
+
     def _update_csv_data(self):
-        """Updates data to CSV file"""
-        _data_lst = [sensor.update() for sensor in self.sensor_lst] # Reads values from sensors
+        """Updates data to CSV (or binary) file"""
+        if self.sampler is not None:
+            # IR values are read now; analog values come from the timed samples
+            self.ir_group.read_into(self._sample_row)
+            self.sampler.drain(self._add_sample_cb)
+            return
+
+        if self.aggregator is not None:
+            _row = self.aggregator.add(self._read_sensor_values())
+            if _row is not None: # Window complete
+                self._append_log_row(_row)
+            return
+
+        if self.log_format == 'bin':
+            _data_lst = self._read_sensor_values()
+        else:
+            _data_lst = [sensor.update() for sensor in self.sensor_lst] # Reads values from sensors
         self.data_history_csv.append_data(_data_lst) # Appends data to CSV file
 
-    
-    def _lift_and_weigh(self):
-        self.stprint('Weigh...')
-        sleep(1)
-        self.servo.move_to_pos('max')
+
+    def _add_sample(self, adc_row:list):
+        """Adds one timed analog sample (with the latest IR values) to the log window
         
-        sleep(3) # Hold, to make sure the weight is measured correctly
+        Parameters:
+        - `adc_row` (list[int]): Force sensor and accelerometer x, y, z values"""
+        _row = self._sample_row
+        _offset = len(self.ir_lst)
+        for i in range(len(adc_row)):
+            _row[_offset + i] = adc_row[i]
 
-        self.servo.move_to_pos('min')
-        sleep(1)
+        if self.spectrum is not None:
+            self.spectrum.add(adc_row)
 
-    
-    def _move_to_start(self):
-        """Moves to start position (A1)"""
-        self.stprint('Moving to start position')
-        while not self.ir_a1.read():
-            self.kuljetin.run_cw()
+        _row = self.aggregator.add(_row)
+        if _row is not None: # Window complete
+            self._append_log_row(_row)
 
-        self.kuljetin.stop_all()
-        self.stprint('At start position')
 
-    
-    def _move_to_end(self):
-        """Moves to end position (B2)"""
-        self.stprint('Moving to end position')
-        while not self.ir_b1.read():
-            self.kuljetin.run_ccw()
+    def _append_log_row(self, row:list):
+        """Appends an aggregated row (and the latest vibration band values) to the log
+        
+        Parameters:
+        - `row` (list[int]): Row returned by the aggregator"""
+        if self.spectrum is not None:
+            row += self.spectrum.latest()
+        self.data_history_csv.append_data(row)
+        self.log.trace(self._tr_log_row)
+
+
+    def _core1_step(self):
+        """Second core (dual core mode): reads one sample of all channels to the log window and logs changed events"""
+        self.ir_group.read_into(self._sample_row)
+        _row = self._adc_row
+        with self._adc_lock:
+            for i in range(len(self._adc_pins)):
+                _pin = self._adc_pins[i]
+                _row[i] = _pin.read_u16() if _pin is not None else 0
+        self._add_sample(_row)
+        self._step_spectrum(self.worker.period_us)
+        self._check_events()
+        self._service_files()
+
+
+    def _core1_handle(self, item:tuple):
+        """Second core (dual core mode): handles an item posted by the first core
 
-        self.kuljetin.stop_all()
-        self.stprint('At end position')
+        Parameters:
+        - `item` (tuple): `('event', channel, value)`, `('stats', row)` or `('flush',)`"""
+        if item[0] == 'event':
+            self.event_log.log_event(item[1], item[2])
+        elif item[0] == 'stats':
+            self.stats_csv.append_data(item[1])
+        elif item[0] == 'flush':
+            self._flush_log()
+            self._dump_trace()
+
+
+    def _log_event(self, channel:str, value:int):
+        """Logs a single event to the event log (if enabled); in dual core mode it is written by the second core"""
+        if self.event_log is None:
+            return
+        if self.worker is not None and self.worker.is_running():
+            self.worker.post(('event', channel, value))
+        else:
+            self.event_log.log_event(channel, value)
+
+
+    def _request_flush(self):
+        """Flushes the logs and writes the trace; in dual core mode on the second core"""
+        if self.worker is not None and self.worker.is_running():
+            self.worker.post(('flush',))
+        else:
+            self._flush_log()
+            self._dump_trace()
+
+
+    def _service_logging(self, period_ms:int):
+        """Reads sensors / drains timed samples to the log and checks events. In dual core mode only raises errors of the second core.
 
-    
-    def _move_to_middle(self, from_pos:str):
-        """Moves to middle position (from `A` or `B`)
-        
         Parameters:
-        - `from_pos` (str): Position to move from (`A` or `B`)"""
-        self.stprint('Moving to middle position')
-        while not all([ir.read() for ir in [self.ir_a2, self.ir_b2]]):
-            if from_pos == 'A':
-                self.kuljetin.run_ccw()
-            elif from_pos == 'B':
-                self.kuljetin.run_cw()
-            else:
-                self.kuljetin.stop_all()
-                self.straise(ValueError, f'Invalid from_pos: {from_pos}')
+        - `period_ms` (int): Period of the calling loop (in milliseconds); limits the time of the vibration spectrum step"""
+        if self.worker is not None:
+            self.worker.check()
+            return
+        self._update_csv_data()
+        self._step_spectrum(period_ms * 1000)
+        self._check_events()
+        self._service_files()
+
+
+    def _step_spectrum(self, period_us:int):
+        """Processes the queued vibration window for a quarter of the loop period, so one window is spread over several loops
 
+        Parameters:
+        - `period_us` (int): Period of the calling loop (in microseconds)"""
+        if self.spectrum is not None:
+            self.spectrum.step(period_us // 4)
+
+
+    def _service_files(self):
+        """Flushes log data that is due by the flush policy or max age, also when no rows are written (see `CSVFileEditor.service`)"""
+        self.data_history_csv.service()
+        if self.event_log is not None:
+            self.event_log.service()
+        if self.stats_csv is not None:
+            self.stats_csv.service()
+
+
+    def _check_events(self):
+        """Logs changed IR sensor and start/stop values to the event log"""
+        if self.event_log is not None:
+            self.event_log.check()
+
+
+    def _flush_log(self):
+        """Writes the unfinished aggregation window and buffered log data to file"""
+        if self.sampler is not None:
+            self._update_csv_data() # Drain waiting samples to the window
+        if self.aggregator is not None:
+            _row = self.aggregator.pop_row()
+            if _row is not None:
+                self._append_log_row(_row)
+        self.data_history_csv.flush()
+        if self.event_log is not None:
+            self.event_log.flush()
+        if self.stats_csv is not None:
+            self.stats_csv.flush()
+
+    
+    def _record_weight(self, weight, stable:bool):
+        """Stores, prints and logs a weighing result"""
+        self.last_weight = weight
+        self.last_weight_stable = stable
+        self.log.trace(self._tr_weigh, int(weight))
+        self.stprint(f'Weight: {weight}' + ('' if stable else ' (not stable)'))
+        self._log_event(f'{self.vaaka.get_name()} paino', weight)
+        self._log_event(f'{self.vaaka.get_name()} vakaa', stable)
+
+
+    def _at_target(self) -> bool:
+        """Returns `True` if all IR sensors of the current move detect the product. Does not allocate memory."""
+        for ir in self._target_irs:
+            if ir.pin.value() != 0:
+                return False
+        return True
+
+
+    def _stop_at_target(self, edge_us:int):
+        """IR interrupt callback; stops the conveyor when the product is at the target"""
+        if self._at_target():
+            self.kuljetin.stop_fast()
+            self._stop_us = ticks_us()
+            self._stop_edge_us = edge_us
+            self._stopped_in_irq = True
+            self.log.trace(self._tr_ir_stop, ticks_diff(self._stop_us, edge_us))
+
+
+    def _at_target_now(self, irs:list) -> bool:
+        """Sets the sensors of the next move; returns `True` if the product is already there"""
+        self._target_irs = irs
+        return self._at_target()
+
+
+    def _start_move(self, irs:list, run_func) -> int:
+        """Arms the IR interrupts and starts the conveyor (see `_enter_move`)
+
+        Returns:
+        - `int`: Start time of the move (`ticks_ms`)"""
+        self._stopped_in_irq = False
+        for ir in irs:
+            ir.arm(self._stop_at_target_cb)
+        self.log.trace(self._tr_move, self.state)
+        self._run_func = run_func
+        self._run_conveyor()
+        return ticks_ms()
+
+
+    def _run_conveyor(self):
+        """Starts the conveyor of the current move once the motor dead-time has passed (see `Motor.run_cw`); call on every tick.
+        Not started if stop has been pressed, so a stop during the dead-time is not overridden."""
+        if self._run_func is None:
+            return
+        if not self.start_stop.state: # Stopped in the interrupt; the loop returns to idle
+            self._run_func = None
+        elif self._run_func():
+            self._run_func = None
+
+
+    def _end_move(self, irs:list, start:int, arrived:bool):
+        """Stops the conveyor, disarms the IR interrupts and reports the stop latency if the product arrived
+
+        Parameters:
+        - `irs` (list[IRSensor]): Sensors of the move
+        - `start` (int): Start time of the move (`ticks_ms`)
+        - `arrived` (bool): `True` if the product arrived"""
+        self._run_func = None
+        self.kuljetin.stop_all() # If arrived, already stopped in the interrupt; makes sure if an edge was missed
+        for ir in irs:
+            ir.disarm()
+        if not arrived:
+            return
+
+        # Stop latency: from the IR edge to the conveyor stop
+        if self._stopped_in_irq:
+            latency = ticks_diff(self._stop_us, self._stop_edge_us)
+        else: # Edge missed; stopped by the loop
+            latency = -1
+        self.stop_latency_us = latency
+        self.stop_latency_max_us = max(self.stop_latency_max_us, latency)
+        self.log.trace(self._tr_moved, ticks_diff(ticks_ms(), start))
+        self.stprint(f'Moved in {ticks_diff(ticks_ms(), start)} ms, stop latency {latency} us (max {self.stop_latency_max_us} us)')
+        self._log_event('Pysäytysviive us', latency)
+
+
+    def _on_stop_press(self, press_us:int):
+        """Stop button interrupt callback; stops the conveyor right away"""
+        self.kuljetin.stop_fast()
+        self._stop_motor_us = ticks_us()
+        self._stop_press_us = press_us
+        self._stop_pending = True
+        self.log.trace(self._tr_stop_press)
+
+
+    def _aborted(self) -> bool:
+        """Returns `True` if stop has been pressed (latch reset); running routines must return"""
+        if self.start_stop.state:
+            return False
+        if self._stop_pending and not self._abort_us:
+            self._abort_us = ticks_us()
+        return True
+
+
+    def _report_stop_latency(self):
+        """Prints and logs stop press latencies (press -> conveyor stop, press -> routine abort)"""
+        if not self._stop_pending:
+            return
+        self._stop_pending = False
+
+        motor_us = ticks_diff(self._stop_motor_us, self._stop_press_us)
+        abort_us = ticks_diff(self._abort_us, self._stop_press_us) if self._abort_us else -1
+        self._abort_us = 0
+
+        self.press_stop_latency_max_us = max(self.press_stop_latency_max_us, motor_us)
+        self.abort_latency_max_us = max(self.abort_latency_max_us, abort_us)
+        self.stprint(f'Stop latency: conveyor {motor_us} us (max {self.press_stop_latency_max_us} us), abort {abort_us} us (max {self.abort_latency_max_us} us)')
+        self._log_event('Stop -> kuljetin us', motor_us)
+        self._log_event('Stop -> keskeytys us', abort_us)
+
+
+    def _stop(self):
+        """Stops the machine after stop was pressed and returns to idle"""
+        RUNNING_LED.off()
+        self.state = 0
+        self.stprint('Stopping')
         self.kuljetin.stop_all()
-        self.stprint('At middle position')
+        self.servo.start_move('min') # Lowered by the loop, if it was up
+        self._report_stop_latency()
+        self._report_relay_wear()
+        self._report_loop_timing()
+        self._report_cycle_times()
+        self._request_flush()
+
+
+    def _report_loop_timing(self):
+        """Prints and logs main loop timing since the last report (overruns, max jitter and work time, histograms)"""
+        timer = self.loop_timer
+        if not timer.iterations:
+            return
+
+        labels = timer.get_bin_labels()
+        self.stprint(f'Loop: {timer.iterations} iterations, {timer.overruns} overruns, {timer.skipped} skipped, max jitter {timer.max_jitter_us} us, max work {timer.max_work_us} us')
+        self.stprint('Loop jitter: ' + ', '.join(f'{labels[i]}: {timer.jitter_hist[i]}' for i in range(len(labels))))
+        self.stprint('Loop work:   ' + ', '.join(f'{labels[i]}: {timer.work_hist[i]}' for i in range(len(labels))))
+
+        self._log_event('Silmukka ylitykset', timer.overruns)
+        self._log_event('Silmukka ohitetut', timer.skipped)
+        self._log_event('Silmukka max jitter us', timer.max_jitter_us)
+        self._log_event('Silmukka max työ us', timer.max_work_us)
+        if self.spectrum is not None: # Windows not processed before the next one was full (since boot)
+            self.stprint(f'Vibration: last window {self.spectrum.compute_ms} ms, {self.spectrum.late_windows} late windows')
+            self._log_event('Värähtely myöhässä', self.spectrum.late_windows)
+        for i in range(len(labels)):
+            if timer.jitter_hist[i]:
+                self._log_event(f'Silmukka jitter {labels[i]}', timer.jitter_hist[i])
+            if timer.work_hist[i]:
+                self._log_event(f'Silmukka työ {labels[i]}', timer.work_hist[i])
+        timer.reset()
+
+
+    def _report_cycle_times(self):
+        """Prints min/mean/max time of every profiled state and of the whole cycle (since boot)"""
+        if self.profiler is None or not self.profiler.cycles:
+            return
+        self.stprint(f'Cycle times ({self.profiler.cycles} cycles, {self.profiler.interrupted_cycles} interrupted), min/mean/max ms:')
+        for state, count, min_us, mean_us, max_us in self.profiler.get_stats():
+            self.stprint(f'  {state}: {min_us // 1000}/{mean_us // 1000}/{max_us // 1000} ({count})')
+
+
+    def _report_relay_wear(self):
+        """Prints and logs conveyor relay switch cycles since boot"""
+        cw, ccw = self.kuljetin.get_switch_counts()
+        self.stprint(f'Relay switch cycles: cw {cw}, ccw {ccw}')
+        self._log_event(f'{self.kuljetin.get_name()} rele cw', cw)
+        self._log_event(f'{self.kuljetin.get_name()} rele ccw', ccw)
 
 
     def run(self):
-        """Runs main code"""
-        self.pprint('Running...')
-
+        """Runs main code. Log file is flushed and closed when the loop stops or raises."""
+        self.log.debug('Running...')
+
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.worker is not None:
+            self.worker.start()
+
+        try:
+            self._run_loop()
+        finally:
+            self._close()
+
+
+    def _close(self):
+        """Stops sampling, flushes and closes the logs and writes the trace"""
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.worker is not None:
+            self.worker.stop()
+        self._report_loop_timing()
+        self._flush_log()
+        self.data_history_csv.close()
+        if self.event_log is not None:
+            self.event_log.close()
+        if self.stats_csv is not None:
+            self.stats_csv.close()
+        self._dump_trace()
+
+
+    def _dump_trace(self):
+        """Writes the binary trace to `sd/trace.bin` (if enabled)"""
+        sink = get_trace_sink()
+        if sink is not None:
+            count = sink.dump('sd/trace.bin')
+            self.log.info('{} trace records written', count)
+
+
+    def _run_loop(self):
+        """Main loop; runs one non-blocking step of the sequence per loop"""
+        self.sequence.start()
+        self.stprint('Idle')
+        self.loop_timer.reset()
         while True:
-            self._update_csv_data() # Updates data to CSV file
+            self.loop_timer.begin()
+            self._service_logging(self.loop_timer.period_ms) # Updates data to CSV file
+            self.servo.update()
+            self.sequence.step()
+            self._supervise()
+            self._blink_led()
+
+            # Odota seuraavaan määräaikaan (ei kiinteää sleep:iä, joten jakso ei veny)
+            # Nopea jakso myös levossa, kun servo liikkuu (esim. vaaka lasketaan pysäytyksen jälkeen)
+            _fast = self.state != 0 or not self.servo.is_done()
+            self.loop_timer.set_period(self.tick_ms if _fast else int(self.sleep_time * 1000))
+            self.loop_timer.wait()
+
+
+    def _supervise(self):
+        """Returns the sequence to idle when stop has been pressed. Raises `KeyboardInterrupt` if both buttons are pressed."""
+        if self.start_stop.check_both_pressed():
+            self.straise(KeyboardInterrupt, 'Start/Stop buttons pressed at the same time')
+
+        if self.state != 0 and not self.start_stop.check_state():
+            self._aborted() # Records the abort time
+            self.sequence.go(0)
+            self._stop()
+            self.stprint('Idle')
+
+
+    def _build_sequence(self, sm:StateMachine):
+        """Adds the states of the conveyor sequence to the state machine.
+
+        Every step is a short check that does not block. Sub-states of a state have codes
+        `state * 10 + n`. A new test sequence only needs new states here.
+
+        Parameters:
+        - `sm` (StateMachine): State machine to add the states to"""
+        sm.add(0, 'Idle', step=self._step_idle, next={'start': 10})
+        sm.add(10, 'Start', enter=self._enter_start, next=23)
+        self._add_move(sm, 23, 'start', [self.ir_a1], self.kuljetin.run_cw, next=231)                 # Aja alkuasemaan(A)
+        sm.add(231, 'Odota', timeout_ms=1000, next={'timeout': 31})
+        self._add_move(sm, 31, 'middle', [self.ir_a2, self.ir_b2], self.kuljetin.run_ccw, next=32)   # Tuote keskelle (A->B)
+        self._add_weigh(sm, 32, next=34)                                                               # Vaaka ylös/Punnitse
+        self._add_move(sm, 34, 'end', [self.ir_b1], self.kuljetin.run_ccw, next=341)                  # Tuote päätyyn (A->B)
+        sm.add(341, 'Odota', timeout_ms=1000, next={'timeout': 35}) # Wait a second before going back to middle
+        self._add_move(sm, 35, 'middle', [self.ir_a2, self.ir_b2], self.kuljetin.run_cw, next=36)    # Tuote keskelle (B->A)
+        self._add_weigh(sm, 36, next=38)                                                               # Punnitse
+        self._add_move(sm, 38, 'start', [self.ir_a1], self.kuljetin.run_cw, next=39)                  # Tuote alkuun (B->A)
+        sm.add(39, 'Sekvenssi valmis', enter=lambda: self.stprint('Sequence done'), next=31)
+        sm.add(99, 'Virhe', enter=self._enter_move_timeout)
+
+
+    def _add_move(self, sm:StateMachine, code:int, position:str, irs:list, run_func, next:int):
+        """Adds a conveyor move state; times out after `move_timeout_s`
+
+        Parameters:
+        - `sm` (StateMachine): State machine
+        - `code` (int): State code
+        - `position` (str): Name of the position for printing
+        - `irs` (list[IRSensor]): Sensors that must all detect the product
+        - `run_func` (callable): Starts the conveyor (e.g. `Motor.run_cw`)
+        - `next` (int): Next state"""
+        sm.add(code, f'Move to {position}', enter=lambda: self._enter_move(position, irs, run_func), step=self._step_move,
+               exit=self._exit_move, next={'done': next, 'timeout': 99}, timeout_ms=self.move_timeout_ms)
+
+
+    def _add_weigh(self, sm:StateMachine, code:int, next:int):
+        """Adds lift and weigh states: wait, lift, weigh and lower (sub-states `code * 10 + 1...3`)
+
+        Parameters:
+        - `sm` (StateMachine): State machine
+        - `code` (int): State code of the first sub-state
+        - `next` (int): Next state"""
+        sm.add(code, 'Weigh', enter=lambda: self.stprint('Weigh...'), timeout_ms=1000, next={'timeout': code * 10 + 1})
+        sm.add(code * 10 + 1, 'Vaaka ylös', enter=lambda: self.servo.start_move('max'), step=self._step_servo, next=code * 10 + 2)
+        sm.add(code * 10 + 2, 'Punnitus', enter=lambda: self.vaaka.start_weigh(start_delay_ms=100), step=self._step_weigh, next=code * 10 + 3)
+        sm.add(code * 10 + 3, 'Vaaka alas', enter=lambda: self.servo.start_move('min'), timeout_ms=1000, next={'timeout': next})
+
+
+    def _on_state_change(self, code:int):
+        """State machine callback; keeps `state` up to date and times the states"""
+        self.state = code
+        if self.profiler is not None:
+            self.profiler.on_state(code)
+
+
+    def _on_cycle(self, row:list):
+        """Profiler callback; writes the summary row of a finished sequence cycle to the stats file"""
+        self.stprint(f'Cycle {row[0]}: {row[1]} ms')
+        if self.worker is not None and self.worker.is_running():
+            self.worker.post(('stats', row))
+        else:
+            self.stats_csv.append_data(row)
+
+
+    def _blink_led(self):
+        """Blinks the running LED while idle (every `sleep_time`, also if the loop runs faster); it is on while running (see `_enter_start`)"""
+        if self.state == 0 and ticks_diff(ticks_ms(), self._led_ms) >= int(self.sleep_time * 1000):
+            self._led_ms = ticks_ms()
+            RUNNING_LED.toggle()
 
-            if self.start_stop.check_both_pressed():
-                self.straise(KeyboardInterrupt, 'Start/Stop buttons pressed at the same time')
 
-            if self.state == 0: # Idle
-                self.stprint('Idle')
-                RUNNING_LED.toggle()
-                if self.start_stop.check_state():
-                    self.state = 10
+    def _step_idle(self):
+        """Idle: starts when the latch is set"""
+        if self.start_stop.check_state():
+            return 'start'
+        return None
 
-            elif self.state == 10: # Start:
-                self.stprint('Starting')
-                RUNNING_LED.on()
-                self.state = 23
 
-            elif self.state == 23: # Aja alkuasemaan(A)
-                self._move_to_start()
-                sleep(1)
-                self.state = 31
+    def _enter_start(self):
+        """Start: running LED on"""
+        self.stprint('Starting')
+        RUNNING_LED.on()
 
-            elif self.state == 31: # Tuote keskelle (A->B)
-                self._move_to_middle('A')
-                self.state = 32
 
-            elif self.state == 32: # Vaaka ylös/Punnitse
-                self._lift_and_weigh()
-                self.state = 34
+    def _enter_move(self, position:str, irs:list, run_func):
+        """Starts a conveyor move, unless the product is already there (see `_start_move`)"""
+        self._move_name = position
+        self.stprint(f'Moving to {position} position')
+        if self._at_target_now(irs):
+            self._move_start = None
+        else:
+            self._move_start = self._start_move(irs, run_func)
 
-            elif self.state == 34: # Tuote päätyyn (A->B)
-                self._move_to_end()
-                sleep(1) # Wait a second before going back to middle
-                self.state = 35
 
-            elif self.state == 35: # Tuote keskelle (B->A)
-                self._move_to_middle('B')
+    def _step_move(self):
+        """Move: done when all IR sensors of the move detect the product (conveyor is stopped in the interrupt)"""
+        if not self._at_target():
+            self._run_conveyor()
+            return None
+        self.stprint(f'At {self._move_name} position')
+        return 'done'
 
-                self.state = 36
 
-            elif self.state == 36: # Punnitse
-                self._lift_and_weigh()
+    def _exit_move(self):
+        """Move: stops the conveyor; reports the stop latency if the product arrived"""
+        if self._move_start is not None:
+            self._end_move(self._target_irs, self._move_start, self._at_target())
+            self._move_start = None
 
-                self.state = 38
 
-            elif self.state == 38: # Tuote alkuun (B->A)
-                self._move_to_start()
-                self.state = 39
+    def _enter_move_timeout(self):
+        """Error state after a move timeout (conveyor is already stopped by `_exit_move`)"""
+        self.straise(RuntimeError, f'Move timeout: {[ir.get_name() for ir in self._target_irs]} not reached in {self.move_timeout_ms} ms')
 
-            elif self.state == 39: # Sekvenssi valmis
-                self.stprint('Sequence done')
-                self.state = 31
 
+    def _step_servo(self):
+        """Servo move: done when the servo is at the position (servo is updated by the loop)"""
+        return 'done' if self.servo.is_done() else None
 
-            else: # Invalid state code
-                self.straise(ValueError, f'Invalid state code: {self.state}')
 
-            if self.state != 0 and not self.start_stop.check_state():
-                RUNNING_LED.off()
-                self.state = 0
-                self.stprint('Stopping')
-                self.kuljetin.stop_all()
+    def _step_weigh(self):
+        """Weigh: takes a sample when it is time; done when the weight is stable or weighing timed out"""
+        result = self.vaaka.weigh_step()
+        if result is None:
+            return None
+        self._record_weight(result[0], result[1])
+        return 'done'
 
-            sleep(self.sleep_time)
 
-itsetuhokone = Itsetuhokone(debug_print=False)
+if __name__ == '__main__': # Not run when imported (see `main_copy_async.py`)
+    itsetuhokone = Itsetuhokone(debug_print=False)
 
-try:
-    itsetuhokone.run()
-except KeyboardInterrupt:
-    itsetuhokone.kuljetin.stop_all()
-    print('Stopped by user')
-    RunErrLeds.error_blink()
-except Exception as err:
-    itsetuhokone.kuljetin.stop_all()
-    print(f'Error: {err}')
-    RunErrLeds.error_blink()
+    try:
+        itsetuhokone.run()
+    except KeyboardInterrupt:
+        itsetuhokone.kuljetin.stop_all()
+        print('Stopped by user')
+        RunErrLeds.error_blink()
+    except Exception as err:
+        itsetuhokone.kuljetin.stop_all()
+        print(f'Error: {err}')
+        RunErrLeds.error_blink()
     
\ No newline at end of file
@@ -2,222 +2,103 @@
 
 import uasyncio as asyncio # type:ignore
 
-from machine import Pin, Timer # type:ignore
-from utime   import sleep # type:ignore
+from main   import Itsetuhokone, RunErrLeds, RUNNING_LED
 
-from three_axis_accelerometer   import Accelerometer
-from running_and_error_leds     import RunningAndErrorLEDs
-from start_stop_latch   import StartStopLatch
-from csv_file_editor    import CSVFileEditor
-from force_sensor   import ForceSensor
-from ir_sensor  import IRSensor
-from sdcard     import SDCardSetup
-from motor  import Motor
-from servo  import Servo
-from base   import Base
 
+class AsyncItsetuhokone(Itsetuhokone):
+    """Itsetuhokone run as `uasyncio` tasks instead of one blocking loop.
 
-# Onboard LED; toggles every second
-# Mainly for debugging purposes; can be removed/disabled if needed
-on_board_led = Pin(25, Pin.OUT)
-onboard_led_timer = Timer(-1)
-onboard_led_timer.init(period=1000, mode=Timer.PERIODIC, callback=lambda t: on_board_led.toggle())
+    Tasks:
+    - Logging: sensor sampling, log windows and the event log (every `log_period_ms`)
+    - LED: blinks the running LED while idle; keeps it on while running
+    - Servo: updates servo moves (every `Servo.update_ms`)
+    - Sequence: one step of the conveyor/servo state machine every `tick_ms`. The states are the same
+      `StateMachine` as in the main loop (`Itsetuhokone._build_sequence`), so sub-states and the state
+      profiler work the same way; every wait is a state timeout instead of an `await`.
+    - Supervisor: start/stop buttons; returns the sequence to idle when stop is pressed (every `tick_ms`)
 
-
-RunErrLeds = RunningAndErrorLEDs(12,13)
-RUNNING_LED, ERROR_LED = RunErrLeds.get_leds()
-
-
-class Itsetuhokone(Base):
-    """Main class for Itsetuhokone project."""
-    def __init__(self, sleep_time:float=0.3, csv_add_timer:bool=True, debug_print:bool=False):
+    The conveyor is still stopped in the stop button interrupt; the sequence returns to idle on the next
+    supervisor tick. Copy this file and `main.py` to the Pico and run this file (e.g. `mpremote run main_copy_async.py`);
+    `main.py` only runs its own loop when started as the main program."""
+    def __init__(self, tick_ms:int=10, log_period_ms:int=20, **kwargs):
         """Initializes class.
 
         Parameters:
-        - `sleep_time` (float): Sleep time between loops. Default: `0.3`
-        - `debug_print` (bool): If `True`, prints debug messages. Default: `False`"""
-        super().__init__('Itsetuhokone', debug_print=debug_print)
-
-        self.pprint('Initializing')
-
-        self.sleep_time = sleep_time # Sleep time between loops
-        
-        self.state = 0 # Set starting state (0 = Idle)
-
-        # Moottorit
-        self.kuljetin = Motor(0, 1, 'Kuljetin', debug_print=self.debug_print) # Kuljetin moottori
-        self.servo = Servo(22, name='Vaaka moottori', min_pos_val=4500, max_pos_val=7150, debug_print=self.debug_print) # Vaaka moottori
-
-        # IR anturit
-        self.ir_a1 = IRSensor(6, 'Anturi a1', debug_print=self.debug_print)
-        self.ir_a2 = IRSensor(7, 'Anturi a2', debug_print=self.debug_print)
-        self.ir_b1 = IRSensor(8, 'Anturi b1', debug_print=self.debug_print)
-        self.ir_b2 = IRSensor(9, 'Anturi b2', debug_print=self.debug_print)
-
-        # Vaaka anturi (voima-anturi)
-        self.vaaka = ForceSensor(28, 'Vaaka', debug_print=self.debug_print)
+        - `tick_ms` (int): Period of the sequence steps and start/stop supervision (in milliseconds). Default: `10`
+        - `log_period_ms` (int): Period of the logging task (in milliseconds); without `sample_rate_hz` this is the sensor read rate. Default: `20`
+        - `kwargs`: Other arguments for `Itsetuhokone`"""
+        super().__init__(tick_ms=tick_ms, **kwargs)
 
-        # Värinä anturi
-        self.accelerometer = Accelerometer(x_pin=26, y_pin=27, name='Värinä anturi', debug_print=self.debug_print)
-
-        # Listaa kaikki anturit
-        self.sensor_lst = [self.ir_a1, self.ir_a2, self.ir_b1, self.ir_b2, self.vaaka, self.accelerometer]
-
-        # Start/Stop napit
-        self.start_stop = StartStopLatch(10, 11, name='Start/Stop napit', debug_print=self.debug_print)
-
-        # SD kortti ja CSV tiedosto
-        SDCardSetup(5, 2, 3, 4)
-        _header_lst = [sensor.get_name() for sensor in self.sensor_lst]
-        self.data_history_csv = CSVFileEditor('sd/sensor_data.csv', _header_lst, add_timer=csv_add_timer, debug_print=self.debug_print)
-
-        self.pprint('Initialized')
-
-
-    def stprint(self, text):
-        """Prints text with the state number included
-        
-        Parameters:
-        - `text` (Any): Text to print"""
-        print(f'Itsetuhokone: [{self.state}] - {text}')
+        self.log_period_ms = log_period_ms
+        self._error = None # Error raised in the sequence task
 
 
-    def straise(self, raise_as, text:str=''):
-        """Prints error message and raises error.
-        
-        Parameters:
-        - `raise_as` (Exception): Exception to raise
-        - `text` (str): Error message to print"""
-        self.pprint(f'[!] Error [!]: {text}')
-        raise raise_as(text)
-
-    
-    def _update_csv_data(self):
-        """Updates data to CSV file"""
-        _data_lst = [sensor.update() for sensor in self.sensor_lst] # Reads values from sensors
-        self.data_history_csv.append_data(_data_lst) # Appends data to CSV file
-
-    
-    def _lift_and_weigh(self):
-        self.stprint('Weigh...')
-        sleep(1)
-        self.servo.move_to_pos('max')
-        
-        sleep(3) # Hold, to make sure the weight is measured correctly
-
-        self.servo.move_to_pos('min')
-        sleep(1)
-
-    
-    def _move_to_start(self):
-        """Moves to start position (A1)"""
-        self.stprint('Moving to start position')
-        while not self.ir_a1.read():
-            self.kuljetin.run_cw()
-
-        self.kuljetin.stop_all()
-        self.stprint('At start position')
-
-    
-    def _move_to_end(self):
-        """Moves to end position (B2)"""
-        self.stprint('Moving to end position')
-        while not self.ir_b1.read():
-            self.kuljetin.run_ccw()
-
-        self.kuljetin.stop_all()
-        self.stprint('At end position')
-
-    
-    def _move_to_middle(self, from_pos:str):
-        """Moves to middle position (from `A` or `B`)
-        
-        Parameters:
-        - `from_pos` (str): Position to move from (`A` or `B`)"""
-        self.stprint('Moving to middle position')
-        while not all([ir.read() for ir in [self.ir_a2, self.ir_b2]]):
-            if from_pos == 'A':
-                self.kuljetin.run_ccw()
-            elif from_pos == 'B':
-                self.kuljetin.run_cw()
-            else:
-                self.kuljetin.stop_all()
-                self.straise(ValueError, f'Invalid from_pos: {from_pos}')
+    def _run_loop(self):
+        """Runs the tasks until both buttons are pressed or the sequence raises"""
+        asyncio.run(self._main())
 
-        self.kuljetin.stop_all()
-        self.stprint('At middle position')
 
+    async def _main(self):
+        """Starts the sequence and the background tasks and runs the supervisor"""
+        self.sequence.start()
+        self.stprint('Idle')
+        tasks = [asyncio.create_task(self._sequence_task()), asyncio.create_task(self._logging_task()),
+                 asyncio.create_task(self._led_task()), asyncio.create_task(self._servo_task())]
+        try:
+            await self._supervisor_task()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.kuljetin.stop_all()
 
-    def run(self):
-        """Runs main code"""
-        self.pprint('Running...')
 
+    async def _logging_task(self):
+        """Reads sensors / drains timed samples to the log and logs events (in dual core mode only checks the second core)"""
         while True:
-            self._update_csv_data() # Updates data to CSV file
+            self._service_logging(self.log_period_ms)
+            await asyncio.sleep_ms(self.log_period_ms)
 
-            if self.start_stop.check_both_pressed():
-                self.straise(KeyboardInterrupt, 'Start/Stop buttons pressed at the same time')
 
-            if self.state == 0: # Idle
-                self.stprint('Idle')
+    async def _led_task(self):
+        """Blinks the running LED while idle; keeps it on while running"""
+        while True:
+            if self.state == 0:
                 RUNNING_LED.toggle()
-                if self.start_stop.check():
-                    self.state = 10
-
-            elif self.state == 10: # Start:
-                self.stprint('Starting')
+            else:
                 RUNNING_LED.on()
-                self.state = 23
-
-            elif self.state == 23: # Aja alkuasemaan(A)
-                self._move_to_start()
-                sleep(1)
-                self.state = 31
-
-            elif self.state == 31: # Tuote keskelle (A->B)
-                self._move_to_middle('A')
-                self.state = 32
+            await asyncio.sleep_ms(int(self.sleep_time * 1000))
 
-            elif self.state == 32: # Vaaka ylös/Punnitse
-                self._lift_and_weigh()
-                self.state = 34
 
-            elif self.state == 34: # Tuote päätyyn (A->B)
-                self._move_to_end()
-                sleep(1) # Wait a second before going back to middle
-                self.state = 35
-
-            elif self.state == 35: # Tuote keskelle (B->A)
-                self._move_to_middle('B')
-
-                self.state = 36
-
-            elif self.state == 36: # Punnitse
-                self._lift_and_weigh()
-
-                self.state = 38
-
-            elif self.state == 38: # Tuote alkuun (B->A)
-                self._move_to_start()
-                self.state = 39
+    async def _servo_task(self):
+        """Updates the running servo move"""
+        while True:
+            self.servo.update()
+            await asyncio.sleep_ms(self.servo.update_ms)
 
-            elif self.state == 39: # Sekvenssi valmis
-                self.stprint('Sequence done')
-                self.state = 31
 
+    async def _sequence_task(self):
+        """Runs one step of the state machine every `tick_ms`; errors of the states (e.g. move timeout) are raised by the supervisor"""
+        try:
+            while True:
+                self.sequence.step()
+                await asyncio.sleep_ms(self.tick_ms)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            self.kuljetin.stop_all()
+            self._error = err
 
-            else: # Invalid state code
-                self.straise(ValueError, f'Invalid state code: {self.state}')
 
-            if self.state != 0 and not self.start_stop.check():
-                RUNNING_LED.off()
-                self.state = 0
-                self.stprint('Stopping')
-                self.kuljetin.stop_all()
+    async def _supervisor_task(self):
+        """Returns the sequence to idle when stop is pressed (see `Itsetuhokone._supervise`); raises `KeyboardInterrupt` when both buttons are pressed and errors of the sequence"""
+        while True:
+            if self._error is not None:
+                raise self._error
+            self._supervise()
+            await asyncio.sleep_ms(self.tick_ms)
 
-            sleep(self.sleep_time)
 
-itsetuhokone = Itsetuhokone(debug_print=False)
+itsetuhokone = AsyncItsetuhokone(debug_print=False)
 
 try:
     itsetuhokone.run()
@@ -229,4 +110,3 @@ except Exception as err:
     itsetuhokone.kuljetin.stop_all()
     print(f'Error: {err}')
     RunErrLeds.error_blink()
-    
\ No newline at end of file
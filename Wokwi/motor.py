@@ -1,46 +1,127 @@
-# Author: Rasmus Ohert
-
-from base import Base
-from machine    import Pin # type:ignore
-
-
-class Motor(Base):
-    """Simple controller for a single motor with two relays contorlling it's rotation."""
-    def __init__(self, relayCw_pin_num:int, relayCCw_pin_num:int, name:str='motor', debug_print:bool=False):
-        """Initializes class.
-
-        Parameters:
-        - `relayCw_pin_num` (int): Pin number to use for clockwise rotation.
-        - `relayCCw_pin_num` (int): Pin number to use for counterclockwise rotation.
-        - `name` (str): Name of class instance. Default: 'motor'
-        - `debug_print` (bool): If `True`, prints debug messages. Default: `False`"""
-        super().__init__(name, debug_print)
-        
-        self.relayCw    = Pin(relayCw_pin_num, Pin.OUT)
-        self.relayCCw   = Pin(relayCCw_pin_num, Pin.OUT)
-
-        self.stop_all() # Make sure motor is stopped on init
-
-
-    def run_cw(self):
-        """Run motor clockwise"""
-        self.stop_all(False)
-        self.relayCw.on()
-        self.pprint('Running clockwise')
-    
-
-    def run_ccw(self):
-        """Run motor counterclockwise"""
-        self.stop_all(False)
-        self.relayCCw.on()
-        self.pprint('Running counterclockwise')
-    
-
-    def stop_all(self, do_print:bool=True):
-        """Stops motor from spinning
-        
-        Parameters:
-        - `do_print` (bool): If `True`, prints debug message. Default: `True`"""
-        self.relayCw.off()
-        self.relayCCw.off()
-        self.pprint('Stopped', do_print)
\ No newline at end of file
+# Author: Rasmus Ohert
+
+from base import Base
+from machine    import Pin # type:ignore
+from utime  import ticks_ms, ticks_diff # type:ignore
+
+
+# Motor states
+STOPPED = 0
+CW      = 1
+CCW     = 2
+
+
+class Motor(Base):
+    """Simple controller for a single motor with two relays contorlling it's rotation.
+
+    Relays are switched only when the state changes, so `run_cw`/`run_ccw` can be called
+    on every loop. Before changing direction the motor is stopped for at least `dead_time_ms`;
+    this does not block: `run_cw`/`run_ccw` return `False` until the dead-time has passed.
+    Relay switch cycles are counted for wear reporting (see `get_switch_counts`)."""
+    def __init__(self, relayCw_pin_num:int, relayCCw_pin_num:int, name:str='motor', dead_time_ms:int=200, debug_print:bool=False):
+        """Initializes class.
+
+        Parameters:
+        - `relayCw_pin_num` (int): Pin number to use for clockwise rotation.
+        - `relayCCw_pin_num` (int): Pin number to use for counterclockwise rotation.
+        - `name` (str): Name of class instance. Default: 'motor'
+        - `dead_time_ms` (int): Min time stopped before the direction is reversed (in milliseconds). Default: `200`
+        - `debug_print` (bool): If `True`, prints debug messages. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        self.relayCw    = Pin(relayCw_pin_num, Pin.OUT)
+        self.relayCCw   = Pin(relayCCw_pin_num, Pin.OUT)
+
+        self.dead_time_ms = dead_time_ms
+        self.state = STOPPED
+        self._last_dir = STOPPED # Last running direction
+        self._stop_ms = ticks_ms()
+        self.cw_switches = 0 # Clockwise relay switch cycles
+        self.ccw_switches = 0 # Counterclockwise relay switch cycles
+
+        self.stop_all() # Make sure motor is stopped on init
+
+
+    def run_cw(self) -> bool:
+        """Run motor clockwise. Does nothing if already running clockwise.
+        When reversing, the motor is stopped first; call again (e.g. on every loop) until the dead-time has passed.
+
+        Returns:
+        - `bool`: `True` if running clockwise, `False` if waiting for the dead-time"""
+        if self.state == CW:
+            return True
+        if not self._prepare(CW):
+            return False
+        self.relayCw.on()
+        self.cw_switches += 1
+        self.state = CW
+        self._last_dir = CW
+        self.log.debug('Running clockwise')
+        return True
+
+
+    def run_ccw(self) -> bool:
+        """Run motor counterclockwise. Does nothing if already running counterclockwise.
+        When reversing, the motor is stopped first; call again (e.g. on every loop) until the dead-time has passed.
+
+        Returns:
+        - `bool`: `True` if running counterclockwise, `False` if waiting for the dead-time"""
+        if self.state == CCW:
+            return True
+        if not self._prepare(CCW):
+            return False
+        self.relayCCw.on()
+        self.ccw_switches += 1
+        self.state = CCW
+        self._last_dir = CCW
+        self.log.debug('Running counterclockwise')
+        return True
+
+
+    def _prepare(self, direction:int) -> bool:
+        """Stops the motor; returns `False` if the direction is reversed and the dead-time has not passed yet. Does not block."""
+        if self.state != STOPPED:
+            self.stop_all(False)
+        if self._last_dir == direction or self._last_dir == STOPPED: # Not reversed
+            return True
+        wait = self.dead_time_ms - ticks_diff(ticks_ms(), self._stop_ms)
+        if wait > 0:
+            self.log.debug('Dead-time: {} ms left', wait)
+            return False
+        return True
+
+
+    def stop_all(self, do_print:bool=True):
+        """Stops motor from spinning. Both relays are always set off; if already stopped, the pins do not change.
+
+        Parameters:
+        - `do_print` (bool): If `True`, prints debug message. Default: `True`"""
+        self.relayCw.off()
+        self.relayCCw.off()
+        if self.state != STOPPED:
+            self.state = STOPPED
+            self._stop_ms = ticks_ms()
+            if do_print:
+                self.log.debug('Stopped')
+
+
+    def stop_fast(self):
+        """Stops motor without printing. Does not allocate memory, so it can be called from a (hard) interrupt."""
+        self.relayCw.off()
+        self.relayCCw.off()
+        if self.state != STOPPED:
+            self.state = STOPPED
+            self._stop_ms = ticks_ms()
+
+
+    def is_running(self) -> bool:
+        """Returns `True` if the motor is running"""
+        return self.state != STOPPED
+
+
+    def get_switch_counts(self) -> tuple:
+        """Returns relay switch cycles since init
+
+        Returns:
+        - `tuple[int, int]`: Clockwise and counterclockwise relay switch cycles"""
+        return self.cw_switches, self.ccw_switches
@@ -0,0 +1,194 @@
+# Author: Rasmus Ohert
+
+from csv_file_editor    import CSVFileEditor
+from utime  import ticks_ms, ticks_diff # type:ignore
+from uos    import listdir # type:ignore
+
+
+def split_segment_path(file_path:str) -> tuple:
+    """Splits a base file name to the prefix and extension of numbered segments
+    (e.g. `'sd/sensor_data.csv'` -> `('sd/sensor_data_', '.csv')`)"""
+    _dot = file_path.rfind('.')
+    if _dot <= file_path.rfind('/'):
+        _dot = len(file_path)
+    return file_path[:_dot] + '_', file_path[_dot:]
+
+
+def find_last_segment_num(path_prefix:str, path_ext:str) -> int:
+    """Returns the number of the last existing segment (`0` if there are none)
+
+    Parameters:
+    - `path_prefix` (str): Path before the number (see `split_segment_path`)
+    - `path_ext` (str): Extension after the number"""
+    _slash = path_prefix.rfind('/')
+    folder = path_prefix[:_slash] if _slash > 0 else ('/' if _slash == 0 else '.')
+    name_prefix = path_prefix[_slash + 1:]
+
+    last_num = 0
+    try:
+        names = listdir(folder)
+    except OSError:
+        return 0
+
+    for name in names:
+        if not (name.startswith(name_prefix) and name.endswith(path_ext)):
+            continue
+        num = name[len(name_prefix):len(name) - len(path_ext)]
+        if num.isdigit():
+            last_num = max(last_num, int(num))
+
+    return last_num
+
+
+class RotatingCSVFileEditor(CSVFileEditor):
+    """CSV file editor that splits the log into numbered segments.
+
+    A new segment (`sensor_data_0001.csv`, `sensor_data_0002.csv`, ...) is started when the current one
+    reaches `max_segment_bytes` or `max_segment_time_s`. Numbering continues from the segments already
+    on the card, so a reboot does not overwrite the previous run.
+
+    Time is `ticks_ms` since boot, so it starts again from zero on every boot. Every segment has the
+    run id of the boot that wrote it on the line after the headers (`#run;<run id>`); times can only
+    be compared between segments of the same run.
+
+    When a segment is closed, a summary footer is appended to it:
+
+        #run;<run id>
+        #rows;<row count>
+        #first;<first timestamp>
+        #last;<last timestamp>
+        #min;<min of every column>
+        #max;<max of every column>
+
+    `#min` and `#max` have one value per header column; non-numeric columns are left empty.
+    Footer lines are skipped by `read_rows`. `Tools/segment_summary.py` reads the footers on a computer."""
+    def __init__(self, file_path:str, headers:list, max_segment_bytes:int=1000000, max_segment_time_s:int=3600, run_id:int=0, **kwargs):
+        """Initializes RotatingCSVFileEditor
+
+        Parameters:
+        - `file_path` (str): Base name of the file. Segment number is added before the extension (e.g. `'sd/sensor_data.csv'` -> `'sd/sensor_data_0001.csv'`)
+        - `headers` (list[str]): List of headers
+        - `max_segment_bytes` (int): Max size of one segment (in bytes). `0` disables the size limit. Default: `1000000`
+        - `max_segment_time_s` (int): Max time one segment is written to (in seconds). `0` disables the time limit. Default: `3600`
+        - `run_id` (int): Id of this boot, written to every segment. Give the same id to all logs of a boot so they can be matched. `0` uses the number of the first segment of this boot. Default: `0`
+        - `kwargs`: Other arguments for `CSVFileEditor`"""
+        self._max_segment_bytes = max_segment_bytes
+        self._max_segment_time_s = max_segment_time_s
+
+        self._path_prefix, self._path_ext = split_segment_path(file_path)
+
+        self._segment_num = find_last_segment_num(self._path_prefix, self._path_ext)
+        self.run_id = run_id if run_id else self._segment_num + 1
+        self._needs_setup = False # Set when segment is closed with `close()`
+
+        super().__init__(self._next_segment_path(), headers, **kwargs)
+
+
+    def _next_segment_path(self) -> str:
+        """Increases segment number and returns path for the new segment"""
+        self._segment_num += 1
+        return f'{self._path_prefix}{self._segment_num:04d}{self._path_ext}'
+
+
+    def get_segment_path(self) -> str:
+        """Returns path of the current segment"""
+        return self._file_path
+
+
+    def _setup_file(self) -> None:
+        """Writes headers and run id to a new segment and resets segment summary"""
+        super()._setup_file()
+        self._append_text(f'\n#run{self._separator}{self.run_id}')
+
+        self._segment_start_time = ticks_ms()
+        self._seg_rows = 0
+        self._seg_first = None
+        self._seg_last = None
+        self._seg_min = [None] * len(self._headers)
+        self._seg_max = [None] * len(self._headers)
+
+
+    def _on_row_written(self, data:list):
+        """Updates segment summary and starts a new segment if limits are reached
+
+        Parameters:
+        - `data` (list): Values of the row"""
+        timestamp = data[0] if self._add_timer else f'{ticks_ms()/1000:.{self._timer_decimals}f}'
+        if self._seg_first is None:
+            self._seg_first = timestamp
+        self._seg_last = timestamp
+        self._seg_rows += 1
+
+        _min = self._seg_min
+        _max = self._seg_max
+        for i in range(1 if self._add_timer else 0, min(len(data), len(_min))):
+            val = data[i]
+            if not isinstance(val, (int, float)):
+                continue
+            if _min[i] is None or val < _min[i]:
+                _min[i] = val
+            if _max[i] is None or val > _max[i]:
+                _max[i] = val
+
+        if self._max_segment_bytes and self._file_pos + self._buffer_len >= self._max_segment_bytes:
+            self.rotate()
+        elif self._max_segment_time_s and ticks_diff(ticks_ms(), self._segment_start_time) >= self._max_segment_time_s * 1000:
+            self.rotate()
+
+
+    def _format_summary(self) -> str:
+        """Returns summary footer of the current segment"""
+        sep = self._separator
+        if self._add_timer:
+            self._seg_min[0] = self._seg_first
+            self._seg_max[0] = self._seg_last
+
+        to_str = lambda val: '' if val is None else str(val)
+        return (f'\n#run{sep}{self.run_id}'
+                f'\n#rows{sep}{self._seg_rows}'
+                f'\n#first{sep}{to_str(self._seg_first)}'
+                f'\n#last{sep}{to_str(self._seg_last)}'
+                f'\n#min{sep}{sep.join([to_str(val) for val in self._seg_min])}'
+                f'\n#max{sep}{sep.join([to_str(val) for val in self._seg_max])}')
+
+
+    def _close_segment(self):
+        """Writes summary footer and closes the current segment"""
+        if self._file is None and not self._buffer_len:
+            return
+
+        self._append_text(self._format_summary())
+        self._close_file()
+        self.log.debug('Segment closed: {}', self._file_path)
+
+
+    def rotate(self):
+        """Closes the current segment and starts a new one"""
+        self._close_segment()
+
+        self._file_path = self._next_segment_path()
+        self._setup_file()
+        self.log.debug('New segment: {}', self._file_path)
+
+
+    def close(self):
+        """Writes summary footer and closes the current segment. Next write starts a new segment."""
+        if self._file is None:
+            return
+
+        self._close_segment()
+        self._needs_setup = True
+
+
+    def append_data(self, data:list, time_ms:int=None):
+        """Appends data to the current segment. Starts a new segment first if the previous one was closed.
+
+        Parameters:
+        - `data` (list): Data to append to file
+        - `time_ms` (int | None): Time of the row (`ticks_ms`); `None` is now. Default: `None`"""
+        if self._needs_setup:
+            self._needs_setup = False
+            self._file_path = self._next_segment_path()
+            self._setup_file()
+
+        super().append_data(data, time_ms)
@@ -344,16 +344,16 @@ class SDCardSetup(Base):
             try:
                 sd = SDCard(spi, Pin(cs_pin)) # Initialize SD card
                 uos.mount(uos.VfsFat(sd), root_folder_name) # Mount filesystem
-                self.pprint('Initialized')
+                self.log.debug('Initialized')
                 break
             
             except OSError as err:
-                self.pprint('Initialization failed:', err)
+                self.log.warning('Initialization failed: {}', err)
                 RunErrLeds.do_all('on')
                 sleep(0.5)
                 RunErrLeds.do_all('off')
                 sleep(0.5)
             
             except Exception as err:
-                self.pprint('Exception:', err)
+                self.log.warning('Exception: {}', err)
                 sleep(1)
\ No newline at end of file
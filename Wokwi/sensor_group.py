@@ -0,0 +1,66 @@
+# Author: Rasmus Ohert
+
+from array  import array
+from base import Base
+
+
+class SensorGroup(Base):
+    """Reads several sensors into one preallocated `array` with a single call.
+
+    Every sensor must have `read_into(buf, offset)` and `channel_count()`
+    (`IRSensor`, `ForceSensor`, `Accelerometer`). Values are raw integers in the
+    order of the sensors; reading does not allocate memory."""
+    def __init__(self, sensors:list, name:str='Sensor group', debug_print:bool=False):
+        """Initializes SensorGroup
+
+        Parameters:
+        - `sensors` (list): Sensors to read, in order
+        - `name` (str): Name of class instance. Default: 'Sensor group'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        self._sensors = list(sensors)
+        self._offsets = array('H', [0] * len(self._sensors))
+
+        offset = 0
+        for i in range(len(self._sensors)):
+            self._offsets[i] = offset
+            offset += self._sensors[i].channel_count()
+
+        self.values = array('H', bytes(2 * offset)) # Reused on every read
+        self.log.debug('{} sensors, {} channels', len(self._sensors), offset)
+
+
+    def __len__(self) -> int:
+        """Returns number of channels"""
+        return len(self.values)
+
+
+    def read(self):
+        """Reads all sensors to `values`
+
+        Returns:
+        - `array`: `values`; the same array on every call, copy it if it needs to be kept"""
+        buf = self.values
+        for i in range(len(self._sensors)):
+            self._sensors[i].read_into(buf, self._offsets[i])
+        return buf
+
+
+    def read_into(self, buf, offset:int=0) -> int:
+        """Reads all sensors to a buffer owned by the caller
+
+        Parameters:
+        - `buf` (array | list): Buffer with room for `len(self)` values after `offset`
+        - `offset` (int): Index of the first value. Default: `0`
+
+        Returns:
+        - `int`: Number of values written"""
+        for i in range(len(self._sensors)):
+            self._sensors[i].read_into(buf, offset + self._offsets[i])
+        return len(self.values)
+
+
+    def channel_count(self) -> int:
+        """Returns number of values written by `read_into`"""
+        return len(self.values)
@@ -1,11 +1,12 @@
-from machine    import Pin, PWM # type:ignore
-from utime  import sleep # type:ignore
+from machine    import Pin, PWM, Timer # type:ignore
+from math   import pi, sin, sqrt
+from utime  import sleep, sleep_ms, ticks_ms, ticks_diff # type:ignore
 from base   import Base
 
 class Servo(Base):
-    def __init__(self, pin_out:int, freq:int=50, name:str='servo', min_pos_val:int=1200, max_pos_val:int=8650, default_pos:str='mid', debug_print:bool=False):
+    def __init__(self, pin_out:int, freq:int=50, name:str='servo', min_pos_val:int=1200, max_pos_val:int=8650, default_pos:str='mid', speed:int=5000, accel:int=25000, profile:str='trapezoid', update_ms:int=10, use_timer:bool=False, debug_print:bool=False):
         """Initialize servo class.
-        
+
         Parameters:
         - `pin_out` (int): Pin to output to servo motor (PWM).
         - `freq` (int): Frequency of PWM. Default: `50`
@@ -13,9 +14,16 @@ class Servo(Base):
         - `min_pos_val` (int): Minimum position value. Default: `1200`
         - `max_pos_val` (int): Maximum position value. Default: `8650`
         - `default_pos` (str): Default position to move to. Default: `'mid'`
+        - `speed` (int): Max speed of moves (position values per second). Default: `5000`
+        - `accel` (int): Max acceleration of moves (position values per second^2). Default: `25000`
+        - `profile` (str): Speed ramp of moves. Default: `'trapezoid'`
+            - `'trapezoid'`: Constant acceleration
+            - `'s-curve'`: Acceleration ramps up and down smoothly (sine); moves take a bit longer
+        - `update_ms` (int): Time between position updates (in milliseconds). Default: `10`
+        - `use_timer` (bool): If `True`, moves are updated by `machine.Timer`; if `False`, `update()` must be called in the main loop. Default: `False`
         - `debug_print` (bool): If `True`, print debug info; if `False`, do not print. Default: `False`"""
         super().__init__(name, debug_print)
-        
+
         self.pwm = PWM(Pin(pin_out, Pin.OUT))
         self.pwm.freq(freq)
 
@@ -25,42 +33,181 @@ class Servo(Base):
         self.max_pos_val    = max_pos_val
         self.mid_pos_val    = (max_pos_val - min_pos_val) // 2 + min_pos_val
 
-        self.pos_vals = {   
+        self.pos_vals = {
                             'min': self.min_pos_val,
                             'mid': self.mid_pos_val,
                             'max': self.max_pos_val
                         }
-        
+
+        # Motion engine (see `start_move`)
+        if profile not in ('trapezoid', 's-curve'):
+            self.praise(ValueError, f'Invalid profile: {profile}')
+        self.speed      = speed
+        self.accel      = accel
+        self.profile    = profile
+        self.update_ms  = update_ms
+
+        self._moving    = False
+        self._callback  = None
+        self._start_ms  = 0
+        self._from      = 0
+        self._dist      = 0
+        self._dir       = 1
+        self._peak      = 0.0 # Peak speed of the current move
+        self._t_ramp    = 0.0 # Duration of acceleration (and deceleration) (in seconds)
+        self._t_total   = 0.0
+
+        self._timer = None
+        if use_timer:
+            self._timer = Timer(-1)
+            self._timer_cb = self._on_timer # Bound once
 
         self.force_move(self.mid_pos_val)
 
 
+    def start_move(self, pos, callback=None, speed:int=None) -> bool:
+        """Starts moving to a position and returns right away. The move goes on in `update()`.
+
+        A running move is replaced by the new one; the new move starts from the current position.
+
+        Parameters:
+        - `pos` (str | int): Position to move to.
+            - `'min'`, `'mid'`, `'max'`: Named position
+            - `int`: Position value; must be within `min_pos_val` <= `pos` <= `max_pos_val`
+        - `callback` (callable | None): Called without arguments when the move is done (in `update()`, or in the timer callback with `use_timer`). Default: `None`
+        - `speed` (int | None): Max speed of this move; `None` uses `speed`. Default: `None`
+
+        Returns:
+        - `bool`: `True` if the move was started or the servo is already at the position, `False` if the position is not valid"""
+        if isinstance(pos, str):
+            if pos not in self.pos_vals:
+                self.log.debug('Not a valid position: {}', pos)
+                return False
+            target = self.pos_vals[pos]
+        elif self.min_pos_val <= pos <= self.max_pos_val:
+            target = int(pos)
+        else:
+            self.log.debug('Cannot move to given value: {} (min: {}, max: {})', pos, self.min_pos_val, self.max_pos_val)
+            return False
+
+        self._moving = False
+        dist = target - self.current_post
+        if dist == 0:
+            self.log.debug('Already at pos: {}', pos)
+            if callback is not None:
+                callback()
+            return True
+
+        self._from      = self.current_post
+        self._dir       = 1 if dist > 0 else -1
+        self._dist      = abs(dist)
+        self._callback  = callback
+        self._plan(self.speed if speed is None else speed)
+
+        self.log.debug('Moving to pos: {} from {} ({} ms)', pos, self._from, int(self._t_total * 1000))
+        self._start_ms  = ticks_ms()
+        self._moving    = True
+        if self._timer is not None:
+            self._timer.init(period=self.update_ms, mode=Timer.PERIODIC, callback=self._timer_cb)
+        return True
+
+
+    def _plan(self, speed:int):
+        """Calculates speed ramp of the move. Acceleration phase covers half of the distance at peak speed
+        for both profiles; the s-curve ramp is longer so that its peak acceleration is `accel`."""
+        ramp_factor = 1.0 if self.profile == 'trapezoid' else pi / 2
+        peak = float(speed)
+        t_ramp = ramp_factor * peak / self.accel
+        if peak * t_ramp > self._dist: # Too short for full speed (triangle profile)
+            peak = sqrt(self._dist * self.accel / ramp_factor)
+            t_ramp = ramp_factor * peak / self.accel
+
+        self._peak      = peak
+        self._t_ramp    = t_ramp
+        self._t_total   = 2 * t_ramp + (self._dist - peak * t_ramp) / peak
+
+
+    def _ramp_dist(self, t:float) -> float:
+        """Distance moved `t` seconds after the start of the acceleration phase"""
+        if self.profile == 'trapezoid':
+            return self._peak * t * t / (2 * self._t_ramp)
+        return self._peak / 2 * (t - self._t_ramp / pi * sin(pi * t / self._t_ramp))
+
+
+    def update(self) -> bool:
+        """Moves the servo to where it should be now. Call often (about every `update_ms`) while moving;
+        does nothing if no move is running.
+
+        Returns:
+        - `bool`: `True` if no move is running (see `is_done`)"""
+        if not self._moving:
+            return True
+
+        t = ticks_diff(ticks_ms(), self._start_ms) / 1000
+        if t >= self._t_total:
+            dist = self._dist
+        elif t < self._t_ramp: # Accelerating
+            dist = self._ramp_dist(t)
+        elif t < self._t_total - self._t_ramp: # Full speed
+            dist = self._peak * self._t_ramp / 2 + self._peak * (t - self._t_ramp)
+        else: # Decelerating
+            dist = self._dist - self._ramp_dist(self._t_total - t)
+
+        value = self._from + self._dir * int(dist + 0.5)
+        if value != self.current_post:
+            self.pwm.duty_u16(value)
+            self.current_post = value
+
+        if dist >= self._dist:
+            self._finish()
+        return not self._moving
+
+
+    def _on_timer(self, timer):
+        """Timer callback (with `use_timer`)"""
+        self.update()
+
+
+    def _finish(self):
+        """Ends the move and calls the callback"""
+        self._moving = False
+        if self._timer is not None:
+            self._timer.deinit()
+        self.log.debug('At pos: {}', self.current_post)
+        callback = self._callback
+        self._callback = None
+        if callback is not None:
+            callback()
+
+
+    def is_done(self) -> bool:
+        """Returns `True` if no move is running"""
+        return not self._moving
+
+
+    def stop(self):
+        """Stops the running move at the current position; the callback is not called"""
+        self._moving = False
+        self._callback = None
+        if self._timer is not None:
+            self._timer.deinit()
+
+
     def move_to_pos(self, pos:str):
-        """Reset position to a position.
-        
+        """Reset position to a position. Blocks until the move is done (see `start_move` for a non-blocking move).
+
         Parameters:
         - `pos` (str): Position to move to.
             - `'min'`: Minimum position
             - `'mid'`: Middle position
             - `'max'`: Maximum position"""
-        if pos not in self.pos_vals:
-            self.pprint(f'Not a valid position: {pos}')
-            return
-        
-        if self.current_post == self.pos_vals[pos]:
-            self.pprint(f'Already at pos: {pos}')
-            return
-        elif self.current_post < self.pos_vals[pos]:
-            freq_amnt = self.freq
-        elif self.current_post > self.pos_vals[pos]:
-            freq_amnt = -self.freq
-        else:
-            self.pprint(f'Error: {self.current_post} - {self.pos_vals[pos]}')
+        if not self.start_move(pos):
             return
 
-        self.pprint(f'Moving to pos: {pos} from {self.current_post} to {self.pos_vals[pos]}')
-        for pos_val in range(self.current_post, self.pos_vals[pos], freq_amnt):
-            self.move_to_int(pos_val)
+        while self._moving:
+            if self._timer is None:
+                self.update()
+            sleep_ms(self.update_ms)
 
 
     def move_to_int(self, value:int):
@@ -69,12 +216,12 @@ class Servo(Base):
         Parameters:
         - `value` (int): Value to move to. Must be within `min_pos_value` <= `value` <= `max_pos_value`"""
         if value < self.min_pos_val:
-            self.pprint(f'Cannot move to given value: {value} - Value too small (min: {self.min_pos_val})')
+            self.log.debug('Cannot move to given value: {} - Value too small (min: {})', value, self.min_pos_val)
             return
         elif  value > self.max_pos_val:
-            self.pprint(f'Cannot move to given value: {value} - Value too big (max: {self.min_pos_val})')
+            self.log.debug('Cannot move to given value: {} - Value too big (max: {})', value, self.min_pos_val)
             return
-        
+
         self.pwm.duty_u16(value)
         self.current_post = value
         sleep(0.01)
@@ -82,8 +229,9 @@ class Servo(Base):
 
     def force_move(self, value:int):
         """Force move to a specified location.
-        
+
         Parameters:
         - `value` (int): Can be any value. No limits."""
+        self.stop()
         self.pwm.duty_u16(value)
         self.current_post = value
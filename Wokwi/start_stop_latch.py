@@ -1,6 +1,7 @@
 # Author: Rasmus Ohert
 
 from machine    import Pin # type:ignore
+from utime  import ticks_ms, ticks_us, ticks_add, ticks_diff # type:ignore
 from base import Base
 
 
@@ -18,6 +19,70 @@ class Button(Base):
         super().__init__(name)
         self.pin = Pin(pin_num, Pin.IN)
 
+        # Press interrupt (see `enable_irq`)
+        self.pressed = False # Latched press; cleared by `was_pressed`
+        self.press_us = 0 # `ticks_us` of the last accepted press
+        self.presses = 0 # Number of accepted presses
+        self._debounce_ms = 20
+        self._last_press_ms = ticks_ms()
+        self._low_since_ms = ticks_ms() # Last falling edge (release)
+        self._on_press = None
+
+    
+    def enable_irq(self, debounce_ms:int=20, on_press=None):
+        """Latches presses with a (hard) pin interrupt.
+
+        A rising edge is accepted immediately if the line has been released (low) for at
+        least `debounce_ms`; edges within `debounce_ms` after an accepted press or after
+        a release are contact bounce and are ignored. This also rejects the release
+        bounce of a long press.
+
+        Parameters
+        ----------
+        debounce_ms : int
+            Time after a press or a release when new presses are ignored. Default: `20`
+
+        on_press : callable
+            Called in the interrupt as `on_press(press_us)`. Must be short and must not
+            allocate memory. Default: `None`"""
+        self._debounce_ms = debounce_ms
+        self._on_press = on_press
+        self._last_press_ms = ticks_add(ticks_ms(), -debounce_ms) # A released button can be pressed right away
+        self._low_since_ms = self._last_press_ms
+        self._press_cb = self._on_edge # Bound once; creating it in the interrupt would allocate
+        self.pin.irq(handler=self._press_cb, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+
+
+    def _on_edge(self, pin):
+        """Pin interrupt handler. Does not allocate memory."""
+        t_us = ticks_us()
+        t_ms = ticks_ms()
+        if pin.value() != 1: # Released (or bounce); a press must come after a stable release
+            self._low_since_ms = t_ms
+            return
+        if ticks_diff(t_ms, self._last_press_ms) < self._debounce_ms or ticks_diff(t_ms, self._low_since_ms) < self._debounce_ms:
+            return
+
+        self._last_press_ms = t_ms
+        self.press_us = t_us
+        self.presses += 1
+        self.pressed = True
+        if self._on_press is not None:
+            self._on_press(t_us)
+
+
+    def was_pressed(self, clear:bool=True) -> bool:
+        """Returns `True` if the button was pressed since the last call (needs `enable_irq`).
+
+        Parameters
+        ----------
+        clear : bool
+            If `True`, clears the latched press. Default: `True`"""
+        pressed = self.pressed
+        if clear:
+            self.pressed = False
+        return pressed
+
     
     def read_raw_pin(self):
         """Reads raw pin.
@@ -66,6 +131,38 @@ class StartStopLatch(Base):
         self.start_button = Button(start_pin_num, 'Start button')
         self.stop_button = Button(stop_pin_num, 'Stop button')
         self.state = False
+        self._on_stop = None
+
+    
+    def enable_irq(self, debounce_ms:int=20, on_stop=None):
+        """Sets and resets the latch in pin interrupts, so presses during long
+        routines are not missed (see `Button.enable_irq`).
+
+        Parameters
+        ----------
+        debounce_ms : int
+            Debounce time of both buttons. Default: `20`
+
+        on_stop : callable
+            Called in the interrupt as `on_stop(press_us)` when stop is pressed, e.g. to stop
+            motors right away. Must be short and must not allocate memory. Default: `None`"""
+        self._on_stop = on_stop
+        self.start_button.enable_irq(debounce_ms, self._on_start_press)
+        self.stop_button.enable_irq(debounce_ms, self._on_stop_press)
+        self.log.debug('Interrupts enabled, debounce {} ms', debounce_ms)
+
+
+    def _on_start_press(self, press_us:int):
+        """Start button interrupt callback"""
+        if not self.stop_button.pin.value():
+            self.state = True
+
+
+    def _on_stop_press(self, press_us:int):
+        """Stop button interrupt callback"""
+        self.state = False
+        if self._on_stop is not None:
+            self._on_stop(press_us)
 
     
     def __call__(self):
@@ -123,11 +220,11 @@ class StartStopLatch(Base):
         if not self.state:
             if self.start_button.read_pin() and not self.stop_button.read_pin():
                 self.state = True
-                self.pprint('Set to True')
+                self.log.debug('Set to True')
         
         else:
             if self.stop_button.read_pin():
                 self.state = False
-                self.pprint('Set to False')
+                self.log.debug('Set to False')
 
         return self.state
\ No newline at end of file
@@ -0,0 +1,136 @@
+# Author: Rasmus Ohert
+
+from base import Base
+from utime  import ticks_ms, ticks_diff # type:ignore
+
+
+class State:
+    """One state of `StateMachine` (see `StateMachine.add`)"""
+    def __init__(self, code, name:str, enter, step, exit, transitions:dict, timeout_ms:int):
+        self.code = code
+        self.name = name
+        self.enter = enter
+        self.step = step
+        self.exit = exit
+        self.transitions = transitions
+        self.timeout_ms = timeout_ms
+
+
+class StateMachine(Base):
+    """Table-driven state machine with non-blocking steps.
+
+    Every state has optional `enter`, `step` and `exit` functions and a transition table from
+    outcomes to next states. `step()` calls the step function of the current state once; it must
+    return quickly. When it returns an outcome (e.g. `'done'`), the machine moves to the state
+    given by the transition table: `exit` of the old state and `enter` of the new state are called.
+    A state with `timeout_ms` gets the outcome `'timeout'` when it has been active that long."""
+    DONE    = 'done'
+    TIMEOUT = 'timeout'
+
+    def __init__(self, initial, name:str='State machine', on_change=None, debug_print:bool=False):
+        """Initializes StateMachine. Add states with `add` and call `start()`.
+
+        Parameters:
+        - `initial` (int | str): Code of the first state
+        - `name` (str): Name of class instance. Default: 'State machine'
+        - `on_change` (callable | None): Called with the new state code on every transition. Default: `None`
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        self._states = {}
+        self._initial = initial
+        self._on_change = on_change
+        self._current = None
+        self.state = None # Code of the current state
+        self._entered_ms = 0
+
+
+    def add(self, code, name:str='', enter=None, step=None, exit=None, next=None, timeout_ms:int=0):
+        """Adds a state
+
+        Parameters:
+        - `code` (int | str): Code of the state
+        - `name` (str): Name of the state for printing. Default: `''`
+        - `enter` (callable | None): Called without arguments when the state is entered. Default: `None`
+        - `step` (callable | None): Called without arguments on every `step()`; returns an outcome, or `None` to stay in the state.
+            `None` finishes the state right away (`'done'`), or waits for `'timeout'` if `timeout_ms` is set. Default: `None`
+        - `exit` (callable | None): Called without arguments when the state is left, also by `go`. Default: `None`
+        - `next` (dict | int | str | None): Transition table `{outcome: code}`; a single code means `{'done': code}`. Default: `None`
+        - `timeout_ms` (int): Time after which the outcome is `'timeout'` (in milliseconds); `0` disables. Default: `0`"""
+        if code in self._states:
+            self.praise(ValueError, f'State already added: {code}')
+        if next is None:
+            next = {}
+        elif not isinstance(next, dict):
+            next = {self.DONE: next}
+        self._states[code] = State(code, name, enter, step, exit, next, timeout_ms)
+
+
+    def start(self):
+        """Checks the transition tables and enters the initial state"""
+        for state in self._states.values():
+            for outcome, code in state.transitions.items():
+                if code not in self._states:
+                    self.praise(ValueError, f'State {state.code} ({outcome}) leads to unknown state {code}')
+        self._enter(self._initial)
+
+
+    def step(self):
+        """Runs the step function of the current state once and makes the transition, if any
+
+        Returns:
+        - `str | None`: Outcome of the step, or `None`"""
+        state = self._current
+        if state.step is not None:
+            outcome = state.step()
+        elif not state.timeout_ms:
+            outcome = self.DONE
+        else:
+            outcome = None
+
+        if outcome is None:
+            if not state.timeout_ms or ticks_diff(ticks_ms(), self._entered_ms) < state.timeout_ms:
+                return None
+            outcome = self.TIMEOUT
+
+        code = state.transitions.get(outcome)
+        if code is None:
+            self.praise(ValueError, f'No transition from state {state.code} for {outcome}')
+        self.go(code)
+        return outcome
+
+
+    def go(self, code):
+        """Moves to a state right away (e.g. to idle when stop is pressed); `exit` of the current state is called
+
+        Parameters:
+        - `code` (int | str): Code of the state"""
+        state = self._current
+        if state is not None and state.exit is not None:
+            state.exit()
+        self._enter(code)
+
+
+    def _enter(self, code):
+        """Enters a state"""
+        state = self._states.get(code)
+        if state is None:
+            self.praise(ValueError, f'Unknown state: {code}')
+        self._current = state
+        self.state = code
+        self._entered_ms = ticks_ms()
+        self.log.debug('-> {} {}', code, state.name)
+        if self._on_change is not None:
+            self._on_change(code)
+        if state.enter is not None:
+            state.enter()
+
+
+    def elapsed_ms(self) -> int:
+        """Returns time spent in the current state (in milliseconds)"""
+        return ticks_diff(ticks_ms(), self._entered_ms)
+
+
+    def get_state_name(self) -> str:
+        """Returns name of the current state"""
+        return self._current.name if self._current is not None else ''
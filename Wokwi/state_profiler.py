@@ -0,0 +1,163 @@
+# Author: Rasmus Ohert
+
+from array  import array
+from base import Base
+from utime  import ticks_us, ticks_diff # type:ignore
+
+
+class StateProfiler(Base):
+    """Measures time spent in the states of a repeating sequence, per cycle.
+
+    Call `on_state(code)` on every state change (e.g. as `StateMachine` `on_change`); the change is
+    timestamped with `ticks_us`. Sub-states are counted to their parent state: code `231` belongs
+    to `23` if `231` is not profiled itself. A cycle ends when the `cycle_end` state is left;
+    min/mean/max of every state and of the whole cycle are then updated in fixed size arrays and
+    `on_cycle` is called with a summary row. A cycle interrupted by an idle state is not counted."""
+    def __init__(self, codes:list, cycle_end:int, on_cycle=None, idle_codes:tuple=(0,), name:str='State profiler', debug_print:bool=False):
+        """Initializes StateProfiler
+
+        Parameters:
+        - `codes` (list[int]): Codes of the profiled states, in sequence order
+        - `cycle_end` (int): Code of the last state of a cycle
+        - `on_cycle` (callable | None): Called with the summary row of every finished cycle (see `get_headers`). Default: `None`
+        - `idle_codes` (tuple[int]): Codes of states that interrupt a running cycle (e.g. idle after stop). Default: `(0,)`
+        - `name` (str): Name of class instance. Default: 'State profiler'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        if cycle_end not in codes:
+            self.praise(ValueError, f'cycle_end {cycle_end} is not a profiled state')
+
+        self.codes = list(codes)
+        self._index = {code: i for i, code in enumerate(self.codes)} # Sub-states are added when first seen
+        self._end_idx = self._index[cycle_end]
+        self._idle_codes = idle_codes
+        self._on_cycle = on_cycle
+
+        n = len(self.codes) + 1 # Last index is the whole cycle
+        self._cycle_us = array('i', bytes(4 * n)) # Time in each state in the current cycle
+        self._visited = bytearray(n)
+        self._count = array('I', bytes(4 * n))
+        self._min_us = array('i', bytes(4 * n))
+        self._mean_us = array('i', bytes(4 * n))
+        self._max_us = array('i', bytes(4 * n))
+
+        self.cycles = 0
+        self.interrupted_cycles = 0
+        self._idx = -1 # Index of the current state; -1 if not profiled
+        self._entered_us = 0
+        self._cycle_start_us = 0
+        self._in_cycle = False
+
+
+    def get_headers(self) -> list:
+        """Returns headers of the summary row: cycle number, cycle time and time in each state (in milliseconds)"""
+        return ['Cycle', 'Total ms'] + [f'{code} ms' for code in self.codes]
+
+
+    def _index_of(self, code) -> int:
+        """Returns index of the profiled state that `code` belongs to; `-1` if none"""
+        idx = self._index.get(code)
+        if idx is None:
+            parent = code
+            idx = -1
+            while isinstance(parent, int) and parent >= 10:
+                parent //= 10
+                if parent in self._index:
+                    idx = self._index[parent]
+                    break
+            self._index[code] = idx
+        return idx
+
+
+    def on_state(self, code):
+        """Records a state change; call on every transition
+
+        Parameters:
+        - `code` (int): Code of the new state"""
+        now = ticks_us()
+        prev = self._idx
+        if prev >= 0:
+            self._cycle_us[prev] += ticks_diff(now, self._entered_us)
+
+        idx = self._index_of(code)
+        if prev == self._end_idx and idx != prev:
+            self._finish_cycle(now)
+        elif idx < 0 and self._in_cycle and code in self._idle_codes:
+            self._in_cycle = False
+            self.interrupted_cycles += 1
+            self.log.debug('Cycle interrupted')
+
+        if idx >= 0 and not self._in_cycle:
+            self._start_cycle(now)
+        if idx >= 0:
+            self._visited[idx] = 1
+
+        self._idx = idx
+        self._entered_us = now
+
+
+    def _start_cycle(self, now:int):
+        """Clears the times of the current cycle"""
+        for i in range(len(self._cycle_us)):
+            self._cycle_us[i] = 0
+            self._visited[i] = 0
+        self._cycle_start_us = now
+        self._in_cycle = True
+
+
+    def _finish_cycle(self, now:int):
+        """Updates the statistics with the finished cycle and calls `on_cycle`"""
+        total = len(self.codes)
+        self._cycle_us[total] = ticks_diff(now, self._cycle_start_us)
+        self._visited[total] = 1
+        for i in range(total + 1):
+            if self._visited[i]:
+                self._add(i, self._cycle_us[i])
+
+        self.cycles += 1
+        self._in_cycle = False
+        self.log.debug('Cycle {}: {} ms', self.cycles, self._cycle_us[total] // 1000)
+
+        if self._on_cycle is not None:
+            row = [self.cycles, self._cycle_us[total] // 1000]
+            row += [self._cycle_us[i] // 1000 if self._visited[i] else '' for i in range(total)]
+            self._on_cycle(row)
+
+
+    def _add(self, i:int, value:int):
+        """Adds a time to the running min/mean/max of index `i`"""
+        n = self._count[i] + 1
+        self._count[i] = n
+        if n == 1:
+            self._min_us[i] = value
+            self._max_us[i] = value
+            self._mean_us[i] = value
+            return
+        if value < self._min_us[i]:
+            self._min_us[i] = value
+        if value > self._max_us[i]:
+            self._max_us[i] = value
+        self._mean_us[i] += (value - self._mean_us[i]) // n
+
+
+    def get_stats(self) -> list:
+        """Returns statistics of finished cycles
+
+        Returns:
+        - `list[tuple]`: `(state, count, min_us, mean_us, max_us)` for every profiled state, and `('cycle', ...)` for the whole cycle"""
+        names = self.codes + ['cycle']
+        return [(names[i], self._count[i], self._min_us[i], self._mean_us[i], self._max_us[i]) for i in range(len(names))]
+
+
+    def reset(self):
+        """Clears all statistics"""
+        for i in range(len(self._count)):
+            self._count[i] = 0
+            self._min_us[i] = 0
+            self._mean_us[i] = 0
+            self._max_us[i] = 0
+        self.cycles = 0
+        self.interrupted_cycles = 0
+        self._in_cycle = False
+        self._idx = -1
@@ -2,8 +2,107 @@
 
 from base import Base
 from machine import ADC, Pin # type:ignore
+from math   import sqrt
 
 
+class VibrationFeatures:
+    """Running vibration statistics over a window: RMS, peak-to-peak, crest factor and mean of every axis.
+
+    Samples are reduced to the 12 bits the ADC really has and stored as differences to the
+    first sample of the window (shifted-data variance, numerically stable like Welford's method).
+    The sums stay small integers, so adding a sample does not allocate memory;
+    the squared sums are moved to a float only once every `_FOLD_EVERY` samples."""
+    _FOLD_EVERY = 32 # 32 * 4095^2 stays below the MicroPython small integer limit (2^30)
+
+    def __init__(self, axes:int=3, shift:int=4):
+        """Initializes VibrationFeatures
+
+        Parameters:
+        - `axes` (int): Number of axes. Default: `3`
+        - `shift` (int): Bits to drop from `read_u16` values (`4` -> 12 bit). Default: `4`"""
+        self._axes = axes
+        self._shift = shift
+        self._ref = [0] * axes # First sample of the window
+        self._sum = [0] * axes
+        self._sum_sq = [0] * axes
+        self._sum_sq_total = [0.0] * axes
+        self._min = [0] * axes
+        self._max = [0] * axes
+        self._n = 0
+
+
+    def add(self, values:list, offset:int=0):
+        """Adds one sample
+
+        Parameters:
+        - `values` (list[int]): Raw `read_u16` values
+        - `offset` (int): Index of the first axis in `values`. Default: `0`"""
+        first = self._n == 0
+        for i in range(self._axes):
+            val = values[offset + i] >> self._shift
+            if first:
+                self._ref[i] = val
+                self._min[i] = val
+                self._max[i] = val
+            elif val < self._min[i]:
+                self._min[i] = val
+            elif val > self._max[i]:
+                self._max[i] = val
+
+            d = val - self._ref[i]
+            self._sum[i] += d
+            self._sum_sq[i] += d * d
+
+        self._n += 1
+        if self._n % self._FOLD_EVERY == 0:
+            for i in range(self._axes):
+                self._sum_sq_total[i] += self._sum_sq[i]
+                self._sum_sq[i] = 0
+
+
+    def count(self) -> int:
+        """Returns number of samples in the window"""
+        return self._n
+
+
+    def result(self, reset:bool=True) -> list:
+        """Returns features of every axis, scaled back to `read_u16` units
+
+        Parameters:
+        - `reset` (bool): If `True`, starts a new window. Default: `True`
+
+        Returns:
+        - `list[int]`: `[rms, peak-to-peak, crest factor * 100, mean]` for every axis, one after another"""
+        out = []
+        n = self._n
+        scale = 1 << self._shift
+        for i in range(self._axes):
+            if not n:
+                out += [0, 0, 0, 0]
+                continue
+
+            mean_d = self._sum[i] / n
+            var = (self._sum_sq_total[i] + self._sum_sq[i]) / n - mean_d * mean_d
+            rms = sqrt(var) if var > 0 else 0.0
+            mean = self._ref[i] + mean_d
+            peak = max(self._max[i] - mean, mean - self._min[i])
+            crest = peak / rms if rms else 0.0
+
+            out += [int(rms * scale), (self._max[i] - self._min[i]) * scale, int(crest * 100), int(mean * scale)]
+
+        if reset:
+            self.reset()
+        return out
+
+
+    def reset(self):
+        """Starts a new window"""
+        for i in range(self._axes):
+            self._sum[i] = 0
+            self._sum_sq[i] = 0
+            self._sum_sq_total[i] = 0.0
+        self._n = 0
+
 
 class Accelerometer(Base):
     """Class for a three axis accelerometer"""
@@ -59,6 +158,8 @@ class Accelerometer(Base):
 
         # Read new values
         xyz_new_values = [self._read_pin_raw(pin) for pin in self._xyz_pins]
+        if self.calibration is not None:
+            xyz_new_values = [cal.convert(val) if cal is not None else val for cal, val in zip(self.calibration, xyz_new_values)]
             
         # Compare if values have changed, save the difference and update last state
         xyz_diff_values = [new - last for new, last in zip(xyz_new_values, self.xyz_last_values)]
@@ -66,10 +167,12 @@ class Accelerometer(Base):
 
         # Print values and set return value
         if get_val == 'new':
-            self.pprint(f'xyz_new_values: {self._format_output(xyz_new_values)}')
+            if self.debug_print: # Do not build the message when it is not printed
+                self.log.debug('xyz_new_values: {}', self._format_output(xyz_new_values))
             ret_val_lst = xyz_new_values
         elif get_val == 'diff':
-            self.pprint(f'xyz_diff_values: {self._format_output(xyz_diff_values)}')
+            if self.debug_print:
+                self.log.debug('xyz_diff_values: {}', self._format_output(xyz_diff_values))
             ret_val_lst = xyz_diff_values
         else:
             raise ValueError(f'Invalid value for get_val: {get_val}')
@@ -85,6 +188,39 @@ class Accelerometer(Base):
             raise TypeError(f'Invalid return type: {ret_type}')
     
 
+    def set_calibration(self, calibration):
+        """Sets calibration of every axis; `update` returns calibrated integers (e.g. milli-g)
+
+        Parameters:
+        - `calibration` (list[Calibration | None] | None): Calibration of x, y and z; `None` returns raw values again"""
+        if calibration is not None and len(calibration) != len(self._xyz_pins):
+            self.praise(ValueError, f'Calibration needed for {len(self._xyz_pins)} axes')
+        self.calibration = calibration
+
+
     def _read_pin_raw(self, pin):
         """Reads raw value from pin"""
-        return pin.read_u16() if pin is not None else 0
\ No newline at end of file
+        return pin.read_u16() if pin is not None else 0
+
+
+    def read_into(self, buf, offset:int=0) -> int:
+        """Writes raw `read_u16` values of x, y and z (`0` if pin is not given) to `buf[offset:offset + 3]`.
+        Does not allocate memory.
+
+        Parameters:
+        - `buf` (array | list): Buffer owned by the caller
+        - `offset` (int): Index of the x value. Default: `0`
+
+        Returns:
+        - `int`: Number of values written (`3`)"""
+        pins = self._xyz_pins
+        for i in range(len(pins)):
+            pin = pins[i]
+            buf[offset + i] = pin.read_u16() if pin is not None else 0
+        return len(pins)
+
+
+    def channel_count(self) -> int:
+        """Returns number of values written by `read_into`"""
+        return len(self._xyz_pins)
+
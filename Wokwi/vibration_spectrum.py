@@ -0,0 +1,294 @@
+# Author: Rasmus Ohert
+
+import micropython # type:ignore
+from array  import array
+from base import Base
+from math   import cos, sin, pi, sqrt
+from utime  import ticks_us, ticks_diff # type:ignore
+
+
+class VibrationSpectrum(Base):
+    """Frequency band energies of accelerometer axes with a fixed-point radix-2 FFT.
+
+    Samples (taken at a fixed rate, e.g. by `ADCSampler`) are collected into windows of `size` samples.
+    A full window is processed in small steps by `step()` (load, one FFT stage or band sums of one axis
+    per unit), so the transform can be spread over loop ticks; samples of the next window are collected
+    meanwhile. When every axis is done, `latest()` returns the RMS of every frequency band.
+    Band RMS values are in `read_u16` units; the squares of all bands sum to the variance of the axis.
+
+    All buffers are preallocated `array`s. The FFT uses Q15 twiddle factors and a Hann window;
+    the input is scaled up to 13 bits and every stage is halved, so the integers
+    never grow over the MicroPython small integer limit (2^30) and no memory is allocated."""
+    _INPUT_BITS = 13 # Max magnitude of FFT input; (2^13 * 2^15) * 2 < 2^30
+
+    def __init__(self, axes:list, size:int=256, rate_hz:int=100, bands:list=((2, 5), (5, 10), (10, 20), (20, 35), (35, 50)), shift:int=4, name:str='Vibration spectrum', debug_print:bool=False):
+        """Initializes VibrationSpectrum
+
+        Parameters:
+        - `axes` (list[tuple[str, int]]): List of `(name, index)` tuples; `index` is the position of the axis in rows given to `add`
+        - `size` (int): FFT length, power of two (e.g. `256` or `512`). Default: `256`
+        - `rate_hz` (int): Sample rate (in Hz). Default: `100`
+        - `bands` (list[tuple[float, float]]): Frequency bands `(low, high)` (in Hz). Default: `((2, 5), (5, 10), (10, 20), (20, 35), (35, 50))`
+        - `shift` (int): Bits to drop from `read_u16` values (`4` -> 12 bit). Default: `4`
+        - `name` (str): Name of class instance. Default: 'Vibration spectrum'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        if size < 4 or size & (size - 1):
+            self.praise(ValueError, f'FFT size must be a power of two: {size}')
+
+        self._axes = list(axes)
+        self._size = size
+        self._rate_hz = rate_hz
+        self._bands = list(bands)
+        self._shift = shift
+
+        # Band limits as FFT bins [low, high); bin 0 (DC) and bin size/2 (Nyquist) are not used
+        self._band_bins = []
+        for low, high in self._bands:
+            k_low = max(1, -int(-low * size // rate_hz))
+            k_high = min(size // 2, -int(-high * size // rate_hz))
+            if k_high <= k_low:
+                self.praise(ValueError, f'Band {low}-{high} Hz has no FFT bins (size {size}, {rate_hz} Hz)')
+            self._band_bins.append((k_low, k_high))
+
+        # Tables
+        self._cos = array('h', [int(32767 * cos(2 * pi * i / size)) for i in range(size // 2)])
+        self._sin = array('h', [int(32767 * sin(2 * pi * i / size)) for i in range(size // 2)])
+        self._window = array('h', [int(32767 * 0.5 * (1 - cos(2 * pi * i / size))) for i in range(size)])
+        self._window_power = sum((w / 32767) ** 2 for w in self._window) / size # Mean of window^2
+
+        self._bitrev = array('H', bytes(2 * size))
+        for i in range(size):
+            j = 0
+            bit = 1
+            while bit < size:
+                j <<= 1
+                if i & bit:
+                    j |= 1
+                bit <<= 1
+            self._bitrev[i] = j
+
+        # Buffers; two sets of input buffers, one is filled while the other one is processed
+        self._inputs = [[array('h', bytes(2 * size)) for _ in self._axes] for _ in range(2)]
+        self._fill = 0 # Index of the input buffers being filled
+        self._re = array('i', bytes(4 * size))
+        self._im = array('i', bytes(4 * size))
+        self._n = 0
+
+        self._result = [0] * (len(self._axes) * len(self._bands)) # Reused for every window
+        self._next_result = [0] * len(self._result) # Result of the window being processed
+
+        # Processing state (see `step`)
+        self._stages = 0 # Number of FFT stages
+        while (1 << self._stages) < size:
+            self._stages += 1
+        self._busy = False # A full window is waiting or being processed
+        self._axis = 0
+        self._unit = 0 # 0: load, 1...stages: FFT stage, stages + 1: band sums
+        self._half = 1 # Butterfly span / 2 of the next FFT stage
+        self._tw_step = size >> 1 # Twiddle table step of the next FFT stage
+        self._exp = 0 # Block exponent of the axis
+        self._work_us = 0
+
+        self.compute_ms = 0 # Processing time of the last window, all steps together
+        self.late_windows = 0 # Windows that were not processed before the next one was full
+
+
+    def get_channels(self) -> list:
+        """Returns names and types (`struct` letters) of the result columns
+
+        Returns:
+        - `list[tuple[str, str]]`: `(name, type)` for every column; matches lists returned by `add` and `latest`"""
+        return [(f'{ax_name} {low}-{high} Hz', 'H') for ax_name, _ in self._axes for low, high in self._bands]
+
+
+    def add(self, values:list) -> bool:
+        """Adds one sample. A full window is queued for `step()`; if the previous window is still
+        being processed, it is finished first (counted in `late_windows`).
+
+        Parameters:
+        - `values` (list[int]): Row of raw `read_u16` values; axes are picked by their index
+
+        Returns:
+        - `bool`: `True` if a window was completed and queued"""
+        n = self._n
+        inputs = self._inputs[self._fill]
+        for a in range(len(self._axes)):
+            inputs[a][n] = values[self._axes[a][1]] >> self._shift
+        n += 1
+
+        if n < self._size:
+            self._n = n
+            return False
+
+        self._n = 0
+        if self._busy:
+            self.late_windows += 1
+            self.process()
+
+        self._fill ^= 1
+        self._busy = True
+        self._axis = 0
+        self._unit = 0
+        self._work_us = 0
+        return True
+
+
+    def step(self, budget_us:int) -> bool:
+        """Processes the queued window for about `budget_us`; at least one unit is run.
+        A unit takes about 1/10 of the time of one axis (`compute_ms` / axes / 10 with `size` 256).
+
+        Parameters:
+        - `budget_us` (int): Time to use (in microseconds)
+
+        Returns:
+        - `bool`: `True` if the window was finished (`latest()` was updated)"""
+        if not self._busy:
+            return False
+
+        start = ticks_us()
+        while True:
+            self._run_unit()
+            used = ticks_diff(ticks_us(), start)
+            if not self._busy or used >= budget_us:
+                break
+
+        self._work_us += used
+        if self._busy:
+            return False
+
+        self.compute_ms = self._work_us // 1000
+        self.log.debug('Window done in {} ms', self.compute_ms)
+        return True
+
+
+    def process(self) -> bool:
+        """Processes the queued window completely
+
+        Returns:
+        - `bool`: `True` if there was a window to process"""
+        if not self._busy:
+            return False
+        while not self.step(100000):
+            pass
+        return True
+
+
+    def is_busy(self) -> bool:
+        """Returns `True` if a full window is waiting or being processed"""
+        return self._busy
+
+
+    def latest(self) -> list:
+        """Returns band RMS values of the last completed window (zeros before the first one)"""
+        return self._result
+
+
+    def _run_unit(self):
+        """Runs the next unit of the queued window: load of an axis, one FFT stage or band sums"""
+        unit = self._unit
+        if unit == 0:
+            self._exp = self._load(self._inputs[self._fill ^ 1][self._axis])
+            self._half = 1
+            self._tw_step = self._size >> 1
+        elif unit <= self._stages:
+            self._fft_stage(self._half, self._tw_step)
+            self._half <<= 1
+            self._tw_step >>= 1
+        else:
+            self._band_rms(self._axis)
+            self._axis += 1
+            self._unit = 0
+            if self._axis == len(self._axes): # Window done
+                for i in range(len(self._result)):
+                    self._result[i] = self._next_result[i]
+                self._busy = False
+            return
+        self._unit = unit + 1
+
+
+    def _band_rms(self, axis:int):
+        """Writes band RMS values of a transformed axis to the next result"""
+        re = self._re
+        im = self._im
+        n_bands = len(self._bands)
+
+        # One-sided spectrum: power of positive and negative frequencies, window power corrected
+        scale = sqrt(2 / self._window_power) * (1 << self._shift) / (1 << self._exp)
+        for b in range(n_bands):
+            k_low, k_high = self._band_bins[b]
+            power = 0
+            for k in range(k_low, k_high):
+                power += re[k] * re[k] + im[k] * im[k]
+            self._next_result[axis * n_bands + b] = min(int(sqrt(power) * scale), 65535)
+
+
+    def _load(self, samples) -> int:
+        """Removes the mean, applies the window and scales the samples up to `_INPUT_BITS`.
+        Writes the result to the FFT buffers in bit reversed order.
+
+        Returns:
+        - `int`: Number of bits the samples were shifted up"""
+        size = self._size
+        re = self._re
+        im = self._im
+        window = self._window
+        bitrev = self._bitrev
+
+        total = 0
+        for i in range(size):
+            total += samples[i]
+        mean = total // size
+
+        peak = 0
+        for i in range(size):
+            val = ((samples[i] - mean) * window[i]) >> 15
+            re[bitrev[i]] = val
+            im[i] = 0
+            if val < 0:
+                val = -val
+            if val > peak:
+                peak = val
+
+        # Block exponent; use all available bits for small vibrations
+        exp = 0
+        while peak and (peak << 1) < (1 << self._INPUT_BITS):
+            peak <<= 1
+            exp += 1
+        if exp:
+            for i in range(size):
+                re[i] <<= exp
+        return exp
+
+
+    @micropython.native
+    def _fft_stage(self, half:int, step:int):
+        """One stage of the in-place radix-2 decimation-in-time FFT of the buffers (input in bit reversed order).
+        Every stage is divided by two, so after all stages the result is the DFT divided by `size`.
+
+        Parameters:
+        - `half` (int): Half of the butterfly span (`1`, `2`, `4`, ... `size / 2`)
+        - `step` (int): Twiddle table step (`size / 2 / half`)"""
+        re = self._re
+        im = self._im
+        cos_t = self._cos
+        sin_t = self._sin
+        size = self._size
+
+        span = half << 1
+        for j in range(half):
+            wr = cos_t[j * step]
+            wi = sin_t[j * step]
+            for i in range(j, size, span):
+                k = i + half
+                rk = re[k]
+                ik = im[k]
+                tr = (wr * rk + wi * ik) >> 15 # (rk + i*ik) * (wr - i*wi)
+                ti = (wr * ik - wi * rk) >> 15
+                ri = re[i]
+                ii = im[i]
+                re[k] = (ri - tr) >> 1
+                im[k] = (ii - ti) >> 1
+                re[i] = (ri + tr) >> 1
+                im[i] = (ii + ti) >> 1
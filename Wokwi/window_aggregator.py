@@ -0,0 +1,138 @@
+# Author: Rasmus Ohert
+
+from base import Base
+from three_axis_accelerometer   import VibrationFeatures
+from utime  import ticks_ms, ticks_diff # type:ignore
+
+
+class WindowAggregator(Base):
+    """Collects sensor values over a time window and returns one summary row per window.
+
+    Every sample is used, so nothing is lost between log writes:
+    - Digital channels (IR sensors): last state and number of state changes in the window
+    - Analog channels: min, max and mean of the window
+    - Vibration channels (accelerometer axes): RMS, peak-to-peak, crest factor * 100 and mean (see `VibrationFeatures`)
+
+    Statistics are updated in place; no memory is allocated for each sample."""
+    def __init__(self, channels:list, window_ms:int=1000, name:str='Window aggregator', debug_print:bool=False):
+        """Initializes WindowAggregator
+
+        Parameters:
+        - `channels` (list[tuple[str, str]]): List of `(name, kind)` tuples. Kind is `'digital'`, `'analog'` or `'vibration'`; vibration channels must be next to each other
+        - `window_ms` (int): Length of one window (in milliseconds). Default: `1000`
+        - `name` (str): Name of class instance. Default: 'Window aggregator'
+        - `debug_print` (bool): Print debug info. Default: `False`"""
+        super().__init__(name, debug_print)
+
+        for ch_name, kind in channels:
+            if kind not in ('digital', 'analog', 'vibration'):
+                self.praise(ValueError, f'Invalid channel kind for {ch_name}: {kind}')
+
+        self._channels = list(channels)
+        self._digital = [kind == 'digital' for _, kind in channels]
+        self._vibration = [kind == 'vibration' for _, kind in channels]
+
+        # Vibration channels are handled together
+        _vib_idxs = [i for i in range(len(channels)) if self._vibration[i]]
+        if _vib_idxs and _vib_idxs[-1] - _vib_idxs[0] + 1 != len(_vib_idxs):
+            self.praise(ValueError, 'Vibration channels must be next to each other')
+        self._vib_offset = _vib_idxs[0] if _vib_idxs else 0
+        self._vib_features = VibrationFeatures(len(_vib_idxs)) if _vib_idxs else None
+        self._window_ms = window_ms
+
+        n = len(channels)
+        self._min = [0] * n
+        self._max = [0] * n
+        self._sum = [0] * n
+        self._last = [0] * n
+        self._changes = [0] * n
+        self._count = 0
+        self._has_last = False # Last digital states are kept between windows
+        self._window_start = ticks_ms()
+
+
+    def get_channels(self) -> list:
+        """Returns names and types (`struct` letters) of the summary row columns
+
+        Returns:
+        - `list[tuple[str, str]]`: `(name, type)` for every column; matches rows returned by `add` and `pop_row`"""
+        out = []
+        for (ch_name, kind) in self._channels:
+            if kind == 'digital':
+                out += [(ch_name, 'B'), (f'{ch_name} changes', 'H')]
+            elif kind == 'vibration':
+                out += [(f'{ch_name} rms', 'H'), (f'{ch_name} p2p', 'H'), (f'{ch_name} crest x100', 'H'), (f'{ch_name} mean', 'H')]
+            else:
+                out += [(f'{ch_name} min', 'H'), (f'{ch_name} max', 'H'), (f'{ch_name} mean', 'H')]
+        out.append(('Samples', 'H'))
+        return out
+
+
+    def add(self, values:list) -> list | None:
+        """Adds one sample to the current window
+
+        Parameters:
+        - `values` (list[int]): Value of every channel
+
+        Returns:
+        - `list[int]`: Summary row if the window is complete, else `None`"""
+        first = self._count == 0
+
+        for i in range(len(values)):
+            val = values[i]
+            if self._digital[i]:
+                if self._has_last and val != self._last[i]:
+                    self._changes[i] += 1
+                self._last[i] = val
+            elif self._vibration[i]:
+                continue
+            elif first:
+                self._min[i] = val
+                self._max[i] = val
+                self._sum[i] = val
+            else:
+                if val < self._min[i]:
+                    self._min[i] = val
+                elif val > self._max[i]:
+                    self._max[i] = val
+                self._sum[i] += val
+
+        if self._vib_features is not None:
+            self._vib_features.add(values, self._vib_offset)
+
+        self._has_last = True
+        self._count += 1
+
+        if ticks_diff(ticks_ms(), self._window_start) < self._window_ms:
+            return None
+
+        return self.pop_row()
+
+
+    def pop_row(self) -> list | None:
+        """Returns summary row of the current window and starts a new window.
+        Can be called before the window is complete (e.g. when stopping).
+
+        Returns:
+        - `list[int]`: Summary row; `None` if there are no samples in the window"""
+        self._window_start = ticks_ms()
+        if not self._count:
+            return None
+
+        vib = self._vib_features.result() if self._vib_features is not None else None
+
+        row = []
+        for i in range(len(self._channels)):
+            if self._digital[i]:
+                row += [self._last[i], self._changes[i]]
+                self._changes[i] = 0
+            elif self._vibration[i]:
+                j = (i - self._vib_offset) * 4
+                row += vib[j:j + 4]
+            else:
+                row += [self._min[i], self._max[i], self._sum[i] // self._count]
+        row.append(self._count)
+
+        self.log.debug('Window done: {} samples', self._count)
+        self._count = 0
+        return row
@@ -0,0 +1,101 @@
+# Author: Rasmus Ohert
+
+# Host (CPython) tests of the Pico code in `Wokwi/` and the tools in `Tools/`.
+# MicroPython modules that CPython does not have (`utime`, `uos`, `machine`) are replaced with small
+# stand-ins; `machine` only has what the tested modules import (tests call the callbacks themselves). `utime` follows the real clock, unless a test stops it with the `clock` fixture.
+
+import os
+import sys
+import time
+import types
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'Wokwi'), os.path.join(ROOT, 'Tools')]
+
+
+class Clock:
+    """Clock of the `utime` stand-in"""
+    def __init__(self):
+        self._t0 = time.monotonic()
+        self._frozen_us = None
+
+
+    def us(self) -> int:
+        """Returns time (in microseconds)"""
+        if self._frozen_us is not None:
+            return self._frozen_us
+        return int((time.monotonic() - self._t0) * 1000000)
+
+
+    def set_ms(self, ms:int):
+        """Stops the clock at the given time (in milliseconds)"""
+        self._frozen_us = ms * 1000
+
+
+    def release(self):
+        """Lets the clock run again"""
+        self._frozen_us = None
+
+
+CLOCK = Clock()
+
+
+class Timer:
+    """`machine.Timer` stand-in; never calls the callback"""
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, timer_id:int=-1):
+        self.callback = None
+
+
+    def init(self, freq:int=None, period:int=None, mode:int=PERIODIC, callback=None):
+        self.callback = callback
+
+
+    def deinit(self):
+        self.callback = None
+
+
+def _install_stand_ins():
+    """Adds `utime`, `uos` and `machine` stand-ins, if the modules are not available"""
+    try:
+        import utime # noqa: F401
+    except ImportError:
+        utime = types.ModuleType('utime')
+        utime.ticks_ms = lambda: CLOCK.us() // 1000
+        utime.ticks_us = CLOCK.us
+        utime.ticks_add = lambda ticks, delta: ticks + delta
+        utime.ticks_diff = lambda a, b: a - b
+        utime.sleep = time.sleep
+        utime.sleep_ms = lambda ms: time.sleep(ms / 1000)
+        utime.sleep_us = lambda us: time.sleep(us / 1000000)
+        sys.modules['utime'] = utime
+
+    try:
+        import uos # noqa: F401
+    except ImportError:
+        uos = types.ModuleType('uos')
+        uos.listdir = os.listdir
+        uos.sync = lambda: None
+        sys.modules['uos'] = uos
+
+    try:
+        import machine # noqa: F401
+    except ImportError:
+        machine = types.ModuleType('machine')
+        machine.Timer = Timer
+        sys.modules['machine'] = machine
+
+
+_install_stand_ins()
+
+
+@pytest.fixture
+def clock():
+    """Clock of `utime`; stop it with `clock.set_ms(ms)`. Runs again after the test."""
+    yield CLOCK
+    CLOCK.release()
@@ -0,0 +1,86 @@
+# Author: Rasmus Ohert
+
+# Ring buffer of `Wokwi/adc_sampler.py`; the timer callback `_sample` is called by the tests,
+# also in the middle of `drain` like a soft timer callback would be
+
+from adc_sampler    import ADCSampler
+
+
+class CountingADC:
+    """ADC that returns 1, 2, 3, ... (plus an offset)"""
+    def __init__(self, offset:int=0):
+        self.value = offset
+
+
+    def read_u16(self) -> int:
+        self.value += 1
+        return self.value
+
+
+def _sampler(capacity:int=8) -> ADCSampler:
+    return ADCSampler([CountingADC(), CountingADC(1000), None], capacity=capacity)
+
+
+def test_drain_returns_samples_in_order():
+    sampler = _sampler()
+    for _ in range(5):
+        sampler._sample(None)
+    assert sampler.pending() == 5
+
+    rows = []
+    assert sampler.drain(lambda row: rows.append(list(row))) == 5
+    assert rows == [[i, 1000 + i, 0] for i in range(1, 6)]
+    assert sampler.pending() == 0
+    assert sampler.latest(0) == 5
+
+
+def test_samples_taken_during_drain_are_not_lost():
+    sampler = _sampler(capacity=8)
+    calls = 0
+    for _ in range(6):
+        sampler._sample(None)
+        calls += 1
+
+    rows = []
+    def func(row):
+        nonlocal calls
+        rows.append(row[0])
+        for _ in range(2): # Timer fires between drain steps
+            sampler._sample(None)
+            calls += 1
+
+    drained = sampler.drain(func)
+    while sampler.pending():
+        drained += sampler.drain(lambda row: rows.append(row[0]))
+
+    assert sampler.overflows > 0
+    assert drained + sampler.overflows == calls # Every sample is drained or counted
+    assert rows == list(range(1, drained + 1)) # In order, none overwritten
+
+
+def test_full_buffer_counts_overflows_and_keeps_waiting_samples():
+    sampler = _sampler(capacity=4) # 3 samples can wait
+    for _ in range(5):
+        sampler._sample(None)
+    assert sampler.pending() == 3
+    assert sampler.overflows == 2
+
+    rows = []
+    sampler.drain(lambda row: rows.append(row[0]))
+    assert rows == [1, 2, 3] # Waiting samples were not overwritten
+
+
+def test_overflow_only_when_next_slot_is_not_drained():
+    sampler = _sampler(capacity=4)
+    for _ in range(3):
+        sampler._sample(None)
+
+    rows = []
+    def func(row):
+        rows.append(row[0])
+        sampler._sample(None) # The slot just read is free again
+
+    sampler.drain(func)
+    assert sampler.overflows == 0
+    assert rows == [1, 2, 3]
+    assert sampler.pending() == 3
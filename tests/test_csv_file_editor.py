@@ -0,0 +1,129 @@
+# Author: Rasmus Ohert
+
+# RAM buffer and flush policies of `Wokwi/csv_file_editor.py`: policy flushes write only whole
+# 512 byte blocks, `flush()`/`close()` write everything
+
+import os
+
+import pytest
+
+from csv_file_editor    import CSVFileEditor
+
+
+BLOCK = 512
+HEADER = 'sep=;\nValue'
+
+
+class RecordingFile:
+    """Wraps the open file and records the size of every write"""
+    def __init__(self, f):
+        self._f = f
+        self.writes = []
+
+
+    def write(self, data) -> int:
+        self.writes.append(len(data))
+        return self._f.write(data)
+
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def _editor(path, **kwargs) -> CSVFileEditor:
+    kwargs.setdefault('buffer_size', 1024)
+    csv = CSVFileEditor(str(path), ['Value'], write_wait_time_s=0, add_timer=False, max_age_ms=0, **kwargs)
+    csv._file = RecordingFile(csv._file)
+    return csv
+
+
+def _row(i:int, width:int=40) -> str:
+    return str(i).rjust(width, 'x')
+
+
+def _expected(rows:list) -> bytes:
+    return (HEADER + ''.join('\n' + row for row in rows)).encode()
+
+
+def _file_bytes(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_rows_policy_writes_only_whole_blocks(tmp_path):
+    path = tmp_path / 'log.csv'
+    csv = _editor(path, flush_policy='rows', flush_rows=20)
+    rows = [_row(i) for i in range(20)] # 820 bytes, more than one block
+    for row in rows:
+        csv.append_data([row])
+
+    data = _file_bytes(path)
+    total = len(_expected(rows))
+    assert len(data) == total // BLOCK * BLOCK # Whole blocks of the file
+    assert _expected(rows).startswith(data)
+    assert csv._buffer_len == total - len(data) # Rest stays in RAM
+    assert (len(HEADER) + sum(csv._file.writes)) % BLOCK == 0
+
+
+def test_time_policy_writes_only_whole_blocks(tmp_path, clock):
+    clock.set_ms(0)
+    path = tmp_path / 'log.csv'
+    csv = _editor(path, flush_policy='time', flush_interval_ms=100)
+    rows = [_row(i) for i in range(15)]
+    for row in rows:
+        csv.append_data([row])
+
+    csv.service() # Interval not passed yet
+    assert _file_bytes(path) == HEADER.encode()
+
+    clock.set_ms(150)
+    csv.service()
+    assert os.path.getsize(path) == len(_expected(rows)) // BLOCK * BLOCK
+
+
+def test_max_age_flushes_everything(tmp_path, clock):
+    clock.set_ms(0)
+    path = tmp_path / 'log.csv'
+    csv = CSVFileEditor(str(path), ['Value'], write_wait_time_s=0, add_timer=False, flush_policy='manual', max_age_ms=1000, buffer_size=1024)
+    csv.append_data(['1'])
+    clock.set_ms(999)
+    csv.service()
+    assert _file_bytes(path) == HEADER.encode()
+
+    clock.set_ms(1000)
+    csv.service() # No new rows needed
+    assert _file_bytes(path) == _expected(['1'])
+
+
+@pytest.mark.parametrize('finish', ['flush', 'close'])
+def test_flush_and_close_write_everything(tmp_path, finish):
+    path = tmp_path / 'log.csv'
+    csv = _editor(path, flush_policy='manual')
+    rows = [_row(i) for i in range(30)]
+    for row in rows:
+        csv.append_data([row])
+
+    getattr(csv, finish)()
+    assert _file_bytes(path) == _expected(rows)
+    assert csv._buffer_len == 0
+
+    csv.append_data(['more']) # Reopened after close
+    csv.close()
+    assert _file_bytes(path) == _expected(rows + ['more'])
+
+
+def test_row_larger_than_buffer_is_written_straight(tmp_path):
+    path = tmp_path / 'log.csv'
+    csv = _editor(path, flush_policy='manual', buffer_size=512)
+    csv.append_data(['a' * 10])
+    big = 'b' * 2000
+    csv.append_data([big])
+
+    writes = csv._file.writes # Header is written before the file is wrapped
+    assert writes[0] + len(HEADER) == BLOCK # Buffer filled up to the block boundary
+    assert writes[1] % BLOCK == 0 and writes[1] == 2 * BLOCK # Whole blocks straight from the row
+    assert (len(HEADER) + sum(writes)) % BLOCK == 0
+    assert csv._buffer_len < BLOCK
+
+    csv.close()
+    assert _file_bytes(path) == _expected(['a' * 10, big])
@@ -0,0 +1,90 @@
+# Author: Rasmus Ohert
+
+# Queue and worker of `Wokwi/dual_core.py`; on the host the worker runs as a normal thread
+
+import time
+
+import pytest
+
+from dual_core  import CoreQueue, CoreWorker
+
+
+def _wait_until(cond, timeout_s:float=2.0) -> bool:
+    """Waits until `cond()` is true"""
+    end = time.monotonic() + timeout_s
+    while not cond():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def test_queue_is_fifo_and_drops_when_full():
+    queue = CoreQueue(3)
+    assert queue.get() is None
+    assert all(queue.put(i) for i in range(3))
+    assert not queue.put(3)
+    assert queue.dropped == 1
+    assert len(queue) == 3
+
+    assert queue.get() == 0
+    assert queue.put(4)
+    assert [queue.get() for _ in range(4)] == [1, 2, 4, None]
+    assert len(queue) == 0
+
+
+def test_worker_steps_and_handles_items_in_order():
+    handled = []
+    steps = []
+    worker = CoreWorker(lambda: steps.append(1), 1000, handle=handled.append)
+    worker.start()
+    try:
+        assert worker.is_running()
+        for i in range(5):
+            assert worker.post(i)
+        assert _wait_until(lambda: len(handled) == 5 and len(steps) >= 3)
+    finally:
+        assert worker.stop()
+
+    assert handled == list(range(5))
+    assert not worker.is_running()
+    assert worker.steps == len(steps)
+
+
+def test_worker_handles_remaining_items_on_stop():
+    handled = []
+    worker = CoreWorker(lambda: None, 200000, handle=handled.append) # Long period; items wait in the queue
+    worker.start()
+    assert _wait_until(lambda: worker.steps >= 1)
+    for i in range(3):
+        worker.post(i)
+    assert worker.stop()
+    assert handled == [0, 1, 2]
+
+
+def test_worker_error_is_raised_by_check():
+    def step():
+        raise ValueError('step failed')
+
+    worker = CoreWorker(step, 1000)
+    worker.start()
+    assert _wait_until(lambda: not worker.is_running())
+
+    with pytest.raises(ValueError, match='step failed'):
+        worker.check()
+    worker.check() # Raised only once
+
+    worker.start() # Can be restarted after an error
+    assert _wait_until(lambda: not worker.is_running())
+    with pytest.raises(ValueError):
+        worker.check()
+
+
+def test_start_twice_raises():
+    worker = CoreWorker(lambda: None, 1000)
+    worker.start()
+    try:
+        with pytest.raises(RuntimeError):
+            worker.start()
+    finally:
+        assert worker.stop()
@@ -0,0 +1,61 @@
+# Author: Rasmus Ohert
+
+# Time index (`index_every_n_rows`) of `Wokwi/csv_file_editor.py` and its host reader `Tools/log_index.py`
+
+import struct
+
+import pytest
+
+import log_index
+from csv_file_editor    import CSVFileEditor
+
+
+# `ticks_ms` of the rows; Time column (0 decimals) is 1, 1, 1, 2, 2, 2, 2, 3, 3
+SAME_TIMES_MS = [1000, 1100, 1200, 2000, 2100, 2200, 2300, 3000, 3100]
+ROUNDED_TIMES_MS = [600, 1000, 1400, 1600, 2000, 2400, 2450, 2600, 3000] # Rounded to the same Time column
+
+RANGES = [ # (t_start, t_end, expected row numbers)
+    (1, 1, [0, 1, 2]),
+    (2, 2, [3, 4, 5, 6]),
+    (3, 3, [7, 8]),
+    (1, 3, list(range(9))),
+    (2, 3, list(range(3, 9))),
+    (4, 5, []),
+]
+
+
+def _write_log(path, clock, times_ms:list, index_every:int) -> CSVFileEditor:
+    """Writes one row (row number) at every time"""
+    csv = CSVFileEditor(str(path), ['Row'], write_wait_time_s=0, timer_decimals=0, index_every_n_rows=index_every, buffer_size=512)
+    for i, t_ms in enumerate(times_ms):
+        clock.set_ms(t_ms)
+        csv.append_data([i])
+    return csv
+
+
+@pytest.mark.parametrize('times_ms', [SAME_TIMES_MS, ROUNDED_TIMES_MS])
+@pytest.mark.parametrize('index_every', [1, 2, 3])
+@pytest.mark.parametrize('t_start, t_end, expected', RANGES)
+def test_read_range_repeated_times(tmp_path, clock, times_ms, index_every, t_start, t_end, expected):
+    csv = _write_log(tmp_path / 'log.csv', clock, times_ms, index_every)
+    assert [int(row[1]) for row in csv.read_range(t_start, t_end)] == expected
+    csv.close()
+
+    assert [int(row[1]) for row in log_index.read_range(str(tmp_path / 'log.csv'), t_start, t_end)] == expected
+
+
+def test_index_stores_ticks_ms(tmp_path, clock):
+    _write_log(tmp_path / 'log.csv', clock, ROUNDED_TIMES_MS, 1).close()
+    data = (tmp_path / 'log.idx').read_bytes()
+    assert [t for t, _ in log_index.INDEX_ENTRY.iter_unpack(data)] == ROUNDED_TIMES_MS
+
+
+def test_find_offset_skips_entries_with_same_time(tmp_path):
+    path = tmp_path / 'log.idx'
+    path.write_bytes(b''.join(struct.pack('<II', t, offset) for t, offset in [(1000, 10), (1000, 20), (2000, 30), (2000, 40), (3000, 50)]))
+
+    assert log_index.find_offset(str(path), 1000) == 0
+    assert log_index.find_offset(str(path), 2000) == 20
+    assert log_index.find_offset(str(path), 2001) == 40
+    assert log_index.find_offset(str(path), 9999) == 50
+    assert log_index.find_offset(str(tmp_path / 'missing.idx'), 2000) == 0
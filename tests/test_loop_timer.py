@@ -0,0 +1,77 @@
+# Author: Rasmus Ohert
+
+# Deadline schedule and statistics of `Wokwi/loop_timer.py`; the clock is stopped, so `wait`
+# only sleeps (real time) when the iteration ends before its deadline
+
+from loop_timer import LoopTimer
+
+
+BINS_US = (1000, 5000, 20000)
+
+
+def _iteration(timer:LoopTimer, clock, begin_ms:int, end_ms:int):
+    clock.set_ms(begin_ms)
+    timer.begin()
+    clock.set_ms(end_ms)
+    timer.wait()
+
+
+def test_on_time_iterations(clock):
+    clock.set_ms(0)
+    timer = LoopTimer(10, bins_us=BINS_US)
+    _iteration(timer, clock, 0, 2)
+    _iteration(timer, clock, 10, 13) # Woken at the deadline
+
+    stats = timer.get_stats()
+    assert stats['iterations'] == 2
+    assert stats['overruns'] == 0
+    assert stats['skipped'] == 0
+    assert stats['max_work_us'] == 3000
+    assert stats['work_hist'] == [0, 2, 0, 0]
+    assert stats['jitter_hist'] == [2, 0, 0, 0]
+
+
+def test_overrun_skips_missed_deadlines(clock):
+    clock.set_ms(0)
+    timer = LoopTimer(10, bins_us=BINS_US)
+    _iteration(timer, clock, 0, 35) # Deadline 10 missed by 25 ms: deadlines 20 and 30 are skipped
+    assert timer.overruns == 1
+    assert timer.skipped == 2
+    assert timer.work_hist[3] == 1 # > 20000 us
+
+    _iteration(timer, clock, 35, 36) # Schedule restarts from the late end: next deadline 45
+    assert timer.overruns == 1
+    assert timer.max_jitter_us == 0
+
+    _iteration(timer, clock, 47, 56) # Woken 2 ms late; ends 1 ms after the deadline 55: overrun, nothing skipped
+    assert timer.overruns == 2
+    assert timer.skipped == 2
+    assert timer.max_jitter_us == 2000
+    assert list(timer.jitter_hist) == [2, 1, 0, 0]
+
+
+def test_small_overrun_keeps_the_schedule(clock):
+    clock.set_ms(0)
+    timer = LoopTimer(10, bins_us=BINS_US)
+    _iteration(timer, clock, 0, 15) # Late by less than a period: next deadline stays at 20
+    assert timer.overruns == 1
+    assert timer.skipped == 0
+
+    _iteration(timer, clock, 15, 16) # Begins 5 ms after deadline 10, ends before deadline 20
+    assert timer.overruns == 1
+    assert timer.max_jitter_us == 5000
+
+    _iteration(timer, clock, 20, 21) # Back on schedule
+    assert timer.overruns == 1
+    assert list(timer.jitter_hist) == [2, 1, 0, 0]
+
+
+def test_reset_clears_statistics(clock):
+    clock.set_ms(0)
+    timer = LoopTimer(10, bins_us=BINS_US)
+    _iteration(timer, clock, 0, 35)
+    timer.reset()
+    stats = timer.get_stats()
+    assert (stats['iterations'], stats['overruns'], stats['skipped'], stats['max_work_us']) == (0, 0, 0, 0)
+    assert sum(stats['work_hist']) == 0
+    assert timer.get_bin_labels() == ['<=1000 us', '<=5000 us', '<=20000 us', '>20000 us']
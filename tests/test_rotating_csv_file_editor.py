@@ -0,0 +1,131 @@
+# Author: Rasmus Ohert
+
+# Segments of `Wokwi/rotating_csv_file_editor.py` (rotation, `#run` line, summary footer, numbering
+# after a reboot) and their selection by `Tools/segment_summary.py`
+
+import os
+
+import segment_summary
+from rotating_csv_file_editor   import RotatingCSVFileEditor, find_last_segment_num, split_segment_path
+
+
+def _editor(folder, **kwargs) -> RotatingCSVFileEditor:
+    kwargs.setdefault('max_segment_bytes', 0)
+    kwargs.setdefault('max_segment_time_s', 0)
+    return RotatingCSVFileEditor(f'{folder}/log.csv', ['A', 'B'], write_wait_time_s=0, timer_decimals=3, **kwargs)
+
+
+def _segments(folder) -> list:
+    return segment_summary.list_segments(str(folder))
+
+
+def _data_lines(path) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [line for line in f.read().splitlines()[2:] if not line.startswith('#')]
+
+
+def test_split_segment_path():
+    assert split_segment_path('sd/sensor_data.csv') == ('sd/sensor_data_', '.csv')
+    assert split_segment_path('sd.d/log') == ('sd.d/log_', '')
+
+
+def test_segment_rolls_over_at_size_limit(tmp_path, clock):
+    clock.set_ms(0)
+    csv = _editor(tmp_path, max_segment_bytes=150)
+    for i in range(30):
+        csv.append_data([i, 100 + i])
+    csv.close()
+
+    paths = _segments(tmp_path)
+    assert len(paths) > 2
+    rows = []
+    for path in paths:
+        footer = segment_summary.read_footer(path)
+        assert footer is not None # Every segment was closed with a footer
+        lines = _data_lines(path)
+        assert footer['rows'] == len(lines)
+        rows += lines
+    assert [int(line.split(';')[1]) for line in rows] == list(range(30)) # No row lost or repeated
+
+    for path in paths[:-1]: # Rotated when the limit was reached, not before
+        with open(path, 'rb') as f:
+            data = f.read()
+        footer_start = data.rindex(b'\n#run') # Footer starts with the run line
+        assert footer_start >= 150
+        assert footer_start - len(b'\n' + _data_lines(path)[-1].encode()) < 150
+
+
+def test_segment_rolls_over_at_time_limit(tmp_path, clock):
+    clock.set_ms(0)
+    csv = _editor(tmp_path, max_segment_time_s=1)
+    for t_ms in (0, 500, 999):
+        clock.set_ms(t_ms)
+        csv.append_data([t_ms, 0])
+    assert len(_segments(tmp_path)) == 1
+
+    clock.set_ms(1000)
+    csv.append_data([1000, 0]) # Written to the first segment, then rotated
+    clock.set_ms(1500)
+    csv.append_data([1500, 0])
+    csv.close()
+
+    first, second = _segments(tmp_path)
+    assert segment_summary.read_footer(first)['rows'] == 4
+    assert segment_summary.read_footer(second)['rows'] == 1
+
+
+def test_footer_matches_rows(tmp_path, clock):
+    clock.set_ms(0)
+    csv = _editor(tmp_path)
+    for t_ms, a, b in ((1000, 5, -2), (1500, 3, 7), (2250, 9, 0)):
+        clock.set_ms(t_ms)
+        csv.append_data([a, b])
+    csv.append_data(['text', 1]) # Non-numeric values are left out of min/max
+    csv.close()
+
+    path, = _segments(tmp_path)
+    footer = segment_summary.read_footer(path)
+    assert footer == {'run': 1, 'rows': 4, 'first': 1.0, 'last': 2.25, 'min': [1.0, 3.0, -2.0], 'max': [2.25, 9.0, 7.0]}
+    assert segment_summary.read_headers(path) == ['Time', 'A', 'B']
+    assert len(_data_lines(path)) == 4 # Footer is not read as rows
+
+
+def test_new_instance_continues_numbering(tmp_path, clock):
+    clock.set_ms(0)
+    first = _editor(tmp_path)
+    first.append_data([1, 1])
+    first.rotate()
+    first.append_data([2, 2])
+    first.close()
+    assert find_last_segment_num(*split_segment_path(f'{tmp_path}/log.csv')) == 2
+
+    rebooted = _editor(tmp_path) # Run id defaults to the first segment of this boot
+    rebooted.append_data([3, 3])
+    rebooted.close()
+    rebooted.append_data([4, 4]) # Reopened after close: next segment, same run
+    rebooted.close()
+
+    names = [os.path.basename(path) for path in _segments(tmp_path)]
+    assert names == ['log_0001.csv', 'log_0002.csv', 'log_0003.csv', 'log_0004.csv']
+    assert [segment_summary.read_run(path) for path in _segments(tmp_path)] == [1, 1, 3, 3]
+    assert segment_summary.list_runs(str(tmp_path)) == [1, 3]
+
+
+def test_select_segments_by_run_and_time(tmp_path, clock):
+    for run, times in ((5, (0, 1000)), (5, (2000, 3000)), (6, (0, 500))): # Clock starts again in run 6
+        clock.set_ms(times[0])
+        csv = _editor(tmp_path, run_id=run)
+        for t_ms in times:
+            clock.set_ms(t_ms)
+            csv.append_data([t_ms, 0])
+        csv.close()
+    unclosed = _editor(tmp_path, run_id=6)
+    unclosed.append_data([0, 0])
+    unclosed.flush() # No footer (e.g. power lost)
+
+    select = lambda **kwargs: [os.path.basename(path) for path, _ in segment_summary.select_segments(str(tmp_path), **kwargs)]
+    assert select() == ['log_0001.csv', 'log_0002.csv', 'log_0003.csv', 'log_0004.csv']
+    assert select(run=5) == ['log_0001.csv', 'log_0002.csv']
+    assert select(run=5, t_from=1.5) == ['log_0002.csv']
+    assert select(run=6, t_from=1.0) == ['log_0004.csv'] # Without footer, always included
+    assert select(run=5, t_to=0.5) == ['log_0001.csv']
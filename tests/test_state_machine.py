@@ -0,0 +1,106 @@
+# Author: Rasmus Ohert
+
+# Transitions, hooks and timeouts of `Wokwi/state_machine.py`, and sub-state times of
+# `Wokwi/state_profiler.py` fed by its `on_change`
+
+import pytest
+
+from state_machine  import StateMachine
+from state_profiler import StateProfiler
+
+
+def _machine(calls:list, **kwargs) -> StateMachine:
+    """Idle (0) -> run (1) -> wait (11, sub-state of 1, times out) -> idle"""
+    hook = lambda text: (lambda: calls.append(text))
+    sm = StateMachine(0, **kwargs)
+    sm.add(0, 'Idle', enter=hook('enter 0'), exit=hook('exit 0'), step=lambda: 'start' if calls.count('go') else None, next={'start': 1})
+    sm.add(1, 'Run', enter=hook('enter 1'), exit=hook('exit 1'), next=11)
+    sm.add(11, 'Wait', enter=hook('enter 11'), exit=hook('exit 11'), timeout_ms=100, next={'timeout': 0})
+    return sm
+
+
+def test_exit_is_called_before_enter(clock):
+    clock.set_ms(0)
+    calls = []
+    changes = []
+    sm = _machine(calls, on_change=changes.append)
+    sm.start()
+    assert calls == ['enter 0']
+
+    assert sm.step() is None # Step returns no outcome; stays
+    assert sm.state == 0
+
+    calls.append('go')
+    assert sm.step() == 'start'
+    assert calls == ['enter 0', 'go', 'exit 0', 'enter 1']
+    assert sm.state == 1
+    assert sm.get_state_name() == 'Run'
+
+    assert sm.step() == 'done' # No step function and no timeout: done right away
+    assert calls[-2:] == ['exit 1', 'enter 11']
+    assert changes == [0, 1, 11] # `on_change` before `enter`
+
+
+def test_timeout_transition(clock):
+    clock.set_ms(0)
+    calls = ['go']
+    sm = _machine(calls)
+    sm.start()
+    sm.step()
+    sm.step()
+    assert sm.state == 11
+
+    clock.set_ms(99)
+    assert sm.step() is None
+    assert sm.elapsed_ms() == 99
+
+    clock.set_ms(100)
+    assert sm.step() == 'timeout'
+    assert sm.state == 0
+    assert calls[-2:] == ['exit 11', 'enter 0']
+
+
+def test_go_calls_exit_of_current_state(clock):
+    calls = ['go']
+    sm = _machine(calls)
+    sm.start()
+    sm.step()
+    sm.go(0) # E.g. stop pressed
+    assert calls[-2:] == ['exit 1', 'enter 0']
+
+
+def test_invalid_tables_raise():
+    sm = StateMachine(0)
+    sm.add(0, next=5)
+    with pytest.raises(ValueError):
+        sm.start() # Unknown target state
+    with pytest.raises(ValueError):
+        sm.add(0)
+
+    sm = StateMachine(0)
+    sm.add(0, step=lambda: 'other', next=0)
+    sm.start()
+    with pytest.raises(ValueError):
+        sm.step() # No transition for the outcome
+
+
+def test_profiler_counts_sub_states_to_parent(clock):
+    rows = []
+    profiler = StateProfiler([1, 2], cycle_end=2, on_cycle=rows.append)
+    sm = StateMachine(0, on_change=profiler.on_state)
+    sm.add(0, next=1)
+    sm.add(1, timeout_ms=100, next={'timeout': 11})
+    sm.add(11, timeout_ms=50, next={'timeout': 2}) # Sub-state of 1
+    sm.add(2, timeout_ms=30, next={'timeout': 0})
+
+    clock.set_ms(0)
+    sm.start()
+    sm.step()
+    for t_ms in (100, 150, 180):
+        clock.set_ms(t_ms)
+        sm.step()
+
+    assert sm.state == 0
+    assert rows == [[1, 180, 150, 30]] # Cycle, total, state 1 (with 11), state 2
+    stats = {name: count for name, count, *_ in profiler.get_stats()}
+    assert stats == {1: 1, 2: 1, 'cycle': 1}